@@ -0,0 +1,39 @@
+"""
+Renders/second of a 500 item product grid with a ga4_track_event per item,
+as a simple_tag and as the compiled tag.
+"""
+from common import bench, report, setup_django
+
+setup_django()
+
+from django import template  # noqa: E402
+
+from web_utils.templatetags import analytics_tags  # noqa: E402
+
+GRID = (
+    '{% load LIBRARY %}'
+    '{% for product in products %}'
+    '<a href="#" {% TAG "select_item" "item_id" product.sku "item_name" product.name "item_list_name" "grid" %}>'
+    '{{ product.name }}</a>'
+    '{% endfor %}'
+)
+
+
+def main(count=500):
+    library = template.Library()
+    library.simple_tag(analytics_tags.ga4_track_event, name='simple_ga4_track_event')
+    engine = template.Engine(libraries={'analytics_tags': 'web_utils.templatetags.analytics_tags'})
+    engine.template_libraries['simple_analytics_tags'] = library
+
+    products = [{'sku': "SKU-{0}".format(n % 50), 'name': "Product's {0}".format(n % 50)} for n in range(count)]
+    context = template.Context({'products': products})
+    for name, library_name, tag in (
+        ("simple_tag", 'simple_analytics_tags', 'simple_ga4_track_event'),
+        ("compiled tag", 'analytics_tags', 'ga4_track_event'),
+    ):
+        grid = engine.from_string(GRID.replace('LIBRARY', library_name).replace('TAG', tag))
+        report("{0} grid of {1}".format(name, count), bench(lambda: grid.render(context), number=20))
+
+
+if __name__ == '__main__':
+    main()
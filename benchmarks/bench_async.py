@@ -0,0 +1,75 @@
+"""
+Requests/second through the ASGI handler for a view using the web_utils
+mixins and SSLMiddleware, comparing a sync view (which the handler has to
+run in a thread) with the same view written as async.
+"""
+import asyncio
+import time
+
+from common import report, setup_django
+
+setup_django()
+
+from django import http  # noqa: E402
+from django.test import AsyncClient, override_settings  # noqa: E402
+from django.urls import path  # noqa: E402
+from django.views.generic import View  # noqa: E402
+
+from web_utils.mixins import CacheControlMixin, NeverCacheMixin  # noqa: E402
+
+
+class SyncView(CacheControlMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        return http.HttpResponse("ok")
+
+
+class AsyncView(CacheControlMixin, View):
+
+    async def get(self, request, *args, **kwargs):
+        return http.HttpResponse("ok")
+
+
+class SyncNeverCacheView(NeverCacheMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        return http.HttpResponse("ok")
+
+
+class AsyncNeverCacheView(NeverCacheMixin, View):
+
+    async def get(self, request, *args, **kwargs):
+        return http.HttpResponse("ok")
+
+
+class urlconf:
+    urlpatterns = [
+        path('sync/', SyncView.as_view()),
+        path('async/', AsyncView.as_view()),
+        path('sync/never-cache/', SyncNeverCacheView.as_view()),
+        path('async/never-cache/', AsyncNeverCacheView.as_view()),
+    ]
+
+
+async def requests_per_second(client, url, number, repeat=5):
+    await client.get(url)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await client.get(url)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return number / best
+
+
+def main(number=1000):
+    middleware = ['web_utils.middleware.SSLMiddleware']
+    with override_settings(ROOT_URLCONF=urlconf, MIDDLEWARE=middleware, ALLOWED_HOSTS=['*']):
+        client = AsyncClient()
+        for url in ('/sync/', '/async/', '/sync/never-cache/', '/async/never-cache/'):
+            report("ASGI GET {0}".format(url), asyncio.run(requests_per_second(client, url, number)))
+
+
+if __name__ == '__main__':
+    main()
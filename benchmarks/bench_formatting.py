@@ -0,0 +1,68 @@
+"""
+Currency formatting throughput, one call per value vs format_currency_many,
+and the format_currency / currency_column template tags.
+"""
+from decimal import Decimal
+
+from common import bench, report, setup_django
+
+setup_django()
+
+from django import template  # noqa: E402
+
+from web_utils.formatting import format_currency, format_currency_many  # noqa: E402
+from web_utils.templatetags import formatting_tags  # noqa: E402
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def main(count=10000):
+    floats = [n * 1.37 for n in range(count)]
+    decimals = [Decimal(n) / 100 for n in range(count)]
+    cents = list(range(count))
+
+    def per_call(values):
+        return [format_currency(value) for value in values]
+
+    for name, values in (("floats", floats), ("Decimals", decimals)):
+        report("format_currency x{0} {1}".format(count, name), bench(lambda: per_call(values), number=20) * count)
+        report("format_currency_many x{0} {1}".format(count, name),
+               bench(lambda: format_currency_many(values), number=20) * count)
+    report("format_currency_many x{0} integer cents".format(count),
+           bench(lambda: format_currency_many(cents, cents=True), number=20) * count)
+    report("format_currency x{0} floats EUR de_DE".format(count), bench(
+        lambda: [format_currency(value, currency='EUR', locale='de_DE') for value in floats], number=20
+    ) * count)
+    report("format_currency_many x{0} floats EUR de_DE".format(count),
+           bench(lambda: format_currency_many(floats, currency='EUR', locale='de_DE'), number=20) * count)
+
+    # the tag as a simple_tag, for comparison with the compiled node
+    library = template.Library()
+    library.simple_tag(formatting_tags.format_currency, name='simple_format_currency')
+    engine = template.Engine(libraries={'formatting_tags': 'web_utils.templatetags.formatting_tags'})
+    engine.template_libraries['simple_formatting_tags'] = library
+    context = template.Context({'amounts': floats[:1000]})
+    templates = (
+        ("simple_tag", '{% load simple_formatting_tags %}'
+                       '{% for a in amounts %}<td>{% simple_format_currency a 2 "False" %}</td>{% endfor %}'),
+        ("compiled tag", '{% load formatting_tags %}'
+                         '{% for a in amounts %}<td>{% format_currency a 2 "False" %}</td>{% endfor %}'),
+        ("currency_column", '{% load formatting_tags %}'
+                            '{% currency_column amounts 2 "False" as a %}<td>{{ a }}</td>{% endcurrency_column %}'),
+    )
+    for name, source in templates:
+        compiled = engine.from_string(source)
+        report("template {0} x1000".format(name), bench(lambda: compiled.render(context), number=20) * 1000)
+
+    if numpy is not None:
+        array = numpy.array(floats)
+        report("format_currency x{0} numpy".format(count), bench(lambda: per_call(array), number=20) * count)
+        report("format_currency_many x{0} numpy".format(count),
+               bench(lambda: format_currency_many(array), number=20) * count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+Renders/second of a menu with 30 nav items: activate as a simple_tag (how it
+used to be registered), the compiled activate and activate_section.
+"""
+from common import bench, report, setup_django
+
+setup_django()
+
+from django import template  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from web_utils.templatetags import html_tags  # noqa: E402
+
+SECTIONS = ['/section-{0}/'.format(i) for i in range(30)]
+
+
+def main():
+    simple_tags = template.Library()
+    simple_tags.simple_tag(takes_context=True)(html_tags.activate)
+    template.engines['django'].engine.template_libraries['simple_html_tags'] = simple_tags
+
+    context = template.Context({'request': RequestFactory().get('/section-29/')})
+    arguments = " ".join("'{0}'".format(section) for section in SECTIONS)
+    tags = (('simple_html_tags', 'activate'), ('html_tags', 'activate'), ('html_tags', 'activate_section'))
+    for library, tag in tags:
+        menu = "".join('<a class="{% ' + tag + ' ' + arguments + ' %}">' for _ in SECTIONS)
+        compiled = template.Template("{% load " + library + " %}" + menu)
+        report('{0}.{1}, 30 items'.format(library, tag), bench(lambda: compiled.render(context), number=1000))
+
+
+if __name__ == '__main__':
+    main()
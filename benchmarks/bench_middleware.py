@@ -0,0 +1,37 @@
+"""
+Requests/second through SSLMiddleware.process_view.
+"""
+from common import bench, report, setup_django
+
+setup_django()
+
+from django.test import RequestFactory, override_settings  # noqa: E402
+
+from web_utils.middleware import SSLMiddleware  # noqa: E402
+
+
+def main():
+    with override_settings(SSL_ENABLED=True, ALLOWED_HOSTS=['testserver']):
+        middleware = SSLMiddleware(lambda request: None)
+        secure_request = RequestFactory().get('/', secure=True)
+        insecure_request = RequestFactory().get('/', secure=False)
+
+        report("process_view (no redirect)", bench(
+            lambda: middleware.process_view(secure_request, None, (), {'USE_SSL': True})
+        ))
+        report("process_view (redirect)", bench(
+            lambda: middleware.process_view(insecure_request, None, (), {'USE_SSL': True}), number=20000
+        ))
+
+    forwarded = ('HTTP_X_FORWARDED_PROTO', 'https')
+    with override_settings(SSL_ENABLED=True, SSL_FORWARDED_PROTO_HEADER=forwarded):
+        middleware = SSLMiddleware(lambda request: None)
+        proxied_request = RequestFactory().get('/', HTTP_X_FORWARDED_PROTO='https')
+
+        report("process_view (forwarded proto header)", bench(
+            lambda: middleware.process_view(proxied_request, None, (), {'USE_SSL': True})
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+CacheMixin dispatch overhead on a cache hit and a cache miss, compared with
+building the cache_page decorator on every request, and cache hits of a
+page behind GZipMiddleware with and without cache_compress.
+"""
+from itertools import count
+
+from common import bench, report, setup_django
+
+setup_django()
+
+from django import http  # noqa: E402
+from django.middleware.gzip import GZipMiddleware  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+from django.views.decorators.cache import cache_page  # noqa: E402
+from django.views.generic import View  # noqa: E402
+
+from web_utils.mixins import CacheMixin  # noqa: E402
+
+
+class HelloView(View):
+
+    def get(self, request, *args, **kwargs):
+        return http.HttpResponse("hello")
+
+
+class CachePageView(HelloView):
+    cache_timeout = 60
+
+    def dispatch(self, *args, **kwargs):
+        return cache_page(self.cache_timeout)(super(CachePageView, self).dispatch)(*args, **kwargs)
+
+
+class CacheMixinView(CacheMixin, HelloView):
+    pass
+
+
+class PageView(CacheMixin, View):
+    # about 30KB of html
+    content = "".join('<tr><td><a href="/orders/{0}/">Order {0}</a></td><td>$1,234.56</td></tr>\n'.format(n)
+                      for n in range(400))
+
+    def get(self, request, *args, **kwargs):
+        return http.HttpResponse(self.content)
+
+
+class CompressedPageView(PageView):
+    cache_compress = True
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+def main():
+    for name, view_class in (("cache_page per request", CachePageView), ("CacheMixin", CacheMixinView)):
+        view = view_class.as_view()
+        request = RequestFactory().get('/cached/')
+        view(request)
+        report("{0} (cache hit)".format(name), bench(lambda: view(request), number=20000))
+
+        # a new url every time, so every request is generated and stored
+        requests = (RequestFactory().get('/missed/', {'n': n}) for n in count())
+        report("{0} (cache miss)".format(name), bench(lambda: view(next(requests)), number=5000))
+
+    for name, view_class in (("GZipMiddleware", PageView), ("GZipMiddleware, cache_compress", CompressedPageView)):
+        middleware = GZipMiddleware(view_class.as_view())
+        # a url per view, so they don't share a cache entry
+        request = RequestFactory().get('/' + view_class.__name__, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        middleware(request)
+        report("{0} (cache hit)".format(name), bench(lambda: middleware(request), number=5000))
+
+
+if __name__ == '__main__':
+    main()
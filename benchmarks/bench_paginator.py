@@ -0,0 +1,24 @@
+"""
+Paginator renders/second on a list view, show_paginator vs show_cached_paginator.
+"""
+from common import bench, report, setup_django
+
+setup_django()
+
+from django import template  # noqa: E402
+from django.core.paginator import Paginator  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+
+def main():
+    paginator = Paginator(range(1000), 10)
+    params = RequestFactory().get('/', data={'q': 'search term', 'sort': '-date', 'page': 7}).GET
+    context = template.Context({'page': paginator.page(7), 'paginator': paginator, 'params': params})
+
+    for tag in ('show_paginator', 'show_cached_paginator'):
+        compiled = template.Template("{% load paginator_tags %}{% " + tag + " page paginator params %}")
+        report(tag, bench(lambda: compiled.render(context), number=5000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Renders/second of a template with web_utils tags: not profiled, profiled
+but not recording, and recording with profile_tags().
+"""
+from common import bench, report, setup_django
+
+setup_django()
+
+from django import template  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from web_utils import profiling  # noqa: E402
+
+TEMPLATE = (
+    "{% load formatting_tags html_tags %}"
+    + "{% for amount in amounts %}<a class=\"{% activate '/a/' '/b/' %}\">{% format_currency amount %}</a>{% endfor %}"
+)
+
+
+def main():
+    context = template.Context({'request': RequestFactory().get('/b/'), 'amounts': range(50)})
+
+    compiled = template.Template(TEMPLATE)
+    report('not installed', bench(lambda: compiled.render(context), number=500))
+
+    profiling.install()
+    compiled = template.Template(TEMPLATE)
+    report('installed, not recording', bench(lambda: compiled.render(context), number=500))
+
+    with profiling.profile_tags():
+        report('recording', bench(lambda: compiled.render(context), number=500))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Requests/second through RateLimiter.hit and RateLimitMiddleware.process_view,
+at a login-like rate of 10/m, so most hits after the first few are limited.
+"""
+import itertools
+
+from common import bench, report, setup_django
+
+setup_django()
+
+from django.test import RequestFactory, override_settings  # noqa: E402
+
+from web_utils.middleware import RateLimitMiddleware  # noqa: E402
+from web_utils.ratelimit import RateLimiter  # noqa: E402
+
+
+def main():
+    limiter = RateLimiter('10/m')
+    report("hit (one key)", bench(lambda: limiter.hit('127.0.0.1')))
+
+    limiter = RateLimiter('10/m', maxsize=10000)
+    keys = itertools.cycle(range(50000))
+    report("hit (50000 keys, 10000 kept)", bench(lambda: limiter.hit(next(keys))))
+
+    # every hit is a new client once the buckets are full
+    limiter = RateLimiter('10/m', maxsize=10000)
+    keys = itertools.count()
+    report("hit (new key every hit, 10000 kept)", bench(lambda: limiter.hit(next(keys))))
+
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+        limiter = RateLimiter('10/m', cache_alias='default')
+        report("hit (shared through locmem cache)", bench(lambda: limiter.hit('127.0.0.1')))
+
+    middleware = RateLimitMiddleware(lambda request: None)
+    request = RequestFactory().get('/')
+    report("process_view (limited route)", bench(
+        lambda: middleware.process_view(request, None, (), {'RATE_LIMIT': '10/m'})
+    ))
+    report("process_view (no limit)", bench(lambda: middleware.process_view(request, None, (), {})))
+
+
+if __name__ == '__main__':
+    main()
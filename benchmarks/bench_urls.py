@@ -0,0 +1,51 @@
+"""
+resolve() throughput for decorated_patterns.
+"""
+from common import bench, report, setup_django
+
+setup_django()
+
+from django.contrib.auth.decorators import login_required  # noqa: E402
+from django.urls import URLResolver, include, re_path  # noqa: E402
+from django.urls.resolvers import RegexPattern  # noqa: E402
+from django.views.decorators.csrf import csrf_exempt  # noqa: E402
+
+from web_utils.tests.url_conf import TestView  # noqa: E402
+from web_utils.urls import decorated_patterns  # noqa: E402
+
+
+def build_resolver(count, decorators=(login_required, csrf_exempt), indexed=False):
+    """
+    `count` leaf patterns split across decorated includes of 100 patterns.
+    """
+    view = TestView.as_view()
+    sections = []
+    for section in range(max(count // 100, 1)):
+        leaves = [
+            re_path(r'^item-{0}/(?P<pk>\d+)/$'.format(n), view, name='item-{0}'.format(n))
+            for n in range(min(count, 100))
+        ]
+        sections.append(re_path(r'^section-{0}/'.format(section), include(leaves)))
+
+    class urlconf:
+        urlpatterns = decorated_patterns(decorators, [re_path(r'^', include(sections))], indexed=indexed)
+
+    return URLResolver(RegexPattern(r'^/'), urlconf)
+
+
+def main():
+    for count in (10, 1000, 10000):
+        sections = max(count // 100, 1)
+        first = '/section-0/item-0/1/'
+        last = '/section-{0}/item-{1}/1/'.format(sections - 1, min(count, 100) - 1)
+        for indexed in (False, True):
+            resolver = build_resolver(count, indexed=indexed)
+            label = "indexed " if indexed else ""
+            report("{0}resolve() first of {1} patterns".format(label, count),
+                   bench(lambda: resolver.resolve(first), number=5000))
+            report("{0}resolve() last of {1} patterns".format(label, count),
+                   bench(lambda: resolver.resolve(last), number=500))
+
+
+if __name__ == '__main__':
+    main()
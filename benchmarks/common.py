@@ -0,0 +1,41 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Run a benchmark from the repository root, e.g.:
+
+    python benchmarks/bench_middleware.py
+
+or all of them, saving the results to JSON, with benchmarks/run.py.
+"""
+import os
+import sys
+import timeit
+from os.path import abspath, dirname, join
+
+ROOT = abspath(join(dirname(__file__), '..'))
+
+# (name, calls/second) for everything reported, collected by run.py
+RESULTS = []
+
+
+def setup_django():
+    for path in (ROOT, join(ROOT, 'example')):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+    import django
+    django.setup()
+
+
+def bench(func, number=100000, repeat=5):
+    """
+    Returns the best calls/second of func over `repeat` runs.
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return number / best
+
+
+def report(name, calls_per_second):
+    RESULTS.append((name, calls_per_second))
+    print("{0:<50} {1:>14,.0f} /sec".format(name, calls_per_second))
@@ -0,0 +1,136 @@
+"""
+Runs the benchmarks and saves the results to JSON, so they can be compared
+between commits.
+
+    python benchmarks/run.py -o before.json
+    git checkout my-branch
+    python benchmarks/run.py -o after.json
+    python benchmarks/run.py --compare before.json after.json
+
+Pass benchmark names to run some of them (`python benchmarks/run.py urls
+mixins`). --compare exits with 1 when something got slower by more than
+--threshold (10% by default), so it can fail a CI job.
+"""
+import argparse
+import importlib
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from os import listdir
+from os.path import dirname
+
+import django
+
+import common
+
+BENCHMARKS_DIR = dirname(__file__)
+
+
+def get_benchmarks():
+    """
+    The names of the bench_*.py scripts, without "bench_".
+    """
+    return sorted(name[len('bench_'):-len('.py')] for name in listdir(BENCHMARKS_DIR)
+                  if name.startswith('bench_') and name.endswith('.py'))
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=common.ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(name):
+    """
+    Runs bench_<name>.main() in this process, returns its results.
+    """
+    start = len(common.RESULTS)
+    importlib.import_module('bench_' + name).main()
+    return {"{0}: {1}".format(name, label): calls_per_second for label, calls_per_second in common.RESULTS[start:]}
+
+
+def run(names):
+    """
+    Runs each benchmark in a process of its own, so the ones installing
+    things (like profiling) don't change the others' results.
+    """
+    results = {}
+    for name in names:
+        print("{0}:".format(name))
+        sys.stdout.flush()
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            subprocess.check_call([sys.executable, __file__, '--single', name, '-o', output.name])
+            results.update(json.load(output)['results'])
+        print("")
+
+    return {
+        'commit': get_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'results': results,
+    }
+
+
+def compare(before, after, threshold):
+    """
+    Prints the change of each benchmark in both runs, returns the names of
+    the ones that got slower than threshold.
+    """
+    print("{0:<70} {1:>14} {2:>14} {3:>8}".format(
+        "{0} -> {1}".format((before['commit'] or '?')[:8], (after['commit'] or '?')[:8]), "before", "after", "change"
+    ))
+    slower = []
+    for name, calls_per_second in sorted(after['results'].items()):
+        if name not in before['results']:
+            continue
+        change = calls_per_second / before['results'][name] - 1
+        flag = ""
+        if change < -threshold:
+            slower.append(name)
+            flag = " slower"
+        print("{0:<70} {1:>14,.0f} {2:>14,.0f} {3:>+7.1%}{4}".format(
+            name, before['results'][name], calls_per_second, change, flag
+        ))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the web_utils benchmarks.")
+    parser.add_argument('benchmarks', nargs='*', help="Benchmarks to run (Defaults to all of them)")
+    parser.add_argument('-o', '--output', help="JSON file for the results")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two JSON result files")
+    parser.add_argument('--single', help=argparse.SUPPRESS)
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Slowdown reported as a regression by --compare (Defaults to 0.1)")
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(get_benchmarks())
+    if unknown:
+        parser.error("unknown benchmarks {0}, choose from {1}".format(
+            ", ".join(sorted(unknown)), ", ".join(get_benchmarks())))
+
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            slower = compare(json.load(before), json.load(after), args.threshold)
+        return 1 if slower else 0
+
+    if args.single:
+        run_results = {'results': run_benchmark(args.single)}
+    else:
+        run_results = run(args.benchmarks or get_benchmarks())
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(run_results, output, indent=2, sort_keys=True)
+        if not args.single:
+            print("Saved results to {0}".format(args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Server side GA4 events, sent with the Measurement Protocol from a
+background thread. The analytics_tags cover client side events.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import closing
+
+try:
+    from urllib2 import urlopen, HTTPError, URLError, Request
+    from urllib import urlencode
+except ImportError:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlencode
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+GA4_MEASUREMENT_ENDPOINT = 'https://www.google-analytics.com/mp/collect'
+
+# the Measurement Protocol takes at most 25 events per request
+MAX_EVENTS_PER_REQUEST = 25
+
+logger = logging.getLogger(__name__)
+
+_FLUSH = object()
+
+
+class AnalyticsOutbox(object):
+    """
+    Collects GA4 events in process and posts them in batches from a daemon
+    worker, so requests never wait on Google.
+
+    Events are sent once `batch_size` of them are waiting or the oldest has
+    waited `flush_interval` seconds. Each batch is posted as one request per
+    client (and user) with up to 25 events. Requests that fail because the
+    endpoint is down are appended to the JSON lines file at `spill_path`
+    (when given) and sent again after the next successful request. Once the
+    file has `spill_max_bytes`, further failed requests are dropped.
+    """
+
+    def __init__(self, measurement_id, api_secret, endpoint=GA4_MEASUREMENT_ENDPOINT, batch_size=100,
+                 flush_interval=5, timeout=5, maxsize=10000, spill_path=None, spill_max_bytes=10 * 1024 * 1024):
+        self.measurement_id = measurement_id
+        self.api_secret = api_secret
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.spill_path = spill_path
+        self.spill_max_bytes = spill_max_bytes
+        self.queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def track(self, client_id, name, params=None, user_id=None):
+        """
+        Queues an event. Returns False when the queue is full and the event
+        was dropped.
+        """
+        event = {'name': name, 'params': params or {}}
+        self._start_worker()
+        try:
+            self.queue.put_nowait((client_id, user_id, event))
+        except queue.Full:
+            logger.warning("Analytics outbox is full, dropping event %s", name)
+            return False
+        return True
+
+    def flush(self):
+        """
+        Sends the waiting events now and blocks until they're sent (or spilled).
+        """
+        self._start_worker()
+        self.queue.put(_FLUSH)
+        self.queue.join()
+
+    def send(self, payload):
+        """
+        Posts one Measurement Protocol request. Returns True when it was
+        accepted, False when it was rejected (and shouldn't be sent again).
+        Raises URLError or OSError when the endpoint can't be reached.
+        """
+        url = self.endpoint + '?' + urlencode({'measurement_id': self.measurement_id, 'api_secret': self.api_secret})
+        request = Request(url, json.dumps(payload).encode('utf-8'), {'Content-Type': 'application/json'})
+        try:
+            with closing(urlopen(request, timeout=self.timeout)) as response:
+                return response.code // 100 == 2
+        except HTTPError as e:
+            e.close()
+            if e.code >= 500:
+                raise
+            logger.warning("Measurement Protocol rejected %s events: %s", len(payload['events']), e)
+            return False
+
+    def send_spilled(self):
+        """
+        Sends the requests spilled while the endpoint was down. The ones that
+        still fail are spilled again.
+        """
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        # processes sharing the file each take it under a name of their own
+        sending_path = '{0}.{1}.{2}.sending'.format(self.spill_path, os.getpid(), uuid.uuid4().hex)
+        try:
+            os.rename(self.spill_path, sending_path)
+        except OSError:
+            # another process took it first
+            return
+        with open(sending_path) as spilled:
+            payloads = [json.loads(line) for line in spilled if line.strip()]
+        os.remove(sending_path)
+        self._send_payloads(payloads, resend=False)
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="analytics-outbox")
+                self._worker.daemon = True
+                self._worker.start()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                item = self.queue.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+            if item is not None and item is not _FLUSH:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+
+            # the batch is full, flush_interval passed or flush() was called
+            try:
+                if batch:
+                    self._send_payloads(get_payloads(batch))
+            except Exception:
+                logger.exception("Unexpected error sending %s analytics events", len(batch))
+            finally:
+                for _ in range(len(batch) + (item is _FLUSH)):
+                    self.queue.task_done()
+                batch, deadline = [], None
+
+    def _send_payloads(self, payloads, resend=True):
+        failed = []
+        sent = False
+        for payload in payloads:
+            if failed:
+                # the endpoint is down, don't wait on it for every request
+                failed.append(payload)
+                continue
+            try:
+                sent = self.send(payload) or sent
+            except (URLError, OSError) as e:
+                logger.warning("Couldn't send %s analytics events: %s", len(payload['events']), e)
+                failed.append(payload)
+
+        if failed:
+            self._spill(failed)
+        elif sent and resend:
+            self.send_spilled()
+
+    def _spill(self, payloads):
+        if not self.spill_path:
+            logger.warning("Dropping %s analytics requests, no GA4_OUTBOX_SPILL_PATH", len(payloads))
+            return
+        with open(self.spill_path, 'a') as spill:
+            size = spill.tell()
+            for i, payload in enumerate(payloads):
+                line = json.dumps(payload) + '\n'
+                if size + len(line) > self.spill_max_bytes:
+                    logger.warning("Dropping %s analytics requests, %s is full", len(payloads) - i, self.spill_path)
+                    return
+                spill.write(line)
+                size += len(line)
+
+
+def get_payloads(events):
+    """
+    Groups (client_id, user_id, event) tuples into Measurement Protocol
+    request bodies of up to 25 events each.
+    """
+    grouped = {}
+    for client_id, user_id, event in events:
+        grouped.setdefault((client_id, user_id), []).append(event)
+
+    payloads = []
+    for (client_id, user_id), client_events in grouped.items():
+        for i in range(0, len(client_events), MAX_EVENTS_PER_REQUEST):
+            payload = {'client_id': client_id, 'events': client_events[i:i + MAX_EVENTS_PER_REQUEST]}
+            if user_id is not None:
+                payload['user_id'] = user_id
+            payloads.append(payload)
+    return payloads
+
+
+def get_client_id(request):
+    """
+    The GA client id from the _ga cookie ("GA1.1.123.456" -> "123.456"), or None.
+    """
+    parts = request.COOKIES.get('_ga', '').split('.')
+    if len(parts) < 4:
+        return None
+    return '.'.join(parts[-2:])
+
+
+_analytics_outbox = None
+_analytics_outbox_lock = threading.Lock()
+
+
+def get_analytics_outbox():
+    """
+    Returns the process wide AnalyticsOutbox, configured from settings:
+
+    GA4_MEASUREMENT_ID - the measurement id (Defaults to GOOGLE_ANALYTICS_ID)
+    GA4_API_SECRET - a Measurement Protocol API secret
+    GA4_MEASUREMENT_ENDPOINT - where events are posted (Defaults to Google's)
+    GA4_OUTBOX_BATCH_SIZE - events waiting before they're sent (Defaults to 100)
+    GA4_OUTBOX_FLUSH_INTERVAL - seconds an event waits at most (Defaults to 5)
+    GA4_OUTBOX_SPILL_PATH - file for events that couldn't be sent (Defaults to None, dropping them)
+    GA4_OUTBOX_SPILL_MAX_BYTES - size of the spill file at most (Defaults to 10MB)
+    """
+    global _analytics_outbox
+    if _analytics_outbox is None:
+        with _analytics_outbox_lock:
+            if _analytics_outbox is None:
+                measurement_id = (
+                    getattr(settings, 'GA4_MEASUREMENT_ID', None) or getattr(settings, 'GOOGLE_ANALYTICS_ID', None)
+                )
+                api_secret = getattr(settings, 'GA4_API_SECRET', None)
+                if not measurement_id or not api_secret:
+                    raise ImproperlyConfigured("You must define GA4_MEASUREMENT_ID and GA4_API_SECRET in settings.")
+                _analytics_outbox = AnalyticsOutbox(
+                    measurement_id,
+                    api_secret,
+                    endpoint=getattr(settings, 'GA4_MEASUREMENT_ENDPOINT', GA4_MEASUREMENT_ENDPOINT),
+                    batch_size=getattr(settings, 'GA4_OUTBOX_BATCH_SIZE', 100),
+                    flush_interval=getattr(settings, 'GA4_OUTBOX_FLUSH_INTERVAL', 5),
+                    spill_path=getattr(settings, 'GA4_OUTBOX_SPILL_PATH', None),
+                    spill_max_bytes=getattr(settings, 'GA4_OUTBOX_SPILL_MAX_BYTES', 10 * 1024 * 1024),
+                )
+    return _analytics_outbox
+
+
+def track_event(client_id, name, params=None, user_id=None):
+    """
+    Queues a server side GA4 event, e.g.
+
+    track_event(get_client_id(request), 'purchase', {'value': 9.99, 'currency': 'USD'})
+    """
+    return get_analytics_outbox().track(client_id, name, params, user_id)
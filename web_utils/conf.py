@@ -0,0 +1,47 @@
+"""
+A read only snapshot of the settings the template tags use, so rendering
+doesn't go through LazySettings on every tag. It's rebuilt when settings
+change (override_settings sends setting_changed).
+"""
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+# settings the tags read
+SNAPSHOT_SETTINGS = (
+    'GOOGLE_ANALYTICS_ID',
+    'GOOGLE_ANALYTICS_DOMAIN',
+)
+
+# settings get_setting outputs on top of the ones in GET_SETTING_ALLOWLIST
+DEFAULT_GET_SETTING_ALLOWLIST = SNAPSHOT_SETTINGS + (
+    'GA4_MEASUREMENT_ID',
+    'SITE_DOMAIN',
+)
+
+_snapshot = None
+
+
+def get_settings_snapshot():
+    """
+    Returns a read only mapping of the SNAPSHOT_SETTINGS, the
+    DEFAULT_GET_SETTING_ALLOWLIST and the settings in GET_SETTING_ALLOWLIST
+    that are defined. Every setting in it can be output by get_setting.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None:
+        names = DEFAULT_GET_SETTING_ALLOWLIST + tuple(getattr(settings, 'GET_SETTING_ALLOWLIST', None) or ())
+        snapshot = _snapshot = MappingProxyType({
+            name: getattr(settings, name) for name in names if hasattr(settings, name)
+        })
+    return snapshot
+
+
+def _clear_settings_snapshot(**kwargs):
+    global _snapshot
+    _snapshot = None
+
+
+setting_changed.connect(_clear_settings_snapshot)
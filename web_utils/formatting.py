@@ -1,13 +1,236 @@
-def format_currency(value, places=2, show_zero=True):
+# -*- coding: utf-8 -*-
+from functools import lru_cache
+
+# currency code: (symbol, decimal places)
+CURRENCIES = {
+    'AUD': ('$', 2),
+    'BRL': ('R$', 2),
+    'CAD': ('$', 2),
+    'CHF': ('CHF', 2),
+    'CNY': ('¥', 2),
+    'EUR': ('€', 2),
+    'GBP': ('£', 2),
+    'INR': ('₹', 2),
+    'JPY': ('¥', 0),
+    'MXN': ('$', 2),
+    'SEK': ('kr', 2),
+    'USD': ('$', 2),
+}
+
+# locale: (grouping separator, decimal separator, pattern)
+# spaces are no-break spaces, so amounts don't wrap
+LOCALES = {
+    'de_CH': ("'", '.', '{symbol}\u00a0{number}'),
+    'de_DE': ('.', ',', '{number}\u00a0{symbol}'),
+    'en_AU': (',', '.', '{symbol}{number}'),
+    'en_CA': (',', '.', '{symbol}{number}'),
+    'en_GB': (',', '.', '{symbol}{number}'),
+    'en_IE': (',', '.', '{symbol}{number}'),
+    'en_US': (',', '.', '{symbol}{number}'),
+    'es_ES': ('.', ',', '{number}\u00a0{symbol}'),
+    'es_MX': (',', '.', '{symbol}{number}'),
+    'fr_CA': ('\u00a0', ',', '{number}\u00a0{symbol}'),
+    'fr_FR': ('\u202f', ',', '{number}\u00a0{symbol}'),
+    'it_IT': ('.', ',', '{number}\u00a0{symbol}'),
+    'ja_JP': (',', '.', '{symbol}{number}'),
+    'nl_NL': ('.', ',', '{symbol}\u00a0{number}'),
+    'pt_BR': ('.', ',', '{symbol}\u00a0{number}'),
+    'sv_SE': ('\u00a0', ',', '{number}\u00a0{symbol}'),
+    'zh_CN': (',', '.', '{symbol}{number}'),
+}
+
+
+def _normalize_locale(name):
+    language, _, country = name.replace('-', '_').partition('_')
+    return language.lower() + ('_' + country.upper() if country else '')
+
+
+class CurrencyFormatter(object):
+    """
+    Formats amounts of one currency the way one locale writes them.
+
+    Symbol placement and separators come from CURRENCIES and LOCALES and are
+    worked out when the formatter is created. The format for each number of
+    decimal places is built the first time it's used. Nothing depends on
+    locale.setlocale, so formatters are safe to share between threads.
+
+    Use get_currency_formatter to reuse formatters.
+    """
+
+    def __init__(self, currency='USD', locale='en_US'):
+        self.currency, self.locale = currency.upper(), _normalize_locale(locale)
+        try:
+            self.symbol, self.places = CURRENCIES[self.currency]
+        except KeyError:
+            raise ValueError("Unknown currency: {0}".format(currency))
+        try:
+            self.group, self.decimal, pattern = LOCALES[self.locale]
+        except KeyError:
+            raise ValueError("Unknown locale: {0}".format(locale))
+
+        self.prefix, self.suffix = pattern.replace('{symbol}', self.symbol).split('{number}')
+        self._formats = {}
+
+    def __repr__(self):
+        return "<CurrencyFormatter {0} {1}>".format(self.currency, self.locale)
+
+    def get_format(self, places=None):
+        """
+        Returns a function formatting a number with `places` decimal places
+        (the currency's default when None).
+        """
+        try:
+            return self._formats[places]
+        except KeyError:
+            pass
+
+        if places is None:
+            # cached under None too, so the default doesn't miss every time
+            return self._formats.setdefault(None, self.get_format(self.places))
+
+        if (self.group, self.decimal) == (',', '.'):
+            number = "{{:,.{0}f}}".format(places)
+            currency_format = (_escape_braces(self.prefix) + number + _escape_braces(self.suffix)).format
+        else:
+            number_format = "{{:,.{0}f}}".format(places).format
+            currency_format = _separated_format(self.prefix, number_format, self.group, self.decimal, self.suffix)
+        return self._formats.setdefault(places, currency_format)
+
+    def format(self, value, places=None, show_zero=True):
+        """
+        :param places:
+            number of decimal places to show, defaults to the currency's.
+        :param show_zero:
+            When true, zero should be formatted.
+            When false, zero should be empty string.
+        """
+        if value in (0, None) and not show_zero:
+            return ''
+        return self.get_format(places)(value or 0)
+
+    def format_many(self, values, places=None, show_zero=True, cents=False, stream=False):
+        """
+        Formats every value in values, see format_currency_many.
+        """
+        tolist = getattr(values, 'tolist', None)
+        if tolist is not None:
+            # numpy arrays; python numbers format much faster than numpy scalars
+            values = tolist()
+
+        if cents:
+            formatted = self._format_cents(values, self.places if places is None else places, show_zero)
+        else:
+            currency_format = self.get_format(places)
+            if show_zero:
+                formatted = (currency_format(value or 0) for value in values)
+            else:
+                formatted = ('' if value in (0, None) else currency_format(value) for value in values)
+
+        if stream:
+            return formatted
+        return list(formatted)
+
+    def _format_cents(self, values, places, show_zero):
+        unit = 10 ** places
+        group_format = "{:,}".format if self.group == ',' else _grouped_format(self.group)
+        if not places:
+            decimals = [''] * unit
+        elif places <= 3:
+            # the decimal part only has `unit` possible values
+            decimals = [self.decimal + "{0:0{1}d}".format(n, places) for n in range(unit)]
+        else:
+            decimals = None
+        positive, negative, suffix = self.prefix, self.prefix + '-', self.suffix
+
+        for value in values:
+            if not value:
+                if not show_zero:
+                    yield ''
+                    continue
+                value = 0
+
+            value = int(value)
+            units, fraction = divmod(value if value >= 0 else -value, unit)
+            if decimals is None:
+                decimal_part = "{0}{1:0{2}d}".format(self.decimal, fraction, places)
+            else:
+                decimal_part = decimals[fraction]
+            yield (positive if value >= 0 else negative) + group_format(units) + decimal_part + suffix
+
+
+def _escape_braces(text):
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+def _separated_format(prefix, number_format, group, decimal, suffix):
+    # translate swaps both separators at once, so they can't clash
+    separators = {ord(','): group, ord('.'): decimal}
+
+    def currency_format(value):
+        return prefix + number_format(value).translate(separators) + suffix
+    return currency_format
+
+
+def _grouped_format(separator):
+    def group_format(value):
+        return "{0:,}".format(value).replace(',', separator)
+    return group_format
+
+
+@lru_cache(maxsize=64)
+def get_currency_formatter(currency='USD', locale='en_US'):
+    """
+    Returns a shared CurrencyFormatter for currency and locale.
+    """
+    return CurrencyFormatter(currency, locale)
+
+
+# (currency, locale, places): format function, so format_currency is a single
+# dict lookup once warmed up
+_currency_formats = {}
+MAX_CURRENCY_FORMATS = 256
+
+
+def _get_currency_format(currency, locale, places):
+    if len(_currency_formats) >= MAX_CURRENCY_FORMATS:
+        _currency_formats.clear()
+    currency_format = get_currency_formatter(currency, locale).get_format(places)
+    return _currency_formats.setdefault((currency, locale, places), currency_format)
+
+
+def format_currency(value, places=None, show_zero=True, currency='USD', locale='en_US'):
     """
     Formats value currency format like: $1,500.25
 
     :param places:
-        number of decimal places to show.
+        number of decimal places to show, defaults to the currency's.
     :param show_zero:
         When true, zero should be formatted.
         When false, zero should be empty string.
+    :param currency, locale:
+        see CurrencyFormatter, e.g. format_currency(5, currency='EUR', locale='de_DE')
     """
     if value in (0, None) and not show_zero:
         return ''
-    return "${value:,.{precision}f}".format(value=value or 0, precision=places)
+    try:
+        currency_format = _currency_formats[currency, locale, places]
+    except KeyError:
+        currency_format = _get_currency_format(currency, locale, places)
+    return currency_format(value or 0)
+
+
+def format_currency_many(values, places=None, show_zero=True, cents=False, stream=False, currency='USD',
+                         locale='en_US'):
+    """
+    Formats every value in values like format_currency.
+
+    :param values:
+        any iterable of numbers, including Decimals and numpy arrays.
+    :param cents:
+        When true, values are integers counted in the smallest unit,
+        e.g. cents when places is 2. They are formatted exactly, without
+        going through floats.
+    :param stream:
+        When true, returns a generator instead of a list.
+    """
+    return get_currency_formatter(currency, locale).format_many(values, places, show_zero, cents, stream)
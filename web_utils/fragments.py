@@ -0,0 +1,137 @@
+"""
+Per-user fragments for pages cached once for everybody, see
+FragmentCacheMixin and the user_fragment template tag.
+
+While a page is rendered for the cache, every user_fragment block is
+replaced by a signed marker naming its template and fragment. The markers
+are swapped for each user's fragments when the page is served, so only the
+fragments are rendered (or fetched from the cache) per user.
+
+Fragments are cached per user and per path. Fragments with a
+{% csrf_token %} are also cached per CSRF secret, so the cached token
+matches the CSRF cookie, which is sent again when they come from the cache.
+"""
+import hashlib
+import re
+
+from django import template
+from django.core import signing
+from django.middleware.csrf import get_token
+from django.template.context import RequestContext
+from django.template.defaulttags import CsrfTokenNode
+from django.template.loader import get_template
+from django.utils.encoding import force_str
+
+MARKER_SALT = 'web_utils.fragments'
+MARKER_RE = re.compile(r'<!--web_utils\.fragment:([\w:\-]+)-->')
+
+# set on requests while their page is rendered for the cache
+CACHING_ATTRIBUTE = '_cache_user_fragments'
+# set on requests whose page had fragments that couldn't be left out
+UNCACHEABLE_ATTRIBUTE = '_user_fragments_uncacheable'
+
+
+class UserFragmentNode(template.Node):
+
+    def __init__(self, fragment_name, nodelist):
+        self.fragment_name = fragment_name
+        self.nodelist = nodelist
+        self._marker = None
+
+    def render(self, context):
+        request = getattr(context, 'request', None)
+        if request is None or not getattr(request, CACHING_ATTRIBUTE, False):
+            return self.nodelist.render(context)
+
+        if self.origin.template_name is None:
+            # templates that weren't loaded by name can't be found again to
+            # render the fragment, so the page can't be cached
+            setattr(request, UNCACHEABLE_ATTRIBUTE, True)
+            return self.nodelist.render(context)
+
+        if self._marker is None:
+            uses_csrf_token = bool(self.nodelist.get_nodes_by_type(CsrfTokenNode))
+            signed = signing.dumps([self.origin.template_name, self.fragment_name, uses_csrf_token], salt=MARKER_SALT)
+            self._marker = '<!--web_utils.fragment:{0}-->'.format(signed)
+        return self._marker
+
+
+def find_fragment_node(template_name, fragment_name):
+    django_template = get_template(template_name)
+    django_template = getattr(django_template, 'template', django_template)
+    for node in django_template.nodelist.get_nodes_by_type(UserFragmentNode):
+        if node.fragment_name == fragment_name:
+            return django_template, node
+    raise template.TemplateSyntaxError(
+        "{0} has no user_fragment {1}".format(template_name, fragment_name)
+    )
+
+
+def render_fragment(request, template_name, fragment_name):
+    """
+    Renders a user_fragment block on its own, with a RequestContext for
+    request (so with the context processors' variables only).
+    """
+    django_template, node = find_fragment_node(template_name, fragment_name)
+    context = RequestContext(request)
+    with context.render_context.push_state(django_template), context.bind_template(django_template):
+        return node.nodelist.render(context)
+
+
+def fragment_cache_key(request, template_name, fragment_name, user_key, uses_csrf_token=False):
+    """
+    The key of a user's fragment on request's page, or None when it can't be
+    cached: for anonymous users (user_key None), or when it has a csrf token
+    and there's no CSRF secret yet (the token would be for a new secret).
+    """
+    if user_key is None:
+        return None
+    values = [template_name, fragment_name, request.get_full_path()]
+    if uses_csrf_token:
+        # set by CsrfViewMiddleware, from the cookie or the session
+        secret = request.META.get('CSRF_COOKIE')
+        if not secret:
+            return None
+        values.append(secret)
+    name = hashlib.sha256(force_str('\n'.join(values)).encode('utf-8')).hexdigest()
+    return 'web_utils.fragment.{0}.{1}'.format(name, user_key)
+
+
+def render_user_fragments(request, content, user_key, cache, timeout):
+    """
+    Replaces the fragment markers in content with the user's fragments,
+    from the cache when they're in it. The fragments of anonymous users
+    (user_key None) are rendered every time, nothing tells them apart.
+    """
+    fragments = {}
+    for signed in set(MARKER_RE.findall(content)):
+        try:
+            template_name, fragment_name, uses_csrf_token = signing.loads(signed, salt=MARKER_SALT)
+        except (signing.BadSignature, ValueError, TypeError):
+            # not ours, leave it alone
+            continue
+        key = fragment_cache_key(request, template_name, fragment_name, user_key, uses_csrf_token)
+        fragments[signed] = (template_name, fragment_name, uses_csrf_token, key)
+    if not fragments:
+        return content
+
+    keys = [key for _, _, _, key in fragments.values() if key is not None]
+    cached = cache.get_many(keys) if keys else {}
+    rendered = {}
+    contents = {}
+    for signed, (template_name, fragment_name, uses_csrf_token, key) in fragments.items():
+        if key in cached:
+            contents[signed] = cached[key]
+            if uses_csrf_token:
+                # sends the CSRF cookie the cached token was made for
+                get_token(request)
+            continue
+        contents[signed] = render_fragment(request, template_name, fragment_name)
+        if key is not None:
+            rendered[key] = contents[signed]
+    if rendered:
+        cache.set_many(rendered, timeout)
+
+    def replace(match):
+        return contents.get(match.group(1), match.group(0))
+    return MARKER_RE.sub(replace, content)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from web_utils.sitemaps import get_sitemap_builder
+from web_utils.web import get_sitemap_pinger
+
+
+class Command(BaseCommand):
+    help = "Writes the sitemap shards that changed since the last build, and the sitemap index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Write every shard")
+
+    def handle(self, *args, **options):
+        written = get_sitemap_builder().build(full=options['full'])
+        self.stdout.write("Wrote {0} sitemap shards.".format(written))
+        if written and getattr(settings, 'PING_GOOGLE_SITEMAP', False):
+            # the pinger's thread would die with the command
+            get_sitemap_pinger().join()
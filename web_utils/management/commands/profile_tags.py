@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from web_utils import profiling
+
+
+class Command(BaseCommand):
+    help = "Requests the given paths and prints how long the web_utils template tags took to render."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Paths to request, like /products/")
+        parser.add_argument('--repeat', type=int, default=10, help="Requests per path (Defaults to 10)")
+        parser.add_argument('--host', default='testserver', help="Host header for the requests")
+        parser.add_argument(
+            '--by-template', action='store_true', help="Show the timings per tag and template instead of per tag"
+        )
+
+    def handle(self, *args, **options):
+        # before any template is compiled in this process
+        profiling.install()
+        client = Client(HTTP_HOST=options['host'])
+
+        with profiling.profile_tags() as stats:
+            for path in options['paths']:
+                for _ in range(options['repeat']):
+                    response = client.get(path)
+                if response.status_code != 200:
+                    self.stderr.write("{0} returned {1}".format(path, response.status_code))
+
+        if options['by_template']:
+            rows = [("{0} ({1})".format(tag_name, template_name), timing)
+                    for (tag_name, template_name), timing in stats.by_template()]
+        else:
+            rows = stats.by_tag()
+        self.write_rows(rows)
+
+    def write_rows(self, rows):
+        if not rows:
+            self.stdout.write("No web_utils tags were rendered.")
+            return
+        width = max(len(name) for name, _ in rows)
+        self.stdout.write("{0:<{width}} {1:>8} {2:>12} {3:>10}".format(
+            "tag", "calls", "total ms", "p95 ms", width=width))
+        for name, timing in rows:
+            self.stdout.write("{0:<{width}} {1:>8} {2:>12.3f} {3:>10.3f}".format(
+                name, timing.count, timing.total * 1000, timing.p95 * 1000, width=width))
@@ -1,6 +1,16 @@
+try:
+    from asgiref.sync import iscoroutinefunction
+except ImportError:
+    from asyncio import iscoroutinefunction
+
 from django.conf import settings
+from django.core.signals import setting_changed
 from django.http import HttpResponsePermanentRedirect
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+from web_utils import profiling, ratelimit
+from web_utils.lru import LRUCache
 
 
 class SSLMiddleware(MiddlewareMixin):
@@ -8,31 +18,236 @@ class SSLMiddleware(MiddlewareMixin):
     Lets you specify which urls use SSL and which do not. The middleware
     forces every request to use the protocol specified.
 
-    Available settings to configure (boolean values):
+    Available settings to configure:
     SSL_ENABLED - Whether to even use SSL or not (Defaults to False)
     USE_SSL_DEFAULT - Use https unless otherwise specified (Defaults to False)
+    SSL_FORWARDED_PROTO_HEADER - (META name, value) of the header your proxy
+        sets for https requests, like ('HTTP_X_FORWARDED_PROTO', 'https').
+        When set, it decides whether requests are secure instead of
+        request.is_secure() (Defaults to None). Only set it behind a proxy
+        that always sets or strips the header: without one, clients can send
+        it themselves to pass as https, and with no proxy in front at all the
+        header is never set, so https routes redirect to themselves forever
+    SSL_HSTS_SECONDS - max-age of the Strict-Transport-Security header added
+        to https responses (Defaults to 0, no header)
+    SSL_HSTS_INCLUDE_SUBDOMAINS - add includeSubDomains (Defaults to False)
+    SSL_HSTS_PRELOAD - add preload (Defaults to False)
 
 
     Usage:
         url('^admin/', include('django.contrib.admin'), kwargs={'USE_SSL': True}),
 
+    With HSTS, browsers go straight to https, so https requests are never
+    redirected to http (browsers would loop), whatever USE_SSL says.
+
+    Settings are read once when the middleware is created and again whenever
+    they change through the setting_changed signal (override_settings).
+    The USE_SSL view kwarg is the routing decision itself, so a request only
+    costs a pop from the view kwargs. Validated hosts for redirects are kept
+    in an LRU cache keyed on the request's host headers, so each host is only
+    checked against ALLOWED_HOSTS once.
+
+    Under ASGI, process_view and process_response run on the event loop
+    instead of being handed to a thread through sync_to_async.
     """
+    settings_names = (
+        "SSL_ENABLED", "USE_SSL_DEFAULT", "SSL_FORWARDED_PROTO_HEADER", "SSL_HSTS_SECONDS",
+        "SSL_HSTS_INCLUDE_SUBDOMAINS", "SSL_HSTS_PRELOAD",
+    )
+    # settings get_host() depends on
+    host_settings_names = ("ALLOWED_HOSTS", "USE_X_FORWARDED_HOST", "USE_X_FORWARDED_PORT", "DEBUG")
+    # request.META values get_host() builds the host from
+    host_meta_names = ("HTTP_X_FORWARDED_HOST", "HTTP_HOST", "SERVER_NAME", "SERVER_PORT", "HTTP_X_FORWARDED_PORT")
+    host_cache_size = 1024
+
+    def __init__(self, get_response=None):
+        super(SSLMiddleware, self).__init__(get_response)
+        if iscoroutinefunction(get_response):
+            self.process_view = self._async_process_view
+        self._hosts = LRUCache(self.host_cache_size)
+        self.load_settings()
+        setting_changed.connect(self._setting_changed)
+
+    def load_settings(self):
+        self.ssl_enabled = getattr(settings, "SSL_ENABLED", False)
+        self.use_secure_as_default = getattr(settings, "USE_SSL_DEFAULT", False)
+        self.forwarded_proto_header = getattr(settings, "SSL_FORWARDED_PROTO_HEADER", None)
+
+        self.hsts_header = None
+        hsts_seconds = getattr(settings, "SSL_HSTS_SECONDS", 0)
+        if hsts_seconds:
+            self.hsts_header = "max-age=%s" % hsts_seconds
+            if getattr(settings, "SSL_HSTS_INCLUDE_SUBDOMAINS", False):
+                self.hsts_header += "; includeSubDomains"
+            if getattr(settings, "SSL_HSTS_PRELOAD", False):
+                self.hsts_header += "; preload"
+
+    def _setting_changed(self, setting, **kwargs):
+        if setting in self.settings_names:
+            self.load_settings()
+        if setting in self.host_settings_names:
+            self._hosts.clear()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._async_call(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def _async_call(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
 
     def process_view(self, request, view_func, view_args, view_kwargs):
-        ssl_enabled = getattr(settings, "SSL_ENABLED", False)
-        use_secure_as_default = getattr(settings, "USE_SSL_DEFAULT", False)
-        use_secure = view_kwargs.pop("USE_SSL", use_secure_as_default)
+        return self._check_protocol(request, view_kwargs)
+
+    async def _async_process_view(self, request, view_func, view_args, view_kwargs):
+        return self._check_protocol(request, view_kwargs)
 
-        if ssl_enabled and not use_secure == request.is_secure():
+    def process_response(self, request, response):
+        if self.hsts_header and self.ssl_enabled and "Strict-Transport-Security" not in response:
+            if self.is_secure(request):
+                response["Strict-Transport-Security"] = self.hsts_header
+        return response
+
+    def is_secure(self, request):
+        if self.forwarded_proto_header is None:
+            return request.is_secure()
+        header, secure_value = self.forwarded_proto_header
+        # proxies may add to the header, the first value is the client's
+        return request.META.get(header, "").split(",")[0].strip() == secure_value
+
+    def _check_protocol(self, request, view_kwargs):
+        use_secure = view_kwargs.pop("USE_SSL", self.use_secure_as_default)
+        if not self.ssl_enabled:
+            return None
+
+        is_secure = self.is_secure(request)
+        if is_secure and self.hsts_header:
+            return None
+        if not use_secure == is_secure:
             return self._redirect(request, use_secure)
 
+    def _get_host(self, request):
+        key = tuple(request.META.get(name) for name in self.host_meta_names)
+        host = self._hosts.get(key)
+        if host is None:
+            # raises DisallowedHost for hosts that aren't allowed, those aren't cached
+            host = request.get_host()
+            self._hosts.set(key, host)
+        return host
+
     def _redirect(self, request, use_secure):
-        protocol = use_secure and "https" or "http"
-        redirect_url = "%s://%s%s" % (protocol, request.get_host(), request.get_full_path())
         if settings.DEBUG and request.method == 'POST':
             raise RuntimeError(
                 """Django can't perform a SSL redirect while maintaining POST data.
            Please structure your views so that redirects only occur during GETs."""
             )
 
-        return HttpResponsePermanentRedirect(redirect_url)
+        protocol = use_secure and "https://" or "http://"
+        return HttpResponsePermanentRedirect(protocol + self._get_host(request) + request.get_full_path())
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Limits the requests to routes with a RATE_LIMIT view kwarg, configured
+    like SSLMiddleware's USE_SSL:
+
+        path('search/', search, kwargs={'RATE_LIMIT': '100/m'}),
+
+    Requests over the limit get a 429 with a Retry-After header. Limits are
+    per route and per client, see web_utils.ratelimit.RateLimiter.
+
+    Available settings to configure:
+    RATE_LIMIT_ENABLED - Whether to limit requests (Defaults to True)
+    RATE_LIMIT_DEFAULT - rate for routes without RATE_LIMIT (Defaults to None, no limit)
+    RATE_LIMIT_KEY - dotted path to a function(request) returning the
+        client's key (Defaults to web_utils.ratelimit.get_client_ip)
+    RATE_LIMIT_CACHE - cache alias to share limits between processes
+        (Defaults to None, limits per process)
+    RATE_LIMIT_MAXSIZE - buckets kept per rate (Defaults to 10000)
+
+    Settings are read once and again when they change, like SSLMiddleware.
+    """
+    settings_names = (
+        "RATE_LIMIT_ENABLED", "RATE_LIMIT_DEFAULT", "RATE_LIMIT_KEY", "RATE_LIMIT_CACHE", "RATE_LIMIT_MAXSIZE",
+    )
+
+    def __init__(self, get_response=None):
+        super(RateLimitMiddleware, self).__init__(get_response)
+        if iscoroutinefunction(get_response):
+            self.process_view = self._async_process_view
+        self.load_settings()
+        setting_changed.connect(self._setting_changed)
+
+    def load_settings(self):
+        self.enabled = getattr(settings, "RATE_LIMIT_ENABLED", True)
+        self.default_rate = getattr(settings, "RATE_LIMIT_DEFAULT", None)
+        key = getattr(settings, "RATE_LIMIT_KEY", None)
+        self.get_key = import_string(key) if key else ratelimit.get_client_ip
+        self.cache_alias = getattr(settings, "RATE_LIMIT_CACHE", None)
+        self.maxsize = getattr(settings, "RATE_LIMIT_MAXSIZE", 10000)
+        # rate: RateLimiter
+        self.limiters = {}
+
+    def _setting_changed(self, setting, **kwargs):
+        if setting in self.settings_names:
+            self.load_settings()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        return self._check_rate(request, view_func, view_kwargs)
+
+    async def _async_process_view(self, request, view_func, view_args, view_kwargs):
+        return self._check_rate(request, view_func, view_kwargs)
+
+    def _check_rate(self, request, view_func, view_kwargs):
+        rate = view_kwargs.pop("RATE_LIMIT", self.default_rate)
+        if not rate or not self.enabled:
+            return None
+
+        limiter = self.limiters.get(rate)
+        if limiter is None:
+            limiter = self.limiters[rate] = ratelimit.RateLimiter(
+                rate, maxsize=self.maxsize, cache_alias=self.cache_alias
+            )
+        route = getattr(getattr(request, 'resolver_match', None), 'route', None) or request.path_info
+        retry_after = limiter.hit((route, self.get_key(request)))
+        if retry_after:
+            return ratelimit.too_many_requests(retry_after)
+
+
+class TemplateProfilingMiddleware(MiddlewareMixin):
+    """
+    Profiles the web_utils template tags rendered for each request and adds
+    their timings to the response's Server-Timing header, e.g.
+
+    Server-Timing: show_paginator;dur=1.204;desc="1 calls, p95 1.204ms"
+
+    The tags are wrapped (web_utils.profiling.install) when the middleware
+    is created, so templates compiled before that aren't profiled. Timings
+    are visible to anybody getting the response, so only use it where
+    that's fine (like development or staging).
+    """
+
+    def __init__(self, get_response=None):
+        super(TemplateProfilingMiddleware, self).__init__(get_response)
+        profiling.install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._async_call(request)
+        with profiling.profile_tags() as stats:
+            response = self.get_response(request)
+        return self._add_server_timing(response, stats)
+
+    async def _async_call(self, request):
+        with profiling.profile_tags() as stats:
+            response = await self.get_response(request)
+        return self._add_server_timing(response, stats)
+
+    def _add_server_timing(self, response, stats):
+        server_timing = stats.server_timing()
+        if server_timing:
+            if response.has_header('Server-Timing'):
+                server_timing = response['Server-Timing'] + ", " + server_timing
+            response['Server-Timing'] = server_timing
+        return response
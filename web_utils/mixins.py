@@ -1,60 +1,835 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import csv
+import gzip
+import hashlib
+import re
+import time
+from calendar import timegm
+from functools import wraps
+from inspect import getfullargspec
+from io import BytesIO, StringIO
 
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    # django < 3.0 doesn't install asgiref, and has no async views to use it
+    sync_to_async = None
+
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.decorators import login_required
-from django.utils.cache import patch_response_headers
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.middleware.cache import CacheMiddleware
+from django.shortcuts import resolve_url
+from django.utils.cache import (
+    add_never_cache_headers, get_cache_key, get_conditional_response, get_max_age, has_vary_header,
+    learn_cache_key, patch_response_headers, patch_vary_headers
+)
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page, never_cache
+from django.utils.encoding import force_str
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
 
+from web_utils import fragments
+from web_utils.formatting import format_currency
+
 # https://gist.github.com/cyberdelia/1231560
 
 
+def _view_is_async(view):
+    # View.view_is_async only exists on django >= 4.1, which is also when
+    # class based views learned to be async.
+    return getattr(view, 'view_is_async', False)
+
+
+def async_capable(decorator, async_decorator):
+    """
+    Decorates a dispatch method with `decorator` for sync views and with
+    `async_decorator` when the view's handlers are coroutines, so async views
+    don't have to go through decorators that only understand sync responses.
+
+    `async_decorator` receives the undecorated dispatch function and must
+    return a coroutine function taking (self, request, *args, **kwargs).
+    """
+    def _decorator(dispatch):
+        sync_dispatch = method_decorator(decorator)(dispatch)
+        async_dispatch = async_decorator(dispatch)
+
+        @wraps(sync_dispatch)
+        def _dispatch(self, *args, **kwargs):
+            if _view_is_async(self):
+                return async_dispatch(self, *args, **kwargs)
+            return sync_dispatch(self, *args, **kwargs)
+        return _dispatch
+    return _decorator
+
+
+def _async_never_cache(dispatch):
+    async def _dispatch(self, request, *args, **kwargs):
+        response = await dispatch(self, request, *args, **kwargs)
+        add_never_cache_headers(response)
+        return response
+    return _dispatch
+
+
+def _async_user_passes_test(test_func, login_url=None):
+    def _decorator(dispatch):
+        async def _dispatch(self, request, *args, **kwargs):
+            if hasattr(request, 'auser'):
+                passes = test_func(await request.auser())
+            else:
+                # loading request.user may hit the session and database
+                passes = await sync_to_async(test_func)(request.user)
+
+            if passes:
+                return await dispatch(self, request, *args, **kwargs)
+            return _redirect_to_login(request, login_url)
+        return _dispatch
+    return _decorator
+
+
+def _redirect_to_login(request, login_url=None):
+    """
+    Same redirect django.contrib.auth.decorators.user_passes_test builds.
+    """
+    from django.contrib.auth.views import redirect_to_login
+
+    path = request.build_absolute_uri()
+    resolved_login_url = resolve_url(login_url or settings.LOGIN_URL)
+    login_scheme, login_netloc = urlparse(resolved_login_url)[:2]
+    current_scheme, current_netloc = urlparse(path)[:2]
+    if (not login_scheme or login_scheme == current_scheme) and (not login_netloc or login_netloc == current_netloc):
+        path = request.get_full_path()
+    return redirect_to_login(path, resolved_login_url, REDIRECT_FIELD_NAME)
+
+
+def _async_passthrough(dispatch):
+    async def _dispatch(self, request, *args, **kwargs):
+        return await dispatch(self, request, *args, **kwargs)
+    return _dispatch
+
+
+def _is_staff_member(user):
+    return user.is_active and user.is_staff
+
+
+def _add_content_etag(request, response):
+    """
+    Adds a weak ETag hashed from the content, hashing it chunk by chunk,
+    and turns the response into a 304 when the request has a matching copy.
+    """
+    if response.status_code != 200 or response.has_header('ETag'):
+        return response
+    content_hash = hashlib.sha1()
+    for chunk in response:
+        content_hash.update(chunk)
+    response['ETag'] = 'W/"{0}"'.format(content_hash.hexdigest())
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+# like GZipMiddleware, shorter responses aren't worth compressing
+MIN_COMPRESS_LENGTH = 200
+ENCODINGS = (('br', re.compile(r'\bbr\b')), ('gzip', re.compile(r'\bgzip\b')))
+
+
+def _gzip(content):
+    # gzip.compress only takes an mtime on python 3.8+, a fixed one keeps
+    # the output (and so the cached response) the same for the same content
+    buffer = BytesIO()
+    with gzip.GzipFile(mode='wb', compresslevel=9, fileobj=buffer, mtime=0) as gzip_file:
+        gzip_file.write(content)
+    return buffer.getvalue()
+
+
+def _is_cacheable(request, response):
+    """
+    Whether a response can be shared between users, with the checks
+    CacheMiddleware makes: not streaming, a 200, not private, and not
+    setting a (maybe user specific) cookie in response to a request
+    without cookies.
+    """
+    if response.streaming or response.status_code != 200:
+        return False
+    if not request.COOKIES and response.cookies and has_vary_header(response, 'Cookie'):
+        return False
+    return 'private' not in response.get('Cache-Control', ())
+
+
+def _will_be_cached(middleware, request, response):
+    """
+    Whether middleware.process_response will store the response, with the
+    same checks, so responses it won't store aren't compressed for nothing.
+    """
+    if not middleware._should_update_cache(request, response) or not _is_cacheable(request, response):
+        return False
+    timeout = getattr(middleware, 'page_timeout', None)
+    if timeout is None:
+        timeout = get_max_age(response)
+        if timeout is None:
+            timeout = middleware.cache_timeout
+    return bool(timeout)
+
+
+def _add_compressed_content(response):
+    """
+    Compresses a response that is about to be cached, keeping the brotli
+    (when the brotli package is installed) and gzip versions shorter than
+    the content on the response, so they're cached along with it.
+    """
+    if response.streaming or response.status_code != 200 or response.has_header('Content-Encoding'):
+        return
+    content = response.content
+    if len(content) < MIN_COMPRESS_LENGTH:
+        return
+    # compressed once per cache fill, so use the best levels
+    compressed = {'gzip': _gzip(content)}
+    if brotli is not None:
+        compressed['br'] = brotli.compress(content, mode=brotli.MODE_TEXT)
+    response._compressed_content = {
+        encoding: compressed_content for encoding, compressed_content in compressed.items()
+        if len(compressed_content) < len(content)
+    }
+
+
+def _encode_response(request, response):
+    """
+    Swaps the content of a response for the compressed version the request
+    accepts, when _add_compressed_content made one.
+    """
+    compressed = getattr(response, '_compressed_content', None)
+    if not compressed:
+        return response
+    patch_vary_headers(response, ('Accept-Encoding', ))
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for encoding, accepts in ENCODINGS:
+        if encoding in compressed and accepts.search(accept_encoding):
+            response.content = compressed[encoding]
+            response['Content-Length'] = str(len(response.content))
+            etag = response.get('ETag')
+            if etag and etag.startswith('"'):
+                response['ETag'] = 'W/' + etag
+            response['Content-Encoding'] = encoding
+            break
+    return response
+
+
+def _no_response(request):
+    # CacheMiddleware needs a get_response, but it is only ever used for its
+    # process_request and process_response hooks.
+    return None
+
+
+# timeout: CacheMiddleware, see get_cache_middleware
+_cache_middlewares = {}
+MAX_CACHE_MIDDLEWARES = 64
+
+# django < 3.0 called the page timeout cache_timeout
+_PAGE_TIMEOUT_KWARG = 'cache_timeout'
+if 'page_timeout' in getfullargspec(CacheMiddleware.__init__).args:
+    _PAGE_TIMEOUT_KWARG = 'page_timeout'
+# django < 3.2 kept the cache connection of the thread that created it
+_CACHE_MIDDLEWARE_SHAREABLE = isinstance(getattr(CacheMiddleware, 'cache', None), property)
+
+
+def get_cache_middleware(timeout):
+    """
+    Returns a CacheMiddleware like the one cache_page(timeout) builds.
+
+    It doesn't depend on the view, so one is shared by every view using the
+    same timeout instead of building one (and reading the cache settings)
+    per request.
+    """
+    middleware = _cache_middlewares.get(timeout)
+    if middleware is None:
+        # like cache_page, None means '' and the default cache rather than
+        # the CACHE_MIDDLEWARE_KEY_PREFIX and CACHE_MIDDLEWARE_ALIAS settings
+        middleware = CacheMiddleware(_no_response, key_prefix=None, cache_alias=None, **{_PAGE_TIMEOUT_KWARG: timeout})
+        if _CACHE_MIDDLEWARE_SHAREABLE:
+            if len(_cache_middlewares) >= MAX_CACHE_MIDDLEWARES:
+                _cache_middlewares.clear()
+            middleware = _cache_middlewares.setdefault(timeout, middleware)
+    return middleware
+
+
+def _clear_cache_middlewares(setting, **kwargs):
+    # CacheMiddleware reads CACHE_MIDDLEWARE_SECONDS (for a None timeout)
+    # when it's created
+    if setting.startswith('CACHE'):
+        _cache_middlewares.clear()
+
+
+setting_changed.connect(_clear_cache_middlewares)
+
+
 class NeverCacheMixin(object):
 
-    @method_decorator(never_cache)
+    @async_capable(never_cache, _async_never_cache)
     def dispatch(self, *args, **kwargs):
         return super(NeverCacheMixin, self).dispatch(*args, **kwargs)
 
 
 class LoginRequiredMixin(object):
 
-    @method_decorator(login_required)
+    @async_capable(login_required, _async_user_passes_test(lambda user: user.is_authenticated))
     def dispatch(self, *args, **kwargs):
         return super(LoginRequiredMixin, self).dispatch(*args, **kwargs)
 
 
 class StaffMemberRequiredMixin(object):
 
-    @method_decorator(staff_member_required)
+    @async_capable(staff_member_required, _async_user_passes_test(_is_staff_member, login_url='admin:login'))
     def dispatch(self, *args, **kwargs):
         return super(StaffMemberRequiredMixin, self).dispatch(*args, **kwargs)
 
 
 class CSRFExemptMixin(object):
 
-    @method_decorator(csrf_exempt)
+    @async_capable(csrf_exempt, _async_passthrough)
     def dispatch(self, *args, **kwargs):
         return super(CSRFExemptMixin, self).dispatch(*args, **kwargs)
 
 
 class CacheMixin(object):
+    """
+    Caches responses like the cache_page decorator.
+
+    With cache_compress, responses are also compressed with gzip (and
+    brotli, when the brotli package is installed) when they're cached, and
+    requests get the version their Accept-Encoding allows. Responses that
+    won't be cached (private ones, say) are left alone. GZipMiddleware
+    leaves responses with a Content-Encoding alone, so cache hits aren't
+    compressed again on every request.
+    """
     cache_timeout = 60
+    cache_compress = False
 
     def get_cache_timeout(self):
         return self.cache_timeout
 
-    def dispatch(self, *args, **kwargs):
-        return cache_page(self.get_cache_timeout())(super(CacheMixin, self).dispatch)(*args, **kwargs)
+    def dispatch(self, request, *args, **kwargs):
+        # what cache_page does, with a shared middleware
+        if _view_is_async(self):
+            return self._async_cache_dispatch(request, *args, **kwargs)
+        middleware = get_cache_middleware(self.get_cache_timeout())
+        response = middleware.process_request(request)
+        if response is not None:
+            return self._encode_cached_response(request, response)
+
+        response = super(CacheMixin, self).dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.add_post_render_callback(lambda r: self._update_cache(middleware, request, r))
+            return response
+        return self._update_cache(middleware, request, response)
+
+    async def _async_cache_dispatch(self, request, *args, **kwargs):
+        # Only the cache lookup and store go through a thread, since cache
+        # backends are sync. The view itself runs on the event loop.
+        middleware = get_cache_middleware(self.get_cache_timeout())
+        response = await sync_to_async(middleware.process_request)(request)
+        if response is not None:
+            return self._encode_cached_response(request, response)
+
+        response = await super(CacheMixin, self).dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.add_post_render_callback(lambda r: self._update_cache(middleware, request, r))
+            return response
+        return await sync_to_async(self._update_cache)(middleware, request, response)
+
+    def _update_cache(self, middleware, request, response):
+        if self.cache_compress and _will_be_cached(middleware, request, response):
+            _add_compressed_content(response)
+        response = middleware.process_response(request, response)
+        return self._encode_cached_response(request, response)
+
+    def _encode_cached_response(self, request, response):
+        if self.cache_compress:
+            return _encode_response(request, response)
+        return response
 
 
 class CacheControlMixin(object):
+    """
+    Adds Expires and Cache-Control max-age headers for cache_timeout seconds.
+
+    Override get_etag and/or get_last_modified to let clients revalidate:
+    they run before the view, and when the request's If-None-Match or
+    If-Modified-Since matches, a 304 is returned without running the view.
+
+    With auto_etag, responses without an ETag get a weak ETag hashed from
+    their content, so clients with a matching copy get a 304 instead of the
+    body (the view still runs). Streaming responses are left alone.
+    """
     cache_timeout = 60
+    auto_etag = False
 
     def get_cache_timeout(self):
         return self.cache_timeout
 
-    def dispatch(self, *args, **kwargs):
-        response = super(CacheControlMixin, self).dispatch(*args, **kwargs)
+    def get_etag(self):
+        """
+        The ETag of the response, from self.request, self.args and self.kwargs.
+        """
+        return None
+
+    def get_last_modified(self):
+        """
+        A datetime of when the response last changed.
+        """
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if _view_is_async(self):
+            return self._async_cache_control_dispatch(request, *args, **kwargs)
+        etag, last_modified = self._get_validators()
+        response = self._get_conditional_response(request, etag, last_modified)
+        if response is None:
+            response = super(CacheControlMixin, self).dispatch(request, *args, **kwargs)
+            response = self._add_validators(request, response, etag, last_modified)
         patch_response_headers(response, self.get_cache_timeout())
         return response
+
+    async def _async_cache_control_dispatch(self, request, *args, **kwargs):
+        etag = last_modified = None
+        if self._has_validators():
+            # the hooks are likely to query the database
+            etag, last_modified = await sync_to_async(self._get_validators)()
+        response = self._get_conditional_response(request, etag, last_modified)
+        if response is None:
+            response = await super(CacheControlMixin, self).dispatch(request, *args, **kwargs)
+            response = self._add_validators(request, response, etag, last_modified)
+        patch_response_headers(response, self.get_cache_timeout())
+        return response
+
+    def _has_validators(self):
+        view_class = type(self)
+        return view_class.get_etag is not CacheControlMixin.get_etag or (
+            view_class.get_last_modified is not CacheControlMixin.get_last_modified
+        )
+
+    def _get_validators(self):
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        if etag is not None:
+            etag = quote_etag(etag)
+        if last_modified is not None:
+            last_modified = int(timegm(last_modified.utctimetuple()))
+        return etag, last_modified
+
+    def _get_conditional_response(self, request, etag, last_modified):
+        if etag is None and last_modified is None:
+            return None
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def _add_validators(self, request, response, etag, last_modified):
+        if request.method not in ('GET', 'HEAD'):
+            return response
+        if etag is not None and not response.has_header('ETag'):
+            response['ETag'] = etag
+        if last_modified is not None and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified)
+
+        if not self.auto_etag or response.streaming or response.has_header('ETag'):
+            return response
+        if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+            response.add_post_render_callback(lambda r: _add_content_etag(request, r))
+            return response
+        return _add_content_etag(request, response)
+
+
+class StaleWhileRevalidateCacheMixin(object):
+    """
+    Caches GET and HEAD responses like CacheMixin, but only one request at a
+    time regenerates a page:
+
+    - once a cached response is older than cache_timeout, the first request
+      regenerates it while the others keep getting the old (stale) response,
+      for up to cache_grace_period more seconds.
+    - when nothing is cached, the first request generates the page and the
+      others wait up to cache_lock_wait seconds for it before generating it
+      themselves.
+
+    The regeneration lock is a cache key added with cache.add, so it works
+    across processes with a shared cache backend.
+    """
+    cache_timeout = 60
+    cache_grace_period = 60
+    cache_lock_timeout = 30
+    cache_lock_wait = 5
+    cache_alias = DEFAULT_CACHE_ALIAS
+    cache_key_prefix = ''
+
+    lock_poll_interval = 0.05
+
+    def get_cache_timeout(self):
+        return self.cache_timeout
+
+    def dispatch(self, request, *args, **kwargs):
+        if _view_is_async(self):
+            return self._async_stale_cache_dispatch(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD'):
+            return super(StaleWhileRevalidateCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        waited = 0
+        while True:
+            response, locked = self._get_cached_response(request)
+            if response is not None:
+                return response
+            if locked or waited >= self.cache_lock_wait:
+                break
+            time.sleep(self.lock_poll_interval)
+            waited += self.lock_poll_interval
+
+        try:
+            response = super(StaleWhileRevalidateCacheMixin, self).dispatch(request, *args, **kwargs)
+        except BaseException:
+            self._release_lock(request, locked)
+            raise
+        return self._cache_response(request, response, locked)
+
+    async def _async_stale_cache_dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await super(StaleWhileRevalidateCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        waited = 0
+        while True:
+            response, locked = await sync_to_async(self._get_cached_response)(request)
+            if response is not None:
+                return response
+            if locked or waited >= self.cache_lock_wait:
+                break
+            await asyncio.sleep(self.lock_poll_interval)
+            waited += self.lock_poll_interval
+
+        try:
+            response = await super(StaleWhileRevalidateCacheMixin, self).dispatch(request, *args, **kwargs)
+        except BaseException:
+            await sync_to_async(self._release_lock)(request, locked)
+            raise
+        return await sync_to_async(self._cache_response)(request, response, locked)
+
+    def _get_cached_response(self, request):
+        """
+        Returns (response, locked). The response is None when this request
+        has to generate the page, and locked tells whether it got the lock.
+        """
+        cache = caches[self.cache_alias]
+        key = get_cache_key(request, self.cache_key_prefix, request.method, cache=cache)
+        entry = cache.get(key) if key is not None else None
+        if entry is not None:
+            fresh_until, response = entry
+            if time.time() < fresh_until:
+                return response, False
+
+        locked = cache.add(self._lock_key(request), True, self.cache_lock_timeout)
+        if entry is not None and not locked:
+            # someone else is regenerating it
+            return response, False
+        return None, locked
+
+    def _cache_response(self, request, response, locked):
+        if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+            response.add_post_render_callback(lambda r: self._store_response(request, r, locked))
+            return response
+        return self._store_response(request, response, locked)
+
+    def _store_response(self, request, response, locked):
+        try:
+            if self._should_cache(request, response):
+                cache = caches[self.cache_alias]
+                timeout = self.get_cache_timeout()
+                patch_response_headers(response, timeout)
+                stored_timeout = timeout + self.cache_grace_period
+                key = learn_cache_key(request, response, stored_timeout, self.cache_key_prefix, cache=cache)
+                cache.set(key, (time.time() + timeout, response), stored_timeout)
+        finally:
+            self._release_lock(request, locked)
+        return response
+
+    def _should_cache(self, request, response):
+        return _is_cacheable(request, response)
+
+    def _release_lock(self, request, locked):
+        if locked:
+            caches[self.cache_alias].delete(self._lock_key(request))
+
+    def _lock_key(self, request):
+        url = hashlib.sha256(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        return 'web_utils.stale_cache.lock.{0}.{1}'.format(self.cache_key_prefix, url)
+
+
+class FragmentCacheMixin(object):
+    """
+    Caches a page once for all users, with the user specific parts, marked
+    with {% user_fragment %} (see fragment_tags), cached per user.
+
+    The page is cached for get_cache_timeout() seconds and fragments for
+    get_fragment_cache_timeout() seconds, per path and under the key from
+    get_fragment_user_key (anonymous users' fragments aren't cached).
+    Everything outside of fragments is shared, so it must not depend on the
+    user (e.g. no csrf tokens).
+
+    The page is cached per URL and per value of the headers the response
+    varies on, except Cookie, which the fragments take care of. Like with
+    CacheMiddleware, private responses and responses setting cookies for
+    requests without any aren't cached.
+    """
+    cache_timeout = 60
+    cache_alias = DEFAULT_CACHE_ALIAS
+    cache_key_prefix = ''
+
+    def get_cache_timeout(self):
+        return self.cache_timeout
+
+    def get_fragment_cache_timeout(self):
+        return self.get_cache_timeout()
+
+    def get_fragment_user_key(self, request):
+        """
+        Identifies the user's fragments, override to add a version that
+        changes when a user's fragments should be rendered again. Returns
+        None for anonymous users, whose fragments aren't cached.
+        """
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return force_str(user.pk)
+
+    def dispatch(self, request, *args, **kwargs):
+        if _view_is_async(self):
+            return self._async_fragment_cache_dispatch(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD'):
+            return super(FragmentCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        response = self._get_cached_page(request)
+        if response is not None:
+            return response
+        setattr(request, fragments.CACHING_ATTRIBUTE, True)
+        try:
+            response = super(FragmentCacheMixin, self).dispatch(request, *args, **kwargs)
+        finally:
+            setattr(request, fragments.CACHING_ATTRIBUTE, False)
+        return self._cache_page(request, response)
+
+    async def _async_fragment_cache_dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await super(FragmentCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        response = await sync_to_async(self._get_cached_page)(request)
+        if response is not None:
+            return response
+        setattr(request, fragments.CACHING_ATTRIBUTE, True)
+        try:
+            response = await super(FragmentCacheMixin, self).dispatch(request, *args, **kwargs)
+        finally:
+            setattr(request, fragments.CACHING_ATTRIBUTE, False)
+        return await sync_to_async(self._cache_page)(request, response)
+
+    def _get_cached_page(self, request):
+        cache = caches[self.cache_alias]
+        headers = cache.get(self._headers_key(request))
+        entry = cache.get(self._page_key(request, headers)) if headers is not None else None
+        if entry is None:
+            return None
+
+        content, response_headers = entry
+        response = HttpResponse(self._render_fragments(request, content))
+        for header, value in response_headers:
+            response[header] = value
+        return response
+
+    def _cache_page(self, request, response):
+        if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+            response.add_post_render_callback(lambda r: self._store_page(request, r))
+            self._render_for_cache(request, response)
+            return response
+        return self._store_page(request, response)
+
+    def _render_for_cache(self, request, response):
+        # Template responses are rendered after dispatch, so fragments are
+        # only left out while they are, even when rendering fails.
+        render = response.render
+
+        def render_for_cache():
+            del response.render
+            setattr(request, fragments.CACHING_ATTRIBUTE, True)
+            try:
+                return render()
+            finally:
+                setattr(request, fragments.CACHING_ATTRIBUTE, False)
+        response.render = render_for_cache
+
+    def _store_page(self, request, response):
+        setattr(request, fragments.CACHING_ATTRIBUTE, False)
+        if response.streaming:
+            return response
+
+        content = response.content.decode(response.charset)
+        vary = [header.strip() for header in response.get('Vary', '').split(',') if header.strip()]
+        cacheable = _is_cacheable(request, response) and not getattr(request, fragments.UNCACHEABLE_ATTRIBUTE, False)
+        if '*' not in vary and cacheable:
+            headers = [header for header in vary if header.lower() != 'cookie']
+            # cookies aren't in items(), so the user's session doesn't leak
+            response_headers = [
+                (header, value) for header, value in response.items() if header.lower() != 'content-length'
+            ]
+            cache = caches[self.cache_alias]
+            timeout = self.get_cache_timeout()
+            cache.set(self._headers_key(request), headers, timeout)
+            cache.set(self._page_key(request, headers), (content, response_headers), timeout)
+
+        response.content = self._render_fragments(request, content)
+        return response
+
+    def _render_fragments(self, request, content):
+        return fragments.render_user_fragments(
+            request, content, self.get_fragment_user_key(request), caches[self.cache_alias],
+            self.get_fragment_cache_timeout(),
+        )
+
+    def _headers_key(self, request):
+        url = hashlib.sha256(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        return 'web_utils.fragment_page.headers.{0}.{1}'.format(self.cache_key_prefix, url)
+
+    def _page_key(self, request, headers):
+        values = hashlib.sha256()
+        values.update(request.build_absolute_uri().encode('utf-8'))
+        for header in headers:
+            meta_name = 'HTTP_' + header.upper().replace('-', '_')
+            values.update(b'\n' + force_str(request.META.get(meta_name, '')).encode('utf-8'))
+        return 'web_utils.fragment_page.{0}.{1}.{2}'.format(self.cache_key_prefix, request.method, values.hexdigest())
+
+
+# spreadsheets run cells starting with these as formulas
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class StreamingExportMixin(object):
+    """
+    Streams the view's queryset as CSV or NDJSON (newline delimited JSON)
+    on GET, so exports of any size don't have to fit in memory.
+
+    The export_fields (anything values_list takes, like 'customer__name')
+    are read with queryset.iterator(chunk_size=export_chunk_size), and the
+    rows are written out in chunks of about export_buffer_size characters.
+    CSV money_fields are formatted with format_currency (empty for None);
+    NDJSON keeps the numbers. CSV text starting with =, +, -, @, tab or
+    carriage return gets a leading ' so spreadsheets don't run it as a
+    formula.
+
+    The format is export_format unless the request has another one in its
+    export_format_param GET parameter.
+
+        class OrderExport(StaffMemberRequiredMixin, StreamingExportMixin, ListView):
+            model = Order
+            export_fields = ('number', 'customer__email', 'total')
+            money_fields = ('total', )
+    """
+    export_fields = ()
+    export_headers = None
+    money_fields = ()
+    export_currency = 'USD'
+    export_locale = 'en_US'
+    export_format = 'csv'
+    export_format_param = 'format'
+    export_filename = 'export'
+    export_chunk_size = 2000
+    export_buffer_size = 64 * 1024
+
+    def get_export_fields(self):
+        return self.export_fields
+
+    def get_export_headers(self):
+        """
+        The CSV header row, the field names by default.
+        """
+        return self.export_headers or self.get_export_fields()
+
+    def get_export_queryset(self):
+        return self.get_queryset()
+
+    def get_export_format(self):
+        return self.request.GET.get(self.export_format_param, self.export_format)
+
+    def get_export_filename(self, export_format):
+        return '{0}.{1}'.format(self.export_filename, export_format)
+
+    def get(self, request, *args, **kwargs):
+        export_format = self.get_export_format()
+        if export_format not in EXPORT_CONTENT_TYPES:
+            raise Http404("Unknown export format {0}".format(export_format))
+
+        fields = list(self.get_export_fields())
+        rows = self.get_export_queryset().values_list(*fields).iterator(chunk_size=self.export_chunk_size)
+        if export_format == 'csv':
+            content = self._csv_chunks(fields, rows)
+        else:
+            content = self._ndjson_chunks(fields, rows)
+
+        response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+            self.get_export_filename(export_format)
+        )
+        return response
+
+    def _csv_chunks(self, fields, rows):
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.get_export_headers())
+        money_columns = [i for i, field in enumerate(fields) if field in self.money_fields]
+        for row in rows:
+            row = [_csv_cell(value) for value in row]
+            for i in money_columns:
+                if row[i] is None:
+                    row[i] = ''
+                else:
+                    row[i] = format_currency(row[i], currency=self.export_currency, locale=self.export_locale)
+            writer.writerow(row)
+            if buffer.tell() >= self.export_buffer_size:
+                yield self._flush(buffer)
+        if buffer.tell():
+            yield self._flush(buffer)
+
+    def _ndjson_chunks(self, fields, rows):
+        buffer = StringIO()
+        encoder = DjangoJSONEncoder()
+        for row in rows:
+            buffer.write(encoder.encode(dict(zip(fields, row))))
+            buffer.write('\n')
+            if buffer.tell() >= self.export_buffer_size:
+                yield self._flush(buffer)
+        if buffer.tell():
+            yield self._flush(buffer)
+
+    def _flush(self, buffer):
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
@@ -0,0 +1,79 @@
+"""
+Helpers for template tags that do their argument handling when the template
+is compiled instead of on every render.
+"""
+from inspect import getfullargspec
+
+from django import template
+from django.template.library import parse_bits
+from django.utils.html import conditional_escape
+
+
+def is_literal(filter_expression):
+    """
+    True when filter_expression is a literal without filters, like 2 or
+    "True", so its value can't change between renders.
+    """
+    var = filter_expression.var
+    if filter_expression.filters:
+        return False
+    if isinstance(var, template.Variable):
+        return var.literal is not None and not var.translate
+    return True
+
+
+def literal_value(filter_expression):
+    var = filter_expression.var
+    return var.literal if isinstance(var, template.Variable) else var
+
+
+def parse_tag(parser, token, func, takes_context=False):
+    """
+    Parses the arguments of a tag the way simple_tag does for func (leaving
+    out its first, context, parameter when takes_context is True).
+
+    Returns (arguments, target_var) where arguments maps each of func's
+    parameters used by the tag to its FilterExpression (a list of them for
+    *args), and target_var is the name given with "as", or None.
+    """
+    bits = token.split_contents()
+    name, bits = bits[0], bits[1:]
+    target_var = None
+    if len(bits) >= 2 and bits[-2] == 'as':
+        target_var = bits[-1]
+        bits = bits[:-2]
+
+    params, varargs, varkw, defaults, kwonly, kwonly_defaults, _ = getfullargspec(func)
+    args, kwargs = parse_bits(
+        parser, bits, params, varargs, varkw, defaults, kwonly, kwonly_defaults, takes_context, name
+    )
+    if takes_context:
+        params = params[1:]
+    arguments = dict(zip(params, args))
+    if varargs:
+        arguments[varargs] = args[len(params):]
+    arguments.update(kwargs)
+    return arguments, target_var
+
+
+class CompiledTagNode(template.Node):
+    """
+    Base node handling "as" and autoescaping like simple_tag's SimpleNode.
+    Subclasses implement render_tag(context), returning the tag's output.
+    """
+    child_nodelists = ()
+
+    def __init__(self, target_var=None):
+        self.target_var = target_var
+
+    def render_tag(self, context):
+        raise NotImplementedError("{0} must implement render_tag(context)".format(type(self).__name__))
+
+    def render(self, context):
+        output = self.render_tag(context)
+        if self.target_var is not None:
+            context[self.target_var] = output
+            return ''
+        if context.autoescape:
+            output = conditional_escape(output)
+        return output
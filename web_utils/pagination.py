@@ -0,0 +1,294 @@
+"""
+Paginators that don't need an exact COUNT(*) of the queryset.
+"""
+import base64
+import binascii
+import datetime
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.paginator import EmptyPage, InvalidPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections
+from django.db.models import F, OrderBy, Q
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from django.utils.functional import cached_property
+
+NEXT, PREVIOUS = 'n', 'p'
+
+# {tag: parser} for values CursorEncoder writes as {tag: isoformat}
+CURSOR_PARSERS = {'dt': parse_datetime, 'd': parse_date, 't': parse_time}
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder cuts datetimes and times down to milliseconds, which
+    would make pages repeat or skip rows with the same millisecond. These
+    keep their microseconds and are tagged so decode_cursor parses them back.
+    """
+
+    def default(self, o):
+        # datetime is a subclass of date
+        if isinstance(o, datetime.datetime):
+            return {'dt': o.isoformat()}
+        if isinstance(o, datetime.date):
+            return {'d': o.isoformat()}
+        if isinstance(o, datetime.time):
+            return {'t': o.isoformat()}
+        return super(CursorEncoder, self).default(o)
+
+
+def _parse_cursor_value(obj):
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        parsed = CURSOR_PARSERS[tag](value) if tag in CURSOR_PARSERS and isinstance(value, str) else None
+        if parsed is not None:
+            return parsed
+    raise ValueError("Invalid cursor value")
+
+
+def encode_cursor(direction, values):
+    data = json.dumps([direction, list(values)], cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns (direction, values) for a cursor made by encode_cursor.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor.encode('ascii') + b'=' * (-len(cursor) % 4))
+        direction, values = json.loads(data.decode('utf-8'), object_hook=_parse_cursor_value)
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise InvalidPage("Invalid cursor")
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        raise InvalidPage("Invalid cursor")
+    return direction, values
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a queryset by filtering on the values of its ordering fields
+    (keyset or cursor pagination) instead of with OFFSET, so pages deep into
+    big tables are as fast as the first one and nothing is counted.
+
+    Pages are addressed by cursors rather than numbers:
+
+    page = KeysetPaginator(Entry.objects.all(), 20, ordering=('-published', )).page(request.GET.get('cursor'))
+
+    The ordering fields shouldn't be nullable. The primary key is added to
+    the ordering when it's missing, so the ordering is unique. Orderings are
+    field names, F() or F().asc()/desc(); other expressions raise
+    ImproperlyConfigured.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+
+        ordering = [
+            self._field_ordering(order)
+            for order in ordering or queryset.query.order_by or queryset.model._meta.ordering
+        ]
+        fields = [name.lstrip('-') for name in ordering]
+        if 'pk' not in fields and queryset.model._meta.pk.name not in fields:
+            ordering.append('-pk' if ordering and ordering[0].startswith('-') else 'pk')
+        self.ordering = tuple(ordering)
+        self.keys = tuple((name.lstrip('-'), name.startswith('-')) for name in self.ordering)
+
+    def _field_ordering(self, order):
+        if isinstance(order, str) and order != '?':
+            return order
+        if isinstance(order, F):
+            return order.name
+        if isinstance(order, OrderBy) and isinstance(order.expression, F):
+            return ('-' if order.descending else '') + order.expression.name
+        raise ImproperlyConfigured("KeysetPaginator can only order by fields, not {0!r}".format(order))
+
+    def page(self, cursor=None):
+        """
+        Returns the KeysetPage for cursor, the first page when it's empty.
+        """
+        if not cursor:
+            direction, values = NEXT, None
+        else:
+            direction, values = decode_cursor(cursor)
+            if len(values) != len(self.keys):
+                raise InvalidPage("Invalid cursor")
+
+        backwards = direction == PREVIOUS
+        queryset = self.queryset.order_by(*self._ordering(backwards))
+        try:
+            if values is not None:
+                queryset = queryset.filter(self._after(values, backwards))
+            # one extra row tells whether there is another page
+            object_list = list(queryset[:self.per_page + 1])
+        except (ValueError, TypeError, ValidationError):
+            if values is None:
+                raise
+            # cursor values that don't fit their fields
+            raise InvalidPage("Invalid cursor")
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if backwards:
+            object_list.reverse()
+            return KeysetPage(object_list, self, has_next=True, has_previous=has_more)
+        return KeysetPage(object_list, self, has_next=has_more, has_previous=values is not None)
+
+    def get_cursor(self, direction, obj):
+        values = []
+        for name, _ in self.keys:
+            value = obj
+            for attr in name.split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return encode_cursor(direction, values)
+
+    def _ordering(self, backwards):
+        if not backwards:
+            return self.ordering
+        return tuple(name if descending else '-' + name for name, descending in self.keys)
+
+    def _after(self, values, backwards):
+        """
+        The rows coming after values in the (backwards) ordering:
+        (a > 1) OR (a = 1 AND b > 2) OR ...
+        """
+        condition = Q()
+        for i, (name, descending) in enumerate(self.keys):
+            lookup = '__lt' if descending != backwards else '__gt'
+            row_condition = Q(**{name + lookup: values[i]})
+            for (previous_name, _), value in zip(self.keys[:i], values):
+                row_condition &= Q(**{previous_name: value})
+            condition |= row_condition
+        return condition
+
+
+class KeysetPage(Sequence):
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<KeysetPage of {0} objects>'.format(len(self))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return self.paginator.get_cursor(NEXT, self.object_list[-1])
+
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return self.paginator.get_cursor(PREVIOUS, self.object_list[0])
+
+
+def estimate_count(queryset):
+    """
+    Returns the number of rows in queryset as estimated from the database
+    statistics, or None when there are none to go by.
+
+    The table statistics are only used for querysets of every row of the
+    table: unfiltered, ungrouped, not distinct, sliced or combined.
+    PostgreSQL uses the table's reltuples, or the planner's estimate for
+    other querysets. SQLite uses sqlite_stat1 (kept up to date by ANALYZE),
+    and has no estimate for other querysets.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    query = queryset.query
+    filtered = (
+        bool(query.where) or query.distinct or query.group_by is not None or bool(query.combinator)
+        or not query.can_filter()
+    )
+
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                if filtered:
+                    plan = json.loads(queryset.explain(format='json'))
+                    return int(plan[0]['Plan']['Plan Rows'])
+                cursor.execute("SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)", [table])
+                row = cursor.fetchone()
+            elif connection.vendor == 'sqlite' and not filtered:
+                # sqlite_stat1 only exists once the database was analyzed
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                row = cursor.fetchone()
+                # the first number of stat is the number of rows
+                row = row and (row[0].split()[0], )
+            else:
+                return None
+    except DatabaseError:
+        return None
+
+    # reltuples is -1 (or 0 before postgres 14) for tables never analyzed
+    if not row or row[0] is None or int(float(row[0])) <= 0:
+        return None
+    return int(float(row[0]))
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator using estimate_count instead of COUNT(*) for querysets of at
+    least `exact_count_below` rows, where counting is slow and an approximate
+    number of pages is good enough.
+
+    Pages past the estimated last page are served as long as they have
+    objects, orphans aren't merged into the estimated last page.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, exact_count_below=10000):
+        super(EstimatedCountPaginator, self).__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.exact_count_below = exact_count_below
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = None
+        if hasattr(self.object_list, 'query'):
+            estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < self.exact_count_below:
+            return super(EstimatedCountPaginator, self).count
+        self.estimated = True
+        return estimate
+
+    def validate_number(self, number):
+        try:
+            return super(EstimatedCountPaginator, self).validate_number(number)
+        except EmptyPage:
+            # past the estimated last page, page() checks there are objects
+            if not self.estimated or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super(EstimatedCountPaginator, self).page(number)
+        bottom = (number - 1) * self.per_page
+        object_list = self.object_list[bottom:bottom + self.per_page]
+        if number > 1 and not len(object_list):
+            raise EmptyPage("That page contains no results")
+        return self._get_page(object_list, number, self)
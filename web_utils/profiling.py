@@ -0,0 +1,176 @@
+"""
+Opt-in render time profiling for the web_utils template tags.
+
+install() wraps the compile functions of the tags in web_utils.templatetags
+so the nodes they compile time their renders. Timings are only recorded
+while profile_tags() (or TemplateProfilingMiddleware) is active, otherwise
+a render costs one ContextVar lookup more. Templates compiled before
+install() (like ones already in the cached loader) aren't profiled.
+
+Render times are inclusive, so a block tag's time includes its contents.
+"""
+import importlib
+import pkgutil
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+import web_utils.templatetags
+
+# samples kept per tag and template for the 95th percentile
+MAX_SAMPLES = 1000
+
+UNKNOWN_TEMPLATE = '<unknown>'
+
+_active_stats = ContextVar('web_utils_tag_stats', default=None)
+
+
+class TagTiming(object):
+    """
+    Call count, cumulative time and recent samples (in seconds) for a tag.
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.samples.extend(other.samples)
+
+    @property
+    def p95(self):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+
+
+class TagStats(object):
+    """
+    Timings for the profiled tags, per tag and template.
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.timings = {}
+
+    def add(self, tag_name, template_name, seconds):
+        key = (tag_name, template_name)
+        timing = self.timings.get(key)
+        if timing is None:
+            timing = self.timings[key] = TagTiming(self.max_samples)
+        timing.add(seconds)
+
+    def by_template(self):
+        """
+        Returns [((tag_name, template_name), TagTiming)], slowest first.
+        """
+        return sorted(self.timings.items(), key=lambda item: item[1].total, reverse=True)
+
+    def by_tag(self):
+        """
+        Returns [(tag_name, TagTiming)] for all templates, slowest first.
+        """
+        tags = {}
+        for (tag_name, _), timing in self.timings.items():
+            tags.setdefault(tag_name, TagTiming(max_samples=None)).merge(timing)
+        return sorted(tags.items(), key=lambda item: item[1].total, reverse=True)
+
+    def server_timing(self):
+        """
+        The timings per tag as a Server-Timing header value.
+        """
+        return ", ".join(
+            '{0};dur={1:.3f};desc="{2} calls, p95 {3:.3f}ms"'.format(
+                tag_name, timing.total * 1000, timing.count, timing.p95 * 1000
+            )
+            for tag_name, timing in self.by_tag()
+        )
+
+
+@contextmanager
+def profile_tags(stats=None):
+    """
+    Records the renders of profiled tags in the block into stats (a new
+    TagStats by default), which it yields.
+
+    with profile_tags() as stats:
+        template.render(context)
+    """
+    if stats is None:
+        stats = TagStats()
+    token = _active_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+def _profiled_render(tag_name, node):
+    render = node.render
+
+    def profiled_render(context):
+        stats = _active_stats.get()
+        if stats is None:
+            return render(context)
+        start = perf_counter()
+        try:
+            return render(context)
+        finally:
+            template_name = getattr(getattr(node, 'origin', None), 'template_name', None)
+            stats.add(tag_name, template_name or UNKNOWN_TEMPLATE, perf_counter() - start)
+    return profiled_render
+
+
+def _profiled_compile_function(tag_name, compile_function):
+    @wraps(compile_function)
+    def compile_tag(parser, token):
+        node = compile_function(parser, token)
+        node.render = _profiled_render(tag_name, node)
+        return node
+    compile_tag.unprofiled = compile_function
+    return compile_tag
+
+
+def get_libraries():
+    """
+    The template tag libraries in web_utils.templatetags.
+    """
+    libraries = []
+    for module_info in pkgutil.iter_modules(web_utils.templatetags.__path__):
+        module = importlib.import_module('web_utils.templatetags.' + module_info.name)
+        library = getattr(module, 'register', None)
+        if library is not None:
+            libraries.append(library)
+    return libraries
+
+
+def install():
+    """
+    Wraps the web_utils tags so the nodes compiled from now on are profiled.
+    Calling it again does nothing.
+    """
+    for library in get_libraries():
+        for tag_name, compile_function in library.tags.items():
+            if not hasattr(compile_function, 'unprofiled'):
+                library.tags[tag_name] = _profiled_compile_function(tag_name, compile_function)
+
+
+def uninstall():
+    """
+    Puts back the tags' own compile functions. Templates compiled while
+    installed stay profiled.
+    """
+    for library in get_libraries():
+        for tag_name, compile_function in library.tags.items():
+            library.tags[tag_name] = getattr(compile_function, 'unprofiled', compile_function)
@@ -0,0 +1,219 @@
+"""
+Rate limiting with in-process token buckets, see RateLimiter, the
+rate_limit decorator and RateLimitMiddleware.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+try:
+    from asgiref.sync import iscoroutinefunction
+except ImportError:
+    from asyncio import iscoroutinefunction
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.encoding import force_str
+
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+@lru_cache(maxsize=64)
+def parse_rate(rate):
+    """
+    Parses a rate like '100/m' or '1000/5m' into (requests, seconds).
+    The units are s, m, h and d.
+    """
+    match = RATE_RE.match(rate)
+    if match is None:
+        raise ValueError("Invalid rate {0!r}, use requests/period like '100/m'".format(rate))
+    requests, multiplier, unit = match.groups()
+    return int(requests), int(multiplier or 1) * PERIODS[unit]
+
+
+class RateLimiter(object):
+    """
+    Allows `rate` requests (see parse_rate) per key.
+
+    Each key has a token bucket holding up to the rate's number of requests
+    and refilling continuously, so a key can burst the whole rate and then
+    gets an even share of it. A request costs a lock, one dict lookup and
+    some arithmetic. At most maxsize buckets are kept: when a new key
+    doesn't fit, buckets that have filled up again (or whose window ended,
+    with a cache_alias), so are no different from new ones, are swept. When
+    that doesn't free a tenth of maxsize, the least recently used buckets
+    are dropped until it does, so sweeps are rare even when new keys keep
+    coming, and a flood of new keys drops expired buckets before ones that
+    are still limited.
+
+    With a cache_alias, the limit is shared by every process using that
+    cache. Processes take tokens from the cache in batches of batch_size
+    (a tenth of the rate by default) for fixed windows of the rate's period,
+    and only go back to the cache when their batch runs out, or to learn
+    that a key is over the limit until the window ends. Tokens a process
+    took but didn't use are lost when the window ends.
+
+    Buckets are only changed under a lock, so a limiter can be shared by
+    threads. The cache isn't called under it.
+    """
+
+    def __init__(self, rate, maxsize=10000, cache_alias=None, batch_size=None, key_prefix='web_utils.ratelimit'):
+        self.limit, self.period = parse_rate(rate)
+        self.rate = rate
+        self.refill_rate = float(self.limit) / self.period
+        self.maxsize = maxsize
+        self.cache_alias = cache_alias
+        self.batch_size = batch_size or max(self.limit // 10, 1)
+        self.key_prefix = key_prefix
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweep_batch = max(maxsize // 10, 1)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def hit(self, key):
+        """
+        Takes a request for key. Returns 0 when it's allowed, otherwise the
+        seconds until a request for key would be.
+        """
+        if self.cache_alias is not None:
+            return self._shared_hit(key)
+
+        now = time.monotonic()
+        with self._lock:
+            # [tokens, last update]
+            bucket = self._get_bucket(key)
+            if bucket is None:
+                self._add_bucket(key, [self.limit - 1, now], now)
+                return 0
+
+            tokens = min(self.limit, bucket[0] + (now - bucket[1]) * self.refill_rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            return (1 - tokens) / self.refill_rate
+
+    def _shared_hit(self, key):
+        now = time.time()
+        with self._lock:
+            # [tokens taken from the cache and not used, end of the window]
+            bucket = self._get_bucket(key)
+            if bucket is not None and bucket[1] > now:
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                    return 0
+                if bucket[0] < 0:
+                    # the cache said the key is over the limit for this window
+                    return bucket[1] - now
+
+        window = int(now // self.period)
+        window_end = (window + 1) * self.period
+        hashed_key = hashlib.md5(force_str(key).encode('utf-8')).hexdigest()
+        tokens = self._take_tokens('{0}.{1}.{2}.{3}'.format(self.key_prefix, self.rate, hashed_key, window))
+        with self._lock:
+            bucket = self._get_bucket(key)
+            if bucket is None:
+                bucket = self._add_bucket(key, [0, window_end], now)
+            elif bucket[1] == window_end and bucket[0] > 0:
+                # another thread took a batch for this window meanwhile
+                tokens += bucket[0]
+            bucket[1] = window_end
+            if tokens < 1:
+                bucket[0] = -1
+                return window_end - now
+            bucket[0] = tokens - 1
+            return 0
+
+    def _take_tokens(self, cache_key):
+        cache = caches[self.cache_alias]
+        cache.add(cache_key, 0, self.period + 1)
+        try:
+            taken = cache.incr(cache_key, self.batch_size)
+        except ValueError:
+            # expired between add and incr
+            cache.add(cache_key, self.batch_size, self.period + 1)
+            taken = self.batch_size
+        return min(self.batch_size, self.limit - (taken - self.batch_size))
+
+    def _get_bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _add_bucket(self, key, bucket, now):
+        if len(self._buckets) >= self.maxsize:
+            self._sweep(now)
+        self._buckets[key] = bucket
+        return bucket
+
+    def _sweep(self, now):
+        if self.cache_alias is None:
+            expired = [
+                key for key, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.refill_rate >= self.limit
+            ]
+        else:
+            expired = [key for key, (tokens, window_end) in self._buckets.items() if window_end <= now]
+        for key in expired:
+            del self._buckets[key]
+
+        # free a batch, so the next sweep is a batch of new keys away
+        while len(self._buckets) > self.maxsize - self._sweep_batch:
+            self._buckets.popitem(last=False)
+
+
+def get_client_ip(request):
+    """
+    The default rate limit key. Behind a proxy, use a key function that
+    reads the address the proxy forwards instead.
+    """
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse("Too many requests", status=429, content_type='text/plain')
+    response['Retry-After'] = str(int(math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(rate, key=get_client_ip, maxsize=10000, cache_alias=None):
+    """
+    Limits a view to `rate` requests per key(request) (the client's address
+    by default), responding with a 429 otherwise, e.g.
+
+    @rate_limit('10/m')
+    def login(request):
+        ...
+
+    Every view decorated gets limits of its own, including the views
+    decorated through decorated_patterns(rate_limit('100/m'), [...]).
+    """
+    def decorator(view_func):
+        limiter = RateLimiter(rate, maxsize=maxsize, cache_alias=cache_alias)
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_wrapped_view(request, *args, **kwargs):
+                retry_after = limiter.hit(key(request))
+                if retry_after:
+                    return too_many_requests(retry_after)
+                return await view_func(request, *args, **kwargs)
+            return _async_wrapped_view
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            retry_after = limiter.hit(key(request))
+            if retry_after:
+                return too_many_requests(retry_after)
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,334 @@
+"""
+Builds sitemap files ahead of time instead of rendering sitemaps per
+request, for sites with too many urls for django's sitemap view.
+
+Each django.contrib.sitemaps.Sitemap is written as shards of up to
+shard_size urls, with a sitemap index listing every shard. Querysets are
+sharded by primary key, so an object always lands in the same shard, and
+when an object changes only its shard is written again.
+"""
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from xml.sax.saxutils import escape
+
+try:
+    from urlparse import urljoin
+except ImportError:
+    from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import AutoField, F, IntegerField, QuerySet
+from django.db.models.functions import Mod
+from django.utils.module_loading import import_string
+
+from web_utils.web import get_sitemap_pinger
+
+# the sitemap protocol allows 50,000 urls per file
+MAX_SHARD_SIZE = 50000
+
+# files are kept in memory up to this size while they're written
+SPOOL_SIZE = 1024 * 1024
+
+URLSET_START = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+URLSET_END = '</urlset>\n'
+INDEX_START = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+INDEX_END = '</sitemapindex>\n'
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedSitemapBuilder(object):
+    """
+    Writes sitemaps, a dict of name: Sitemap (class or instance) like the
+    one django's sitemap views take, to storage under location:
+
+    sitemap.xml - the index
+    <name>-<shard>.xml - a shard
+
+    A Sitemap whose items() is a queryset of a model with an integer
+    primary key is sharded by primary key, shard n holding the objects with
+    pk n * shard_size up to (n + 1) * shard_size. Its items() mustn't be
+    sliced. Only shards with objects are written and indexed, and shards
+    whose objects are all gone are deleted. Other sitemaps are written as
+    one shard.
+
+    mark_changed(instance) flags the shards holding an object in the cache,
+    and build() writes the flagged shards (and the ones that don't exist
+    yet), then the index. Sitemaps whose items() isn't a queryset can't be
+    flagged, so every build renders them and writes them when they differ
+    from the saved file. Urls are written as they're read, through a
+    temporary file, so memory use doesn't grow with the number of urls.
+    """
+    index_name = 'sitemap.xml'
+
+    def __init__(self, sitemaps, domain, storage=None, location='sitemaps', shard_size=MAX_SHARD_SIZE,
+                 cache_alias=DEFAULT_CACHE_ALIAS, chunk_size=2000):
+        if shard_size > MAX_SHARD_SIZE:
+            raise ValueError("Sitemaps can't have more than {0} urls".format(MAX_SHARD_SIZE))
+        self.sitemaps = {
+            name: sitemap() if isinstance(sitemap, type) else sitemap for name, sitemap in sitemaps.items()
+        }
+        self.domain = domain
+        self.storage = storage or default_storage
+        self.location = location
+        self.shard_size = shard_size
+        self.cache_alias = cache_alias
+        self.chunk_size = chunk_size
+
+    def mark_changed(self, instance):
+        """
+        Flags the shards holding instance to be written by the next build.
+        """
+        keys = []
+        for name, sitemap in self.sitemaps.items():
+            items = self._get_items(sitemap)
+            # proxies and subclasses of the sitemap's model are in it too
+            if self._is_tracked(items) and isinstance(instance, items.model._meta.concrete_model):
+                keys.append(self._changed_key(name, self.get_shard(instance) if self._is_sharded(items) else 0))
+        if keys:
+            caches[self.cache_alias].set_many(dict.fromkeys(keys, True), None)
+
+    def get_shard(self, instance):
+        return instance.pk // self.shard_size
+
+    def build(self, full=False):
+        """
+        Writes the changed and missing shards, or all of them when full is
+        True, and the index. Returns the number of shards written.
+        """
+        cache = caches[self.cache_alias]
+        shards = {name: self.get_shards(sitemap) for name, sitemap in self.sitemaps.items()}
+        indexed = cache.get(self._indexed_key())
+        # with the last index's shards, so flags of emptied shards are cleared
+        changed_keys = {
+            self._changed_key(name, shard)
+            for all_shards in (shards, indexed or {}) for name, numbers in all_shards.items() for shard in numbers
+        }
+        # claimed before writing, so changes made while building flag their shard again
+        changed = cache.get_many(changed_keys)
+        cache.delete_many(list(changed))
+
+        written = []
+        try:
+            for name, numbers in shards.items():
+                # sitemaps of anything but a queryset can't be marked changed
+                tracked = self._is_tracked(self._get_items(self.sitemaps[name]))
+                for shard in numbers:
+                    key = self._changed_key(name, shard)
+                    if full or key in changed or not self.storage.exists(self.get_file_name(name, shard)):
+                        self.write_shard(name, shard)
+                        written.append(key)
+                    elif not tracked and self.write_shard(name, shard, only_if_changed=True):
+                        written.append(key)
+        except Exception:
+            # flag the claimed shards that weren't written again
+            cache.set_many(dict.fromkeys(set(changed) - set(written), True), None)
+            raise
+
+        if written or shards != indexed or not self.storage.exists(self.get_file_name()):
+            self.write_index(shards)
+            cache.set(self._indexed_key(), shards, None)
+            self._delete_emptied_shards(indexed, shards)
+            logger.info("Wrote %s sitemap shards and the index", len(written))
+            if getattr(settings, 'PING_GOOGLE_SITEMAP', False):
+                get_sitemap_pinger().enqueue(self.get_index_url())
+        return len(written)
+
+    def get_shards(self, sitemap):
+        """
+        Returns the numbers of the shards of sitemap that have urls, so
+        ranges of deleted (or never used) primary keys don't make empty
+        sitemaps, which search engines reject.
+        """
+        items = self._get_items(sitemap)
+        if not self._is_sharded(items):
+            has_items = items.exists() if isinstance(items, QuerySet) else len(items) > 0
+            return [0] if has_items else []
+        # pk // shard_size, without division rounding differences between databases
+        shard = (F('pk') - Mod('pk', self.shard_size)) / self.shard_size
+        numbers = items.order_by().annotate(sitemap_shard=shard).values_list('sitemap_shard', flat=True).distinct()
+        return sorted(int(number) for number in numbers)
+
+    def get_file_name(self, name=None, shard=None):
+        if name is None:
+            return '{0}/{1}'.format(self.location, self.index_name)
+        return '{0}/{1}-{2}.xml'.format(self.location, name, shard)
+
+    def get_index_url(self):
+        return urljoin(self.domain, self.storage.url(self.get_file_name()))
+
+    def write_shard(self, name, shard, only_if_changed=False):
+        """
+        Writes a shard. With only_if_changed, the shard is left alone when
+        its file is the same already. Returns whether it was written.
+        """
+        sitemap = self.sitemaps[name]
+        items = self._get_items(sitemap)
+        if self._is_sharded(items):
+            start = shard * self.shard_size
+            items = items.filter(pk__gte=start, pk__lt=start + self.shard_size).order_by('pk')
+            items = items.iterator(chunk_size=self.chunk_size)
+
+        def lines():
+            yield URLSET_START
+            for item in items:
+                yield self._url_element(sitemap, item)
+            yield URLSET_END
+        return self._save(self.get_file_name(name, shard), lines(), only_if_changed)
+
+    def write_index(self, shards):
+        def lines():
+            yield INDEX_START
+            for name, numbers in shards.items():
+                for shard in numbers:
+                    url = urljoin(self.domain, self.storage.url(self.get_file_name(name, shard)))
+                    yield '<sitemap><loc>{0}</loc></sitemap>\n'.format(escape(url))
+            yield INDEX_END
+        self._save(self.get_file_name(), lines())
+
+    def _url_element(self, sitemap, item):
+        parts = ['<url><loc>', escape(urljoin(self.domain, self._get_attribute(sitemap, 'location', item))), '</loc>']
+        lastmod = self._get_attribute(sitemap, 'lastmod', item)
+        if lastmod is not None:
+            parts += ['<lastmod>', lastmod.strftime('%Y-%m-%d'), '</lastmod>']
+        changefreq = self._get_attribute(sitemap, 'changefreq', item)
+        if changefreq is not None:
+            parts += ['<changefreq>', escape(changefreq), '</changefreq>']
+        priority = self._get_attribute(sitemap, 'priority', item)
+        if priority is not None:
+            parts += ['<priority>', str(priority), '</priority>']
+        parts.append('</url>\n')
+        return ''.join(parts)
+
+    def _get_attribute(self, sitemap, name, item):
+        # like Sitemap._get: attributes may be methods taking the item
+        attribute = getattr(sitemap, name, None)
+        return attribute(item) if callable(attribute) else attribute
+
+    def _get_items(self, sitemap):
+        return sitemap.items()
+
+    def _is_tracked(self, items):
+        # mark_changed flags the shards of sitemaps of a model
+        return getattr(items, 'model', None) is not None
+
+    def _is_sharded(self, items):
+        if not isinstance(items, QuerySet):
+            return False
+        pk = items.model._meta.pk
+        # the primary key of a child model is a link to its parent's
+        while pk.remote_field is not None:
+            pk = pk.target_field
+        return isinstance(pk, (AutoField, IntegerField))
+
+    def _save(self, file_name, lines, only_if_changed=False):
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as content:
+            for line in lines:
+                content.write(line.encode('utf-8'))
+            content.seek(0)
+            if only_if_changed and self._is_saved(file_name, content):
+                return False
+            try:
+                path = self.storage.path(file_name)
+            except NotImplementedError:
+                # storages pick another name for existing files, and remote
+                # ones can't move files, so the file is missing for a moment
+                if self.storage.exists(file_name):
+                    self.storage.delete(file_name)
+                self.storage.save(file_name, File(content))
+                return True
+            # saved next to the file and moved over it, so crawlers never
+            # find it missing
+            temp_name = self.storage.save('{0}.{1}.tmp'.format(file_name, uuid.uuid4().hex), File(content))
+            try:
+                os.replace(self.storage.path(temp_name), path)
+            except OSError:
+                self.storage.delete(temp_name)
+                raise
+        return True
+
+    def _is_saved(self, file_name, content):
+        """
+        Whether file_name holds content already, leaving content at its start.
+        """
+        try:
+            content.seek(0, os.SEEK_END)
+            if not self.storage.exists(file_name) or self.storage.size(file_name) != content.tell():
+                return False
+            content.seek(0)
+            with self.storage.open(file_name) as saved:
+                while True:
+                    chunk = content.read(SPOOL_SIZE)
+                    if chunk != saved.read(len(chunk)):
+                        return False
+                    if not chunk:
+                        return True
+        finally:
+            content.seek(0)
+
+    def _delete_emptied_shards(self, indexed, shards):
+        # shards of the last index that have no urls left
+        for name, numbers in (indexed or {}).items():
+            for shard in set(numbers) - set(shards.get(name, ())):
+                file_name = self.get_file_name(name, shard)
+                if self.storage.exists(file_name):
+                    self.storage.delete(file_name)
+
+    def _changed_key(self, name, shard):
+        return 'web_utils.sitemap.changed.{0}.{1}.{2}'.format(self.location, name, shard)
+
+    def _indexed_key(self):
+        return 'web_utils.sitemap.indexed.{0}'.format(self.location)
+
+
+_sitemap_builder = None
+_sitemap_builder_lock = threading.Lock()
+
+
+def get_sitemap_builder():
+    """
+    Returns the process wide ShardedSitemapBuilder, configured from settings:
+
+    SITEMAP_BUILDER_SITEMAPS - dotted path to the dict of sitemaps
+    SITE_DOMAIN - the domain urls are relative to, like 'https://www.example.com'
+    SITEMAP_BUILDER_STORAGE - dotted path to a storage class (Defaults to default_storage)
+    SITEMAP_BUILDER_LOCATION - directory in the storage (Defaults to 'sitemaps')
+    SITEMAP_BUILDER_SHARD_SIZE - urls per shard (Defaults to 50000)
+    SITEMAP_BUILDER_CACHE - cache alias for the changed shards (Defaults to 'default')
+    """
+    global _sitemap_builder
+    if _sitemap_builder is None:
+        with _sitemap_builder_lock:
+            if _sitemap_builder is None:
+                storage = getattr(settings, 'SITEMAP_BUILDER_STORAGE', None)
+                _sitemap_builder = ShardedSitemapBuilder(
+                    import_string(settings.SITEMAP_BUILDER_SITEMAPS),
+                    settings.SITE_DOMAIN,
+                    storage=import_string(storage)() if storage else None,
+                    location=getattr(settings, 'SITEMAP_BUILDER_LOCATION', 'sitemaps'),
+                    shard_size=getattr(settings, 'SITEMAP_BUILDER_SHARD_SIZE', MAX_SHARD_SIZE),
+                    cache_alias=getattr(settings, 'SITEMAP_BUILDER_CACHE', DEFAULT_CACHE_ALIAS),
+                )
+    return _sitemap_builder
+
+
+def mark_sitemap_changed(sender, instance=None, **kwargs):
+    """
+    A receiver for the signals you'd connect ping_google_sitemap to. It
+    flags the instance's shards, which the build_sitemaps command writes
+    (pinging Google once when PING_GOOGLE_SITEMAP is set).
+    """
+    if instance is not None:
+        get_sitemap_builder().mark_changed(instance)
@@ -1,17 +1,22 @@
 import json
+from functools import lru_cache
+
 from django import template
-from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.html import escapejs, mark_safe
 
+from web_utils.conf import get_settings_snapshot
+from web_utils.nodes import CompiledTagNode, is_literal, literal_value, parse_tag
+
 register = template.Library()
 
 
 # deprecated
 @register.inclusion_tag("web_utils/analytics_snippet.html")
 def analytics_snippet():
-    analytics_id = getattr(settings, 'GOOGLE_ANALYTICS_ID', None)
-    analytics_domain = getattr(settings, 'GOOGLE_ANALYTICS_DOMAIN', None)
+    snapshot = get_settings_snapshot()
+    analytics_id = snapshot.get('GOOGLE_ANALYTICS_ID')
+    analytics_domain = snapshot.get('GOOGLE_ANALYTICS_DOMAIN')
     if not (analytics_id and analytics_domain):
         raise ImproperlyConfigured("You must define GOOGLE_ANALYTICS_ID and GOOGLE_ANALYTICS_DOMAIN in settings.")
 
@@ -23,7 +28,7 @@ def analytics_snippet():
 
 @register.inclusion_tag("web_utils/analytics_gtag_snippet.html")
 def analytics_gtag_snippet():
-    analytics_id = getattr(settings, 'GOOGLE_ANALYTICS_ID', None)
+    analytics_id = get_settings_snapshot().get('GOOGLE_ANALYTICS_ID')
     if not analytics_id:
         raise ImproperlyConfigured("You must define GOOGLE_ANALYTICS_ID in settings.")
 
@@ -71,24 +76,73 @@ def gtag_track_event(category, action, label):
         ))
 
 
-@register.simple_tag
 def ga4_track_event(action, *parameters):
     """
     This is the most recent style. the ga4 tag snippet replaced the gtag events
+
+    {% ga4_track_event "add_to_cart" "item_id" product.sku "list" "grid" %}
     """
     if len(parameters) % 2 != 0:
         raise ValueError("Parameters Must be in groups of 2:  key, value")
+    return _ga4_event_attribute(escapejs(action), [_escape_param(parameter) for parameter in parameters])
+
 
-    parameters_json = json.dumps(
-        {
-            escapejs(parameters[i]).replace("\\u002D", "-"): escapejs(parameters[i + 1]).replace("\\u002D", "-")
-            for i in range(0, len(parameters), 2)
-        }
-    ).encode().decode("unicode_escape")
+@lru_cache(maxsize=1024)
+def _escape_js_string(value):
+    # the same escaping ga4_track_event always did, one string at a time
+    escaped = json.dumps(escapejs(value).replace("\\u002D", "-")).encode().decode("unicode_escape")
+    return escaped.replace('"', "'")
+
+
+def _escape_param(value):
+    """
+    Escapes a ga4_track_event key or value into a quoted javascript string.
+    Strings are memoized, since the same values repeat across a page.
+    """
+    if isinstance(value, str):
+        return _escape_js_string(value)
+    return _escape_js_string.__wrapped__(value)
+
+
+def _ga4_event_attribute(escaped_action, escaped_parameters):
+    parameters = dict(zip(escaped_parameters[::2], escaped_parameters[1::2]))
     return mark_safe(
-        "onClick=\"gtag('event', '{action}', {parameters});\"".
-        format(  # noqa: E501
-            action=escapejs(action),
-            parameters=parameters_json.replace('"', "'"),
+        "onClick=\"gtag('event', '{action}', {{{parameters}}});\"".format(
+            action=escaped_action,
+            parameters=", ".join(key + ": " + value for key, value in parameters.items()),
         )
     )
+
+
+class GA4TrackEventNode(CompiledTagNode):
+    """
+    ga4_track_event with the literal action and parameters escaped once, when
+    the template is compiled.
+    """
+
+    def __init__(self, action, parameters, target_var=None):
+        super(GA4TrackEventNode, self).__init__(target_var)
+        self.action = escapejs(literal_value(action)) if is_literal(action) else action
+        # escaped strings for literals, FilterExpressions for the rest
+        self.parameters = [
+            _escape_param(literal_value(parameter)) if is_literal(parameter) else parameter
+            for parameter in parameters
+        ]
+
+    def render_tag(self, context):
+        action = self.action
+        if not isinstance(action, str):
+            action = escapejs(action.resolve(context))
+        parameters = [
+            parameter if isinstance(parameter, str) else _escape_param(parameter.resolve(context))
+            for parameter in self.parameters
+        ]
+        return _ga4_event_attribute(action, parameters)
+
+
+@register.tag(name='ga4_track_event')
+def do_ga4_track_event(parser, token):
+    arguments, target_var = parse_tag(parser, token, ga4_track_event)
+    if len(arguments['parameters']) % 2 != 0:
+        raise template.TemplateSyntaxError("Parameters Must be in groups of 2:  key, value")
+    return GA4TrackEventNode(arguments['action'], arguments['parameters'], target_var)
@@ -1,14 +1,111 @@
 from django import template
+from django.utils.safestring import mark_safe
 
 from web_utils import formatting
+from web_utils.nodes import CompiledTagNode, is_literal, literal_value, parse_tag
 
 register = template.Library()
 
 
-@register.simple_tag
-def format_currency(value, places=2, show_zero="True"):
+def format_currency(value, places=None, show_zero="True", currency="USD", locale="en_US"):
     """
-    Displays value as US currency: $1,500.00
+    Displays value as currency: $1,500.00
+
+    {% format_currency amount 2 "True" currency="EUR" locale="de_DE" %}
+    {% format_currency amount as price %}
+    """
+    show_zero = True if show_zero == "True" else False
+    return formatting.format_currency(value, places, show_zero, currency, locale)
+
+
+def currency_column(values, places=None, show_zero="True", currency="USD", locale="en_US"):
+    """
+    Formats a list of amounts with a single format_many call and renders its
+    contents once per formatted amount:
+
+    {% currency_column amounts 2 "False" currency="EUR" as amount %}
+        <td>{{ amount }}</td>
+    {% endcurrency_column %}
     """
     show_zero = True if show_zero == "True" else False
-    return formatting.format_currency(value, places, show_zero)
+    return formatting.format_currency_many(values, places, show_zero, currency=currency, locale=locale)
+
+
+def _resolve_options(arguments, context=None):
+    """
+    Returns (formatter, places, show_zero) for the tag arguments besides the
+    amount(s), from their literal values when context is None.
+    """
+    options = {'places': None, 'show_zero': "True", 'currency': "USD", 'locale': "en_US"}
+    for name, filter_expression in arguments.items():
+        if context is None:
+            options[name] = literal_value(filter_expression)
+        else:
+            options[name] = filter_expression.resolve(context)
+    formatter = formatting.get_currency_formatter(options['currency'], options['locale'])
+    return formatter, options['places'], options['show_zero'] == "True"
+
+
+class FormatCurrencyNode(CompiledTagNode):
+    """
+    When every argument besides the value is a literal, the format function
+    is looked up once when the template is compiled and rendering only
+    resolves the value.
+    """
+
+    def __init__(self, value, arguments, target_var=None):
+        super(FormatCurrencyNode, self).__init__(target_var)
+        self.value = value
+        self.arguments = arguments
+        self.currency_format = None
+        if all(is_literal(filter_expression) for filter_expression in arguments.values()):
+            formatter, places, self.show_zero = _resolve_options(arguments)
+            self.currency_format = formatter.get_format(places)
+
+    def render_tag(self, context):
+        value = self.value.resolve(context)
+        if self.currency_format is None:
+            formatter, places, show_zero = _resolve_options(self.arguments, context)
+            return formatter.format(value, places, show_zero)
+        if value in (0, None) and not self.show_zero:
+            return ''
+        return self.currency_format(value or 0)
+
+
+class CurrencyColumnNode(template.Node):
+
+    def __init__(self, values, arguments, target_var, nodelist):
+        self.values = values
+        self.arguments = arguments
+        self.target_var = target_var
+        self.nodelist = nodelist
+        self.options = None
+        if all(is_literal(filter_expression) for filter_expression in arguments.values()):
+            self.options = _resolve_options(arguments)
+
+    def render(self, context):
+        formatter, places, show_zero = self.options or _resolve_options(self.arguments, context)
+        values = self.values.resolve(context) or ()
+
+        output = []
+        with context.push():
+            for amount in formatter.format_many(values, places, show_zero, stream=True):
+                context[self.target_var] = amount
+                output.append(self.nodelist.render(context))
+        return mark_safe(''.join(output))
+
+
+@register.tag(name='format_currency')
+def do_format_currency(parser, token):
+    arguments, target_var = parse_tag(parser, token, format_currency)
+    return FormatCurrencyNode(arguments.pop('value'), arguments, target_var)
+
+
+@register.tag(name='currency_column')
+def do_currency_column(parser, token):
+    arguments, target_var = parse_tag(parser, token, currency_column)
+    if target_var is None:
+        raise template.TemplateSyntaxError("'currency_column' needs 'as <name>' for the formatted amounts")
+    nodelist = parser.parse(('endcurrency_column', ))
+    parser.delete_first_token()
+    return CurrencyColumnNode(arguments.pop('values'), arguments, target_var, nodelist)
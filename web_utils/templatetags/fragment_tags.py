@@ -0,0 +1,26 @@
+from django import template
+
+from web_utils.fragments import UserFragmentNode
+
+register = template.Library()
+
+
+@register.tag(name='user_fragment')
+def do_user_fragment(parser, token):
+    """
+    Marks the user specific part of a page cached with FragmentCacheMixin:
+
+    {% user_fragment account_menu %}
+        Hello {{ user.username }}
+    {% enduser_fragment %}
+
+    Fragments are rendered with the context processors' variables only, since
+    the view doesn't run when the page comes from the cache. Outside of
+    FragmentCacheMixin views the contents are simply rendered.
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError("'{0}' takes a fragment name".format(bits[0]))
+    nodelist = parser.parse(('enduser_fragment', ))
+    parser.delete_first_token()
+    return UserFragmentNode(bits[1], nodelist)
@@ -1,9 +1,15 @@
+from bisect import bisect_right
+
 from django import template
 
+from web_utils.nodes import CompiledTagNode, is_literal, literal_value, parse_tag
+
 register = template.Library()
 
+# render_context key for the request path, looked up once per template render
+REQUEST_PATH_KEY = 'web_utils.request_path'
+
 
-@register.simple_tag(takes_context=True)
 def activate(context, *paths):
     """
     For use in navigation. Returns "active" if the navigation page
@@ -16,3 +22,130 @@ def activate(context, *paths):
     if 'request' in context:
         return bool(context['request'].path in paths) and "active" or ""
     return ''
+
+
+def activate_section(context, *sections):
+    """
+    Like activate, but also for the pages under a section. Sections starting
+    with "/" are path prefixes, others are url names.
+
+    {% activate_section "/blog/" "contact" %}
+    """
+    request = context.get('request')
+    if request is None:
+        return ''
+    return _section_matches(request, sections) and "active" or ""
+
+
+def _section_matches(request, sections):
+    view_name = _view_name(request)
+    for section in sections:
+        if not isinstance(section, str):
+            continue
+        if section.startswith('/'):
+            if request.path.startswith(section):
+                return True
+        elif section == view_name:
+            return True
+    return False
+
+
+def _view_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.view_name if resolver_match is not None else None
+
+
+def _request_path(context):
+    """
+    The request's path (None without a request), cached in the render
+    context so a menu with many nav items looks it up once.
+    """
+    render_context = context.render_context
+    if REQUEST_PATH_KEY not in render_context:
+        request = context.get('request')
+        render_context[REQUEST_PATH_KEY] = request.path if request is not None else None
+    return render_context[REQUEST_PATH_KEY]
+
+
+def _prefix_index(prefixes):
+    """
+    Sorts prefixes, leaving out the ones starting with another prefix, so
+    the only prefix that can match a path is the last one sorting before it.
+    """
+    index = []
+    for prefix in sorted(set(prefixes)):
+        if not index or not prefix.startswith(index[-1]):
+            index.append(prefix)
+    return index
+
+
+def _match_prefix(index, path):
+    i = bisect_right(index, path)
+    return i > 0 and path.startswith(index[i - 1])
+
+
+def _split_arguments(arguments):
+    literals = [literal_value(argument) for argument in arguments if is_literal(argument)]
+    variables = [argument for argument in arguments if not is_literal(argument)]
+    return literals, variables
+
+
+class ActivateNode(CompiledTagNode):
+    """
+    activate with the literal paths put in a set when the template is compiled.
+    """
+
+    def __init__(self, paths, target_var=None):
+        super(ActivateNode, self).__init__(target_var)
+        literals, self.variables = _split_arguments(paths)
+        self.paths = frozenset(literals)
+
+    def render_tag(self, context):
+        path = _request_path(context)
+        if path is None:
+            return ''
+        if path in self.paths:
+            return "active"
+        for variable in self.variables:
+            if variable.resolve(context) == path:
+                return "active"
+        return ''
+
+
+class ActivateSectionNode(CompiledTagNode):
+    """
+    activate_section with the literal prefixes in a sorted index and the
+    literal url names in a set, built when the template is compiled.
+    """
+
+    def __init__(self, sections, target_var=None):
+        super(ActivateSectionNode, self).__init__(target_var)
+        literals, self.variables = _split_arguments(sections)
+        literals = [section for section in literals if isinstance(section, str)]
+        self.prefixes = _prefix_index(section for section in literals if section.startswith('/'))
+        self.view_names = frozenset(section for section in literals if not section.startswith('/'))
+
+    def render_tag(self, context):
+        path = _request_path(context)
+        if path is None:
+            return ''
+        if _match_prefix(self.prefixes, path):
+            return "active"
+        request = context['request']
+        if self.view_names and _view_name(request) in self.view_names:
+            return "active"
+        if self.variables and _section_matches(request, [variable.resolve(context) for variable in self.variables]):
+            return "active"
+        return ''
+
+
+@register.tag(name='activate')
+def do_activate(parser, token):
+    arguments, target_var = parse_tag(parser, token, activate, takes_context=True)
+    return ActivateNode(arguments['paths'], target_var)
+
+
+@register.tag(name='activate_section')
+def do_activate_section(parser, token):
+    arguments, target_var = parse_tag(parser, token, activate_section, takes_context=True)
+    return ActivateSectionNode(arguments['sections'], target_var)
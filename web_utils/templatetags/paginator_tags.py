@@ -1,14 +1,29 @@
 from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from web_utils.lru import LRUCache
 
 register = template.Library()
 
+PAGINATOR_TEMPLATE = "web_utils/paginator.html"
+
+# rendered paginators, see show_cached_paginator
+PAGINATOR_CACHE_SIZE = 1024
+_paginator_cache = LRUCache(PAGINATOR_CACHE_SIZE)
+
 
 def get_pages_to_show(current_page, total_pages):
     """
     Gets page numbers +/- 2 from current page.
+
+    When total_pages is None (unknown), only the pages up to the current one
+    are known to exist, so those are shown.
     """
     page_list = []
-    if total_pages > 5:
+    if total_pages is None:
+        page_list = range(max(current_page - 2, 1), current_page + 1)
+    elif total_pages > 5:
         for s in [-2, -1, 0, 1, 2]:
             num = current_page + s
             if 0 < num <= total_pages:
@@ -18,17 +33,30 @@ def get_pages_to_show(current_page, total_pages):
     return page_list
 
 
-def get_query_without_page(get_params):
+def get_query_without_page(get_params, key='page'):
     """
     This is used so we can show the pagination properly keeping the search results.
+
+    :param key:
+        The GET parameter to leave out, e.g. 'cursor' for keyset pagination.
     """
     query_string_without_page = get_params.copy()
-    if 'page' in query_string_without_page:
-        del query_string_without_page['page']
+    if key in query_string_without_page:
+        del query_string_without_page[key]
     return query_string_without_page.urlencode()
 
 
-@register.inclusion_tag("web_utils/paginator.html")
+def get_page_link_prefix(query_string, key='page'):
+    """
+    The escaped start of every page link, the page number goes at the end:
+    ?q=term&amp;page=
+    """
+    if query_string:
+        return mark_safe("?" + escape(query_string) + "&amp;" + key + "=")
+    return mark_safe("?" + key + "=")
+
+
+@register.inclusion_tag(PAGINATOR_TEMPLATE)
 def show_paginator(page, paginator, get_params=None):
     """
     :param page:
@@ -47,4 +75,60 @@ def show_paginator(page, paginator, get_params=None):
         'page_numbers': get_pages_to_show(page.number, paginator.num_pages),
         'page_obj': page,
         'query_string': query_string,
+        'page_link_prefix': get_page_link_prefix(query_string),
+    }
+
+
+def _paginator_cache_key(page, paginator, get_params):
+    # the GET parameters as they are, which is cheaper than building the
+    # query string and identifies it just as well
+    params = None
+    if get_params:
+        params = tuple((key, tuple(values)) for key, values in get_params.lists() if key != 'page')
+    return params, page.number, paginator.num_pages
+
+
+@register.simple_tag(takes_context=True)
+def show_cached_paginator(context, page, paginator, get_params=None):
+    """
+    Renders the same HTML as show_paginator, but keeps the rendered paginators
+    for the most recent PAGINATOR_CACHE_SIZE combinations of GET parameters,
+    page number and page count, so list views don't render it on every request.
+
+    Only use it when the paginator template only depends on those, which the
+    default template does.
+    """
+    key = _paginator_cache_key(page, paginator, get_params)
+    html = _paginator_cache.get(key)
+    if html is None:
+        paginator_template = context.template.engine.get_template(PAGINATOR_TEMPLATE)
+        html = mark_safe(paginator_template.render(context.new(show_paginator(page, paginator, get_params))))
+        _paginator_cache.set(key, html)
+    return html
+
+
+@register.inclusion_tag("web_utils/keyset_paginator.html")
+def show_keyset_paginator(page, get_params=None, cursor_param="cursor"):
+    """
+    Previous and next links for a KeysetPage (see web_utils.pagination),
+    which never counts the objects.
+
+    :param page:
+        The KeysetPage
+    :param get_params:
+        The GET parameters of the page, kept in the links like show_paginator does.
+    :param cursor_param:
+        The GET parameter the view reads the cursor from.
+    """
+    query_string = None
+    if get_params:
+        query_string = get_query_without_page(get_params, cursor_param)
+    page_link_prefix = get_page_link_prefix(query_string, cursor_param)
+    # cursors are url safe base64, they don't need escaping
+    next_cursor, previous_cursor = page.next_cursor(), page.previous_cursor()
+    return {
+        'page_obj': page,
+        'query_string': query_string,
+        'next_link': mark_safe(page_link_prefix + next_cursor) if next_cursor else None,
+        'previous_link': mark_safe(page_link_prefix + previous_cursor) if previous_cursor else None,
     }
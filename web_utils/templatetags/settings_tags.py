@@ -1,9 +1,17 @@
 from django import template
-from django.conf import settings
+
+from web_utils.conf import get_settings_snapshot
 
 register = template.Library()
 
 
 @register.simple_tag
 def get_setting(val):
-    return getattr(settings, val, "")
+    """
+    Outputs a setting, or an empty string when it isn't defined.
+
+    Only the settings listed in settings.GET_SETTING_ALLOWLIST and
+    web_utils.conf.DEFAULT_GET_SETTING_ALLOWLIST can be output, others
+    (like SECRET_KEY) are treated as undefined.
+    """
+    return get_settings_snapshot().get(val, "")
@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import mock
+from django import test
+from django.core.exceptions import ImproperlyConfigured
+
+from web_utils import analytics
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, json.loads(body.decode('utf-8'))))
+        self.send_response(self.server.status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class AnalyticsOutboxTests(test.SimpleTestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+        self.server.status = 204
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.spill_path = os.path.join(self.directory, 'spilled.jsonl')
+
+    def _outbox(self, endpoint=None, **kwargs):
+        endpoint = endpoint or 'http://127.0.0.1:{0}/mp/collect'.format(self.server.server_port)
+        return analytics.AnalyticsOutbox('G-TEST', 'secret', endpoint, spill_path=self.spill_path, **kwargs)
+
+    def test_posts_events_in_batches_per_client(self):
+        outbox = self._outbox()
+        for n in range(30):
+            outbox.track('client.1', 'view_item', {'n': n})
+        outbox.track('client.2', 'purchase', user_id='7')
+        outbox.flush()
+
+        self.assertEqual([25, 5, 1], [len(body['events']) for _, body in self.server.requests])
+        path, body = self.server.requests[2]
+        self.assertEqual('/mp/collect?measurement_id=G-TEST&api_secret=secret', path)
+        expected = {'client_id': 'client.2', 'user_id': '7', 'events': [{'name': 'purchase', 'params': {}}]}
+        self.assertEqual(expected, body)
+
+    def test_sends_full_batches_without_flushing(self):
+        outbox = self._outbox(batch_size=2, flush_interval=60)
+        outbox.track('client.1', 'a')
+        outbox.track('client.1', 'b')
+        outbox.queue.join()
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_sends_after_flush_interval(self):
+        outbox = self._outbox(flush_interval=0.05)
+        outbox.track('client.1', 'a')
+        outbox.queue.join()
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_spills_when_endpoint_is_down_and_sends_spilled_events_later(self):
+        down = self._outbox('http://127.0.0.1:1/mp/collect', timeout=1)
+        with self.assertLogs('web_utils.analytics', 'WARNING'):
+            down.track('client.1', 'a')
+            down.flush()
+        self.assertEqual([], self.server.requests)
+        with open(self.spill_path) as spilled:
+            self.assertEqual(1, len(spilled.readlines()))
+
+        outbox = self._outbox()
+        outbox.track('client.2', 'b')
+        outbox.flush()
+        self.assertEqual(['b', 'a'], [body['events'][0]['name'] for _, body in self.server.requests])
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_drops_spilled_requests_past_spill_max_bytes(self):
+        down = self._outbox('http://127.0.0.1:1/mp/collect', timeout=1, spill_max_bytes=150)
+        with self.assertLogs('web_utils.analytics', 'WARNING') as logs:
+            for client_id in ('client.1', 'client.2', 'client.3'):
+                down.track(client_id, 'a')
+            down.flush()
+        with open(self.spill_path) as spilled:
+            self.assertEqual(2, len(spilled.readlines()))
+        self.assertIn("Dropping 1 analytics requests", logs.output[-1])
+
+    def _write_spilled(self):
+        with open(self.spill_path, 'w') as spill:
+            spill.write(json.dumps({'client_id': 'client.1', 'events': [{'name': 'a', 'params': {}}]}) + '\n')
+
+    def test_takes_spilled_requests_under_a_name_of_its_own(self):
+        sending_paths = []
+        for outbox in (self._outbox(), self._outbox()):
+            self._write_spilled()
+            with mock.patch('os.rename', wraps=os.rename) as rename:
+                outbox.send_spilled()
+            sending_paths.append(rename.call_args[0][1])
+        self.assertNotEqual(*sending_paths)
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_leaves_spilled_requests_taken_by_another_process(self):
+        self._write_spilled()
+        with mock.patch('os.rename', side_effect=FileNotFoundError):
+            self._outbox().send_spilled()
+        self.assertEqual([], self.server.requests)
+
+    def test_spills_server_errors(self):
+        self.server.status = 503
+        outbox = self._outbox()
+        with self.assertLogs('web_utils.analytics', 'WARNING'):
+            outbox.track('client.1', 'a')
+            outbox.flush()
+        self.assertTrue(os.path.exists(self.spill_path))
+
+    def test_drops_rejected_events(self):
+        self.server.status = 400
+        outbox = self._outbox()
+        with self.assertLogs('web_utils.analytics', 'WARNING'):
+            outbox.track('client.1', 'a')
+            outbox.flush()
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_drops_events_when_queue_is_full(self):
+        outbox = self._outbox(maxsize=1, flush_interval=60)
+        outbox._start_worker = lambda: None
+        self.assertTrue(outbox.track('client.1', 'a'))
+        with self.assertLogs('web_utils.analytics', 'WARNING'):
+            self.assertFalse(outbox.track('client.1', 'b'))
+
+
+class GetAnalyticsOutboxTests(test.SimpleTestCase):
+
+    @test.override_settings(GA4_MEASUREMENT_ID='G-1')
+    def test_raises_improperly_configured_without_api_secret(self):
+        with mock.patch.object(analytics, '_analytics_outbox', None):
+            with self.assertRaises(ImproperlyConfigured):
+                analytics.get_analytics_outbox()
+
+
+class GetClientIdTests(test.SimpleTestCase):
+
+    def test_reads_client_id_from_ga_cookie(self):
+        request = test.RequestFactory().get('/')
+        request.COOKIES['_ga'] = 'GA1.1.1234567.7654321'
+        self.assertEqual('1234567.7654321', analytics.get_client_id(request))
+
+    def test_returns_none_without_ga_cookie(self):
+        self.assertIsNone(analytics.get_client_id(test.RequestFactory().get('/')))
@@ -0,0 +1,26 @@
+from django import test
+
+from web_utils.conf import get_settings_snapshot
+
+
+class SettingsSnapshotTests(test.SimpleTestCase):
+
+    @test.override_settings(GOOGLE_ANALYTICS_ID="UA-1")
+    def test_reuses_snapshot(self):
+        self.assertIs(get_settings_snapshot(), get_settings_snapshot())
+        self.assertEqual("UA-1", get_settings_snapshot()['GOOGLE_ANALYTICS_ID'])
+
+    @test.override_settings(GOOGLE_ANALYTICS_ID="UA-1")
+    def test_rebuilds_snapshot_when_settings_change(self):
+        get_settings_snapshot()
+        with self.settings(GOOGLE_ANALYTICS_ID="UA-2"):
+            self.assertEqual("UA-2", get_settings_snapshot()['GOOGLE_ANALYTICS_ID'])
+
+    @test.override_settings(GET_SETTING_ALLOWLIST=['TIME_ZONE'])
+    def test_includes_allowed_settings(self):
+        self.assertIn('TIME_ZONE', get_settings_snapshot())
+        self.assertNotIn('SECRET_KEY', get_settings_snapshot())
+
+    def test_is_read_only(self):
+        with self.assertRaises(TypeError):
+            get_settings_snapshot()['GOOGLE_ANALYTICS_ID'] = "UA-3"
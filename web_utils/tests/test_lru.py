@@ -0,0 +1,27 @@
+from django import test
+
+from web_utils.lru import LRUCache
+
+
+class LRUCacheTests(test.SimpleTestCase):
+
+    def test_returns_default_for_missing_keys(self):
+        cache = LRUCache(2)
+        self.assertEqual("default", cache.get("missing", "default"))
+
+    def test_evicts_least_recently_used_item(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(1, cache.get("a"))
+        self.assertNotIn("b", cache)
+        self.assertEqual(2, len(cache))
+
+    def test_clears_items(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.clear()
+        self.assertEqual(0, len(cache))
@@ -1,4 +1,9 @@
+import asyncio
+
+import mock
+from django import http
 from django import test
+from django.core.exceptions import DisallowedHost
 
 from web_utils.middleware import SSLMiddleware
 
@@ -6,8 +11,8 @@ from web_utils.middleware import SSLMiddleware
 @test.override_settings(SSL_ENABLED=True)
 class SSLMiddlewareTests(test.TestCase):
 
-    def _get_request(self, path='/', secure=False):
-        return test.RequestFactory().get(path, secure=secure)
+    def _get_request(self, path='/', secure=False, **headers):
+        return test.RequestFactory().get(path, secure=secure, **headers)
 
     @test.override_settings(SSL_ENABLED=False)
     def test_returns_none_when_ssl_not_enabled(self):
@@ -49,3 +54,111 @@ class SSLMiddlewareTests(test.TestCase):
         request = self._get_request(secure=False)
         result = SSLMiddleware("").process_view(request, None, None, {'USE_SSL': False})
         self.assertEqual(None, result)
+
+    def test_reloads_settings_when_they_change(self):
+        middleware = SSLMiddleware("")
+        request = self._get_request(secure=False)
+
+        with test.override_settings(SSL_ENABLED=False):
+            self.assertEqual(None, middleware.process_view(request, None, None, {'USE_SSL': True}))
+
+        result = middleware.process_view(request, None, None, {'USE_SSL': True})
+        self.assertEqual(301, result.status_code)
+
+    def test_removes_use_ssl_from_view_kwargs(self):
+        view_kwargs = {'USE_SSL': False, 'pk': 1}
+        SSLMiddleware("").process_view(self._get_request(), None, None, view_kwargs)
+        self.assertEqual({'pk': 1}, view_kwargs)
+
+    def test_process_view_is_a_coroutine_under_asgi(self):
+        async def get_response(request):
+            return http.HttpResponse()
+
+        middleware = SSLMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware.process_view))
+
+        request = self._get_request(secure=False)
+        result = asyncio.run(middleware.process_view(request, None, None, {'USE_SSL': True}))
+        self.assertEqual(301, result.status_code)
+
+    @test.override_settings(SSL_FORWARDED_PROTO_HEADER=('HTTP_X_FORWARDED_PROTO', 'https'))
+    def test_uses_forwarded_proto_header_to_tell_secure_requests(self):
+        middleware = SSLMiddleware("")
+        request = self._get_request(secure=False, HTTP_X_FORWARDED_PROTO='https')
+        self.assertEqual(None, middleware.process_view(request, None, None, {'USE_SSL': True}))
+
+        request = self._get_request(secure=True, HTTP_X_FORWARDED_PROTO='http')
+        result = middleware.process_view(request, None, None, {'USE_SSL': True})
+        self.assertEqual('https://{0}/'.format(request.get_host()), result['Location'])
+
+    @test.override_settings(SSL_FORWARDED_PROTO_HEADER=('HTTP_X_FORWARDED_PROTO', 'https'))
+    def test_uses_first_forwarded_proto(self):
+        request = self._get_request(HTTP_X_FORWARDED_PROTO='https, http')
+        self.assertTrue(SSLMiddleware("").is_secure(request))
+
+    @test.override_settings(SSL_HSTS_SECONDS=31536000, SSL_HSTS_INCLUDE_SUBDOMAINS=True, SSL_HSTS_PRELOAD=True)
+    def test_adds_hsts_header_to_secure_responses(self):
+        middleware = SSLMiddleware(lambda request: http.HttpResponse())
+        response = middleware(self._get_request(secure=True))
+        self.assertEqual('max-age=31536000; includeSubDomains; preload', response['Strict-Transport-Security'])
+
+    @test.override_settings(SSL_HSTS_SECONDS=3600)
+    def test_doesnt_add_hsts_header_to_insecure_responses(self):
+        middleware = SSLMiddleware(lambda request: http.HttpResponse())
+        response = middleware(self._get_request(secure=False))
+        self.assertFalse(response.has_header('Strict-Transport-Security'))
+
+    def test_doesnt_add_hsts_header_by_default(self):
+        middleware = SSLMiddleware(lambda request: http.HttpResponse())
+        response = middleware(self._get_request(secure=True))
+        self.assertFalse(response.has_header('Strict-Transport-Security'))
+
+    @test.override_settings(SSL_HSTS_SECONDS=3600)
+    def test_adds_hsts_header_under_asgi(self):
+        async def get_response(request):
+            return http.HttpResponse()
+
+        response = asyncio.run(SSLMiddleware(get_response)(self._get_request(secure=True)))
+        self.assertEqual('max-age=3600', response['Strict-Transport-Security'])
+
+    @test.override_settings(SSL_HSTS_SECONDS=3600)
+    def test_doesnt_redirect_secure_requests_to_http_with_hsts(self):
+        request = self._get_request(secure=True)
+        self.assertEqual(None, SSLMiddleware("").process_view(request, None, None, {'USE_SSL': False}))
+
+    @test.override_settings(SSL_HSTS_SECONDS=3600)
+    def test_redirects_insecure_requests_to_https_with_hsts(self):
+        request = self._get_request(secure=False)
+        result = SSLMiddleware("").process_view(request, None, None, {'USE_SSL': True})
+        self.assertEqual(301, result.status_code)
+
+    def test_validates_each_host_once(self):
+        middleware = SSLMiddleware("")
+        with mock.patch.object(http.HttpRequest, 'get_host', return_value='testserver') as get_host:
+            for _ in range(3):
+                result = middleware.process_view(self._get_request('/path/?a=1'), None, None, {'USE_SSL': True})
+        self.assertEqual('https://testserver/path/?a=1', result['Location'])
+        self.assertEqual(1, get_host.call_count)
+
+    @test.override_settings(USE_X_FORWARDED_HOST=True, ALLOWED_HOSTS=['one.example.com', 'two.example.com'])
+    def test_caches_hosts_per_forwarded_host(self):
+        middleware = SSLMiddleware("")
+        locations = [
+            middleware.process_view(self._get_request(HTTP_X_FORWARDED_HOST=host), None, None, {'USE_SSL': True})
+            for host in ('one.example.com', 'two.example.com')
+        ]
+        self.assertEqual(['https://one.example.com/', 'https://two.example.com/'], [r['Location'] for r in locations])
+
+    def test_validates_hosts_again_when_allowed_hosts_change(self):
+        middleware = SSLMiddleware("")
+        middleware.process_view(self._get_request(), None, None, {'USE_SSL': True})
+        with test.override_settings(ALLOWED_HOSTS=['example.com']):
+            with self.assertRaises(DisallowedHost):
+                middleware.process_view(self._get_request(), None, None, {'USE_SSL': True})
+
+    def test_raises_disallowed_host_for_hosts_that_arent_allowed(self):
+        middleware = SSLMiddleware("")
+        request = self._get_request(HTTP_HOST='evil.example.com')
+        for _ in range(2):
+            with self.assertRaises(DisallowedHost):
+                middleware.process_view(request, None, None, {'USE_SSL': True})
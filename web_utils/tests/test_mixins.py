@@ -0,0 +1,750 @@
+import datetime
+import gzip
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest import skipUnless
+
+import mock
+from django import http
+from django import template
+from django import test
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db.models import DecimalField, Value
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.cache import cache_page
+from django.views.generic import TemplateView, View
+
+from web_utils import fragments, mixins
+
+FRAGMENT_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'context_processors': ['django.contrib.auth.context_processors.auth'],
+        'loaders': [('django.template.loaders.locmem.Loader', {
+            'page.html': (
+                '{% load fragment_tags %}<h1>{{ title }}</h1>'
+                '{% user_fragment menu %}Hi {{ user.username }}{% enduser_fragment %}'
+            ),
+            'form.html': '{% load fragment_tags %}{% user_fragment form %}{% csrf_token %}{% enduser_fragment %}',
+        })],
+    },
+}]
+
+async_views = skipUnless(hasattr(View, 'view_is_async'), "async class based views need django >= 4.1")
+
+
+class CountingView(View):
+    calls = 0
+
+    def get(self, request, *args, **kwargs):
+        type(self).calls += 1
+        return http.HttpResponse("calls: {0}".format(self.calls))
+
+
+class SlowCountingView(View):
+    calls = 0
+
+    def get(self, request, *args, **kwargs):
+        type(self).calls += 1
+        calls = self.calls
+        time.sleep(0.2)
+        return http.HttpResponse("calls: {0}".format(calls))
+
+
+class AsyncCountingView(View):
+    calls = 0
+
+    async def get(self, request, *args, **kwargs):
+        type(self).calls += 1
+        return http.HttpResponse("calls: {0}".format(self.calls))
+
+
+class PageView(View):
+    calls = 0
+    content = "<p>Some cached page</p>\n" * 50
+
+    def get(self, request, *args, **kwargs):
+        type(self).calls += 1
+        return http.HttpResponse(self.content)
+
+
+class AsyncPageView(PageView):
+
+    async def get(self, request, *args, **kwargs):
+        type(self).calls += 1
+        return http.HttpResponse(self.content)
+
+
+class MixinTestCase(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _get_request(self, path='/', user=None, **headers):
+        request = test.RequestFactory().get(path, **headers)
+        request.user = user or AnonymousUser()
+        return request
+
+    def _get_async_request(self, path='/', user=None, **headers):
+        request = test.AsyncRequestFactory().get(path)
+        request.META.update(headers)
+        request.user = user or AnonymousUser()
+        return request
+
+
+class NeverCacheMixinTests(MixinTestCase):
+
+    def test_adds_never_cache_headers(self):
+        view = type('View', (mixins.NeverCacheMixin, CountingView), {}).as_view()
+        response = view(self._get_request())
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    @async_views
+    async def test_adds_never_cache_headers_to_async_views(self):
+        view = type('View', (mixins.NeverCacheMixin, AsyncCountingView), {}).as_view()
+        response = await view(self._get_async_request())
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class LoginRequiredMixinTests(MixinTestCase):
+
+    def test_redirects_anonymous_users_to_login(self):
+        view = type('View', (mixins.LoginRequiredMixin, CountingView), {}).as_view()
+        response = view(self._get_request('/private/'))
+        self.assertEqual(302, response.status_code)
+        self.assertEqual('/accounts/login/?next=/private/', response['Location'])
+
+    @async_views
+    async def test_redirects_anonymous_users_to_login_from_async_views(self):
+        view = type('View', (mixins.LoginRequiredMixin, AsyncCountingView), {}).as_view()
+        response = await view(self._get_async_request('/private/'))
+        self.assertEqual(302, response.status_code)
+        self.assertEqual('/accounts/login/?next=/private/', response['Location'])
+
+    @async_views
+    async def test_calls_async_view_for_authenticated_users(self):
+        view = type('View', (mixins.LoginRequiredMixin, AsyncCountingView), {}).as_view()
+        response = await view(self._get_async_request(user=User(username="test")))
+        self.assertEqual(200, response.status_code)
+
+
+class StaffMemberRequiredMixinTests(MixinTestCase):
+
+    @async_views
+    @mock.patch('web_utils.mixins.resolve_url', mock.Mock(return_value='/admin/login/'))
+    async def test_redirects_non_staff_to_admin_login_from_async_views(self):
+        view = type('View', (mixins.StaffMemberRequiredMixin, AsyncCountingView), {}).as_view()
+        response = await view(self._get_async_request('/private/', user=User(username="test", is_staff=False)))
+        self.assertEqual(302, response.status_code)
+        self.assertEqual('/admin/login/?next=/private/', response['Location'])
+
+    @async_views
+    async def test_calls_async_view_for_staff(self):
+        view = type('View', (mixins.StaffMemberRequiredMixin, AsyncCountingView), {}).as_view()
+        response = await view(self._get_async_request(user=User(username="test", is_staff=True)))
+        self.assertEqual(200, response.status_code)
+
+
+class CSRFExemptMixinTests(MixinTestCase):
+
+    def test_marks_view_csrf_exempt(self):
+        view = type('View', (mixins.CSRFExemptMixin, CountingView), {}).as_view()
+        self.assertTrue(view.csrf_exempt)
+
+    @async_views
+    def test_marks_async_view_csrf_exempt(self):
+        view = type('View', (mixins.CSRFExemptMixin, AsyncCountingView), {}).as_view()
+        self.assertTrue(view.csrf_exempt)
+
+
+class CacheMixinTests(MixinTestCase):
+
+    def test_serves_cached_response(self):
+        view_class = type('View', (mixins.CacheMixin, CountingView), {'calls': 0})
+        view = view_class.as_view()
+        view(self._get_request('/cached/'))
+        response = view(self._get_request('/cached/'))
+
+        self.assertEqual(b"calls: 1", response.content)
+        self.assertEqual(1, view_class.calls)
+
+    def test_serves_cached_template_response(self):
+        view_class = type('View', (mixins.CacheMixin, TemplateView), {'template_name': 'web_utils/paginator.html'})
+        view = view_class.as_view()
+        view(self._get_request('/template/')).render()
+        with mock.patch.object(TemplateView, 'get') as get:
+            response = view(self._get_request('/template/'))
+        self.assertFalse(get.called)
+        self.assertIn(b'class="pagination"', response.content)
+
+    def test_shares_cache_middleware_between_requests(self):
+        view = type('View', (mixins.CacheMixin, CountingView), {'calls': 0, 'cache_timeout': 45}).as_view()
+        view(self._get_request('/shared/'))
+        middleware = mixins.get_cache_middleware(45)
+        with mock.patch.object(mixins, 'CacheMiddleware') as cache_middleware:
+            view(self._get_request('/other/'))
+        self.assertFalse(cache_middleware.called)
+        self.assertIs(middleware, mixins.get_cache_middleware(45))
+
+    def test_ignores_cache_middleware_settings_like_cache_page(self):
+        view_class = type('View', (mixins.CacheMixin, CountingView), {'calls': 0})
+        view = view_class.as_view()
+        with self.settings(CACHE_MIDDLEWARE_KEY_PREFIX='site', CACHE_MIDDLEWARE_ALIAS='other'):
+            view(self._get_request('/prefixed/'))
+            cached_view = cache_page(60)(CountingView.as_view())
+            response = cached_view(self._get_request('/prefixed/'))
+
+        self.assertEqual(b"calls: 1", response.content)
+        self.assertEqual(1, view_class.calls)
+
+    def test_uses_new_cache_middleware_seconds(self):
+        view = type('View', (mixins.CacheMixin, CountingView), {'calls': 0, 'cache_timeout': None}).as_view()
+        with self.settings(CACHE_MIDDLEWARE_SECONDS=30):
+            response = view(self._get_request('/seconds/'))
+        self.assertEqual('max-age=30', response['Cache-Control'])
+
+    @async_views
+    async def test_serves_cached_response_to_async_views(self):
+        view_class = type('View', (mixins.CacheMixin, AsyncCountingView), {'calls': 0})
+        view = view_class.as_view()
+        await view(self._get_async_request('/cached/'))
+        response = await view(self._get_async_request('/cached/'))
+
+        self.assertEqual(b"calls: 1", response.content)
+        self.assertEqual(1, view_class.calls)
+
+
+class CompressedCacheMixinTests(MixinTestCase):
+
+    def _get_view_class(self, view=PageView, **attrs):
+        attrs = dict({'calls': 0, 'cache_compress': True}, **attrs)
+        return type('View', (mixins.CacheMixin, view), attrs)
+
+    def test_serves_gzipped_response_when_accepted(self):
+        view = self._get_view_class().as_view()
+        response = view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip, deflate'))
+
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(PageView.content, gzip.decompress(response.content).decode())
+        self.assertEqual(str(len(response.content)), response['Content-Length'])
+        self.assertEqual('Accept-Encoding', response['Vary'])
+
+    def test_compresses_only_when_caching(self):
+        view_class = self._get_view_class()
+        view = view_class.as_view()
+        view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip'))
+        with mock.patch('web_utils.mixins._gzip') as compress:
+            response = view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip'))
+
+        self.assertFalse(compress.called)
+        self.assertEqual(1, view_class.calls)
+        self.assertEqual(PageView.content, gzip.decompress(response.content).decode())
+
+    def test_doesnt_compress_responses_that_wont_be_cached(self):
+        def get(request, *args, **kwargs):
+            response = http.HttpResponse(PageView.content)
+            response['Cache-Control'] = 'private'
+            return response
+
+        view = self._get_view_class().as_view()
+        with mock.patch.object(PageView, 'get', side_effect=get) as page, \
+                mock.patch('web_utils.mixins._gzip') as compress:
+            responses = [view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip')) for _ in range(3)]
+
+        self.assertFalse(compress.called)
+        self.assertEqual(3, page.call_count)
+        self.assertEqual([PageView.content.encode()] * 3, [response.content for response in responses])
+
+    def test_doesnt_compress_responses_setting_cookies_for_cookieless_requests(self):
+        def get(request, *args, **kwargs):
+            response = http.HttpResponse(PageView.content)
+            response.set_cookie('a', 'b')
+            patch_vary_headers(response, ('Cookie', ))
+            return response
+
+        view = self._get_view_class().as_view()
+        with mock.patch.object(PageView, 'get', side_effect=get), mock.patch('web_utils.mixins._gzip') as compress:
+            view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertFalse(compress.called)
+
+    def test_serves_every_encoding_from_one_cache_entry(self):
+        view_class = self._get_view_class()
+        view = view_class.as_view()
+        view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip'))
+        response = view(self._get_request('/page/'))
+
+        self.assertEqual(1, view_class.calls)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(PageView.content.encode(), response.content)
+        self.assertEqual('Accept-Encoding', response['Vary'])
+
+    def test_prefers_brotli_when_installed(self):
+        brotli = mock.Mock(MODE_TEXT=1)
+        brotli.compress.return_value = b'brotli'
+        view = self._get_view_class().as_view()
+        with mock.patch.object(mixins, 'brotli', brotli):
+            view(self._get_request('/page/'))
+        response = view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip, deflate, br'))
+
+        self.assertEqual('br', response['Content-Encoding'])
+        self.assertEqual(b'brotli', response.content)
+
+    def test_weakens_etag_of_compressed_response(self):
+        view = self._get_view_class().as_view()
+        page = http.HttpResponse(PageView.content)
+        page['ETag'] = '"a"'
+        with mock.patch.object(PageView, 'get', return_value=page):
+            response = view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual('W/"a"', response['ETag'])
+
+    def test_leaves_short_responses_uncompressed(self):
+        view = self._get_view_class(CountingView).as_view()
+        response = view(self._get_request('/short/', HTTP_ACCEPT_ENCODING='gzip'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b"calls: 1", response.content)
+
+    def test_doesnt_compress_without_cache_compress(self):
+        view = self._get_view_class(cache_compress=False).as_view()
+        response = view(self._get_request('/page/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @async_views
+    async def test_serves_gzipped_cached_response_to_async_views(self):
+        view_class = self._get_view_class(AsyncPageView)
+        view = view_class.as_view()
+        await view(self._get_async_request('/page/'))
+        response = await view(self._get_async_request('/page/', HTTP_ACCEPT_ENCODING='gzip'))
+
+        self.assertEqual(1, view_class.calls)
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(PageView.content, gzip.decompress(response.content).decode())
+
+
+class CacheControlMixinTests(MixinTestCase):
+
+    def test_adds_max_age(self):
+        view = type('View', (mixins.CacheControlMixin, CountingView), {'cache_timeout': 30}).as_view()
+        response = view(self._get_request())
+        self.assertEqual('max-age=30', response['Cache-Control'])
+
+    @async_views
+    async def test_adds_max_age_to_async_views(self):
+        view = type('View', (mixins.CacheControlMixin, AsyncCountingView), {'cache_timeout': 30}).as_view()
+        response = await view(self._get_async_request())
+        self.assertEqual('max-age=30', response['Cache-Control'])
+
+    def _view_class(self, view=CountingView, **attrs):
+        attrs.setdefault('calls', 0)
+        return type('View', (mixins.CacheControlMixin, view), attrs)
+
+    def test_returns_not_modified_for_matching_etag_without_running_view(self):
+        view_class = self._view_class(get_etag=lambda self: "v{0}".format(self.kwargs['version']))
+        response = view_class.as_view()(self._get_request(HTTP_IF_NONE_MATCH='"v2"'), version=2)
+
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(0, view_class.calls)
+        self.assertEqual('max-age=60', response['Cache-Control'])
+
+    def test_adds_etag_when_it_doesnt_match(self):
+        view_class = self._view_class(get_etag=lambda self: "v3")
+        response = view_class.as_view()(self._get_request(HTTP_IF_NONE_MATCH='"v2"'))
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('"v3"', response['ETag'])
+        self.assertEqual(1, view_class.calls)
+
+    def test_returns_not_modified_when_not_modified_since(self):
+        last_modified = datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+        view_class = self._view_class(get_last_modified=lambda self: last_modified)
+
+        response = view_class.as_view()(self._get_request())
+        self.assertEqual('Thu, 02 Jan 2020 03:04:05 GMT', response['Last-Modified'])
+        response = view_class.as_view()(self._get_request(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']))
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(1, view_class.calls)
+
+    def test_adds_weak_content_etag(self):
+        view = self._view_class(auto_etag=True, calls=5).as_view()
+        etag = view(self._get_request())['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        response = view(self._get_request(HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_returns_not_modified_for_matching_content_etag(self):
+        view_class = self._view_class(TemplateView, auto_etag=True, template_name='web_utils/paginator.html')
+        view = view_class.as_view()
+        etag = view(self._get_request()).render()['ETag']
+
+        response = view(self._get_request(HTTP_IF_NONE_MATCH=etag)).render()
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.content)
+        self.assertEqual('max-age=60', response['Cache-Control'])
+
+    def test_leaves_streaming_responses_alone(self):
+        view_class = self._view_class(auto_etag=True, get=lambda self, request: http.StreamingHttpResponse([b"a"]))
+        response = view_class.as_view()(self._get_request())
+        self.assertFalse(response.has_header('ETag'))
+
+    @async_views
+    async def test_returns_not_modified_for_matching_etag_on_async_views(self):
+        view_class = self._view_class(AsyncCountingView, get_etag=lambda self: "v1")
+        response = await view_class.as_view()(self._get_async_request(HTTP_IF_NONE_MATCH='W/"v1"'))
+
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(0, view_class.calls)
+
+    @async_views
+    async def test_combines_with_cache_mixin_on_async_views(self):
+        bases = (mixins.CacheMixin, mixins.CacheControlMixin, AsyncCountingView)
+        view = type('View', bases, {'calls': 0, 'cache_timeout': 30}).as_view()
+        response = await view(self._get_async_request('/combined/'))
+        self.assertEqual('max-age=30', response['Cache-Control'])
+
+
+class StaleWhileRevalidateCacheMixinTests(MixinTestCase):
+
+    def _view_class(self, view=SlowCountingView, **attrs):
+        attrs.setdefault('calls', 0)
+        return type('View', (mixins.StaleWhileRevalidateCacheMixin, view), attrs)
+
+    def _get_concurrently(self, view, path, count=5):
+        responses = []
+
+        def get():
+            responses.append(view(self._get_request(path)))
+
+        threads = [threading.Thread(target=get) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(response.content for response in responses)
+
+    def test_serves_cached_response(self):
+        view_class = self._view_class(CountingView)
+        view = view_class.as_view()
+        view(self._get_request('/stale/'))
+        response = view(self._get_request('/stale/'))
+
+        self.assertEqual(b"calls: 1", response.content)
+        self.assertEqual('max-age=60', response['Cache-Control'])
+
+    def test_generates_missing_page_once_for_concurrent_requests(self):
+        view_class = self._view_class()
+        contents = self._get_concurrently(view_class.as_view(), '/cold/')
+
+        self.assertEqual(1, view_class.calls)
+        self.assertEqual([b"calls: 1"] * 5, contents)
+
+    # the clock of both the mixin and the cache backend
+    @mock.patch('time.time', return_value=1000)
+    def test_serves_stale_response_while_one_request_regenerates(self, clock):
+        view_class = self._view_class(cache_timeout=1)
+        view = view_class.as_view()
+        view(self._get_request('/expired/'))
+        clock.return_value = 1001.1
+
+        contents = self._get_concurrently(view, '/expired/')
+
+        self.assertEqual(2, view_class.calls)
+        self.assertEqual([b"calls: 1"] * 4 + [b"calls: 2"], contents)
+        self.assertEqual(b"calls: 2", view(self._get_request('/expired/')).content)
+
+    @mock.patch('time.time', return_value=1000)
+    def test_regenerates_after_grace_period(self, clock):
+        view_class = self._view_class(CountingView, cache_timeout=1, cache_grace_period=0)
+        view = view_class.as_view()
+        view(self._get_request('/gone/'))
+        clock.return_value = 1001.1
+
+        self.assertEqual(b"calls: 2", view(self._get_request('/gone/')).content)
+
+    @mock.patch('time.time', return_value=1000)
+    def test_has_no_stale_response_after_grace_period(self, clock):
+        view_class = self._view_class(CountingView, cache_timeout=1, cache_grace_period=1)
+        request = self._get_request('/grace/')
+        view_class.as_view()(request)
+        # another request is regenerating the page
+        cache.add(view_class()._lock_key(request), True)
+
+        clock.return_value = 1001.5
+        self.assertEqual(b"calls: 1", view_class()._get_cached_response(request)[0].content)
+        clock.return_value = 1002.1
+        self.assertEqual((None, False), view_class()._get_cached_response(request))
+
+    def test_releases_lock_when_view_raises(self):
+        view_class = self._view_class(CountingView, get=mock.Mock(side_effect=ValueError))
+        with self.assertRaises(ValueError):
+            view_class.as_view()(self._get_request('/error/'))
+        self.assertIsNone(cache.get(view_class()._lock_key(self._get_request('/error/'))))
+
+    def test_doesnt_cache_post_requests(self):
+        view_class = self._view_class(CountingView, post=CountingView.get)
+        view = view_class.as_view()
+        view(test.RequestFactory().post('/post/'))
+        view(test.RequestFactory().post('/post/'))
+        self.assertEqual(2, view_class.calls)
+
+    @async_views
+    async def test_serves_cached_response_to_async_views(self):
+        view_class = self._view_class(AsyncCountingView)
+        view = view_class.as_view()
+        await view(self._get_async_request('/async-stale/'))
+        response = await view(self._get_async_request('/async-stale/'))
+
+        self.assertEqual(b"calls: 1", response.content)
+        self.assertEqual(1, view_class.calls)
+
+
+class FragmentPageView(mixins.FragmentCacheMixin, TemplateView):
+    template_name = 'page.html'
+    calls = 0
+
+    def get_context_data(self, **kwargs):
+        type(self).calls += 1
+        return {'title': "page {0}".format(self.calls)}
+
+
+@test.override_settings(TEMPLATES=FRAGMENT_TEMPLATES)
+class FragmentCacheMixinTests(MixinTestCase):
+
+    def setUp(self):
+        super(FragmentCacheMixinTests, self).setUp()
+        FragmentPageView.calls = 0
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+
+    def _get(self, user=None, path='/fragments/', view_class=FragmentPageView, **headers):
+        request = test.RequestFactory().get(path, **headers)
+        request.user = user or AnonymousUser()
+        response = view_class.as_view()(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response.content.decode('utf-8')
+
+    def test_renders_page_once_with_fragments_per_user(self):
+        self.assertEqual("<h1>page 1</h1>Hi alice", self._get(self.alice))
+        self.assertEqual("<h1>page 1</h1>Hi bob", self._get(self.bob))
+        self.assertEqual("<h1>page 1</h1>Hi ", self._get())
+        self.assertEqual(1, FragmentPageView.calls)
+
+    def test_caches_fragments_per_user(self):
+        self._get(self.alice)
+        with mock.patch.object(fragments, 'render_fragment') as render_fragment:
+            self.assertEqual("<h1>page 1</h1>Hi alice", self._get(self.alice))
+        self.assertFalse(render_fragment.called)
+
+    def test_doesnt_cache_anonymous_fragments(self):
+        self._get()
+        with mock.patch.object(fragments, 'render_fragment', return_value="Hi ") as render_fragment:
+            self.assertEqual("<h1>page 1</h1>Hi ", self._get())
+        self.assertTrue(render_fragment.called)
+
+    def test_caches_fragments_per_path(self):
+        self._get(self.alice, path='/one/')
+        with mock.patch.object(fragments, 'render_fragment', return_value="Hi alice") as render_fragment:
+            self._get(self.alice, path='/two/')
+        self.assertTrue(render_fragment.called)
+
+    def test_caches_csrf_fragments_per_csrf_secret(self):
+        view_class = type('View', (FragmentPageView, ), {'template_name': 'form.html'})
+        first = self._get(self.alice, view_class=view_class, CSRF_COOKIE='a' * 32)
+        with mock.patch.object(fragments, 'get_token') as get_token:
+            self.assertEqual(first, self._get(self.alice, view_class=view_class, CSRF_COOKIE='a' * 32))
+        self.assertTrue(get_token.called)
+        with mock.patch.object(fragments, 'render_fragment', return_value="") as render_fragment:
+            self._get(self.alice, view_class=view_class, CSRF_COOKIE='b' * 32)
+        self.assertTrue(render_fragment.called)
+
+    def test_doesnt_cache_csrf_fragments_without_csrf_secret(self):
+        view_class = type('View', (FragmentPageView, ), {'template_name': 'form.html'})
+        self._get(self.alice, view_class=view_class)
+        with mock.patch.object(fragments, 'render_fragment', return_value="") as render_fragment:
+            self._get(self.alice, view_class=view_class)
+        self.assertTrue(render_fragment.called)
+
+    def test_doesnt_cache_pages_with_fragments_of_unnamed_templates(self):
+        class StringTemplateView(mixins.FragmentCacheMixin, CountingView):
+            def get(self, request, *args, **kwargs):
+                type(self).calls += 1
+                page = template.Template(
+                    '{% load fragment_tags %}{% user_fragment menu %}Hi {{ user }}{% enduser_fragment %}'
+                )
+                return http.HttpResponse(page.render(template.RequestContext(request)))
+
+        self.assertEqual("Hi alice", self._get(self.alice, view_class=StringTemplateView))
+        self.assertEqual("Hi bob", self._get(self.bob, view_class=StringTemplateView))
+        self.assertEqual(2, StringTemplateView.calls)
+
+    def test_stops_leaving_out_fragments_when_view_fails(self):
+        request = self._get_request('/fragments/', self.alice)
+        with mock.patch.object(FragmentPageView, 'get', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                FragmentPageView.as_view()(request)
+        self.assertFalse(getattr(request, fragments.CACHING_ATTRIBUTE))
+
+    def test_stops_leaving_out_fragments_when_rendering_fails(self):
+        request = self._get_request('/fragments/', self.alice)
+        response = FragmentPageView.as_view()(request)
+        with mock.patch.object(template.base.Template, 'render', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                response.render()
+        self.assertFalse(getattr(request, fragments.CACHING_ATTRIBUTE))
+
+    def test_renders_fragments_again_for_new_user_key(self):
+        self._get(self.alice)
+        self.alice.username = "alice2"
+        with mock.patch.object(FragmentPageView, 'get_fragment_user_key', return_value='alice-v2'):
+            self.assertEqual("<h1>page 1</h1>Hi alice2", self._get(self.alice))
+
+    def test_caches_page_per_varied_header(self):
+        with mock.patch.object(FragmentPageView, 'render_to_response', autospec=True) as render_to_response:
+            render_to_response.side_effect = self._render_varying_on_language
+            self._get(self.alice, HTTP_ACCEPT_LANGUAGE='en')
+            self._get(self.alice, HTTP_ACCEPT_LANGUAGE='de')
+            self._get(self.bob, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(2, FragmentPageView.calls)
+
+    def _render_varying_on_language(self, view, context):
+        response = TemplateView.render_to_response(view, context)
+        response['Vary'] = 'Accept-Language, Cookie'
+        return response
+
+    def test_doesnt_cache_private_pages(self):
+        def render_private(view, context):
+            response = TemplateView.render_to_response(view, context)
+            response['Cache-Control'] = 'private'
+            return response
+
+        with mock.patch.object(FragmentPageView, 'render_to_response', autospec=True, side_effect=render_private):
+            self.assertEqual("<h1>page 1</h1>Hi alice", self._get(self.alice))
+            self.assertEqual("<h1>page 2</h1>Hi bob", self._get(self.bob))
+
+    def test_doesnt_cache_pages_setting_cookies_for_requests_without_cookies(self):
+        def render_with_cookie(view, context):
+            response = TemplateView.render_to_response(view, context)
+            response.set_cookie('sessionid', 'alice')
+            patch_vary_headers(response, ('Cookie', ))
+            return response
+
+        with mock.patch.object(FragmentPageView, 'render_to_response', autospec=True, side_effect=render_with_cookie):
+            self._get(self.alice)
+            self._get(self.bob)
+        self.assertEqual(2, FragmentPageView.calls)
+
+    def test_leaves_forged_markers_alone(self):
+        content = "<!--web_utils.fragment:forged:marker-->"
+        self.assertEqual(content, fragments.render_user_fragments(None, content, None, cache, 60))
+
+    def test_renders_fragment_contents_outside_of_cached_views(self):
+        t = template.Template('{% load fragment_tags %}{% user_fragment menu %}Hi {{ name }}{% enduser_fragment %}')
+        self.assertEqual("Hi you", t.render(template.Context({'name': "you"})))
+
+
+class UserExportView(mixins.StreamingExportMixin, View):
+    export_fields = ('username', 'email', 'balance')
+    money_fields = ('balance', )
+
+    def get_queryset(self):
+        balance = Value(Decimal('1250.5'), output_field=DecimalField(max_digits=10, decimal_places=2))
+        return User.objects.annotate(balance=balance).order_by('username')
+
+
+class StaffUserExportView(mixins.StaffMemberRequiredMixin, UserExportView):
+    pass
+
+
+class StreamingExportMixinTests(MixinTestCase):
+
+    def setUp(self):
+        super(StreamingExportMixinTests, self).setUp()
+        for n in range(3):
+            User.objects.create(username='user{0}'.format(n), email='user{0}@example.com'.format(n))
+
+    def _content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_streams_csv_with_formatted_money_fields(self):
+        response = UserExportView.as_view()(self._get_request())
+        self.assertTrue(response.streaming)
+        self.assertEqual('text/csv; charset=utf-8', response['Content-Type'])
+        self.assertEqual('attachment; filename="export.csv"', response['Content-Disposition'])
+        self.assertEqual(
+            'username,email,balance\r\n'
+            'user0,user0@example.com,"$1,250.50"\r\n'
+            'user1,user1@example.com,"$1,250.50"\r\n'
+            'user2,user2@example.com,"$1,250.50"\r\n',
+            self._content(response)
+        )
+
+    def test_uses_export_headers(self):
+        view = UserExportView.as_view(export_headers=('User', 'Email', 'Balance'))
+        content = self._content(view(self._get_request()))
+        self.assertTrue(content.startswith('User,Email,Balance\r\n'))
+
+    def test_formats_money_for_currency_and_locale(self):
+        view = UserExportView.as_view(export_currency='EUR', export_locale='de_DE')
+        content = self._content(view(self._get_request()))
+        self.assertIn('user0@example.com,"1.250,50\u00a0\u20ac"', content)
+
+    def test_escapes_csv_formulas(self):
+        User.objects.filter(username='user0').update(first_name='=HYPERLINK("http://example.com")')
+        User.objects.filter(username='user1').update(first_name='-1+2')
+        User.objects.filter(username='user2').update(first_name='@SUM(A1)')
+        view = UserExportView.as_view(export_fields=('first_name', ), money_fields=())
+        self.assertEqual(
+            'first_name\r\n"\'=HYPERLINK(""http://example.com"")"\r\n\'-1+2\r\n\'@SUM(A1)\r\n',
+            self._content(view(self._get_request()))
+        )
+
+    def test_leaves_missing_money_empty(self):
+        class NoBalanceExportView(UserExportView):
+            def get_queryset(self):
+                balance = Value(None, output_field=DecimalField(max_digits=10, decimal_places=2))
+                return User.objects.annotate(balance=balance).order_by('username')
+
+        content = self._content(NoBalanceExportView.as_view()(self._get_request()))
+        self.assertIn('user0,user0@example.com,\r\n', content)
+
+    def test_streams_ndjson_from_format_parameter(self):
+        response = UserExportView.as_view()(self._get_request('/?format=ndjson'))
+        self.assertEqual('application/x-ndjson; charset=utf-8', response['Content-Type'])
+        self.assertEqual('attachment; filename="export.ndjson"', response['Content-Disposition'])
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(
+            [('user{0}'.format(n), 'user{0}@example.com'.format(n), Decimal('1250.5')) for n in range(3)],
+            [(row['username'], row['email'], Decimal(row['balance'])) for row in rows]
+        )
+
+    def test_raises_404_for_unknown_format(self):
+        with self.assertRaises(http.Http404):
+            UserExportView.as_view()(self._get_request('/?format=xlsx'))
+
+    def test_writes_chunks_of_about_buffer_size(self):
+        view = UserExportView.as_view(export_buffer_size=60)
+        chunks = list(view(self._get_request()).streaming_content)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), 60)
+            self.assertLess(len(chunk), 60 + 40)
+
+    def test_reads_rows_with_iterator(self):
+        view = UserExportView.as_view(export_chunk_size=2)
+        with mock.patch('django.db.models.query.QuerySet.iterator', return_value=iter([])) as iterator:
+            self._content(view(self._get_request()))
+        iterator.assert_called_once_with(chunk_size=2)
+
+    @mock.patch('django.contrib.auth.decorators.resolve_url', mock.Mock(return_value='/admin/login/'))
+    def test_composes_with_staff_member_required(self):
+        response = StaffUserExportView.as_view()(self._get_request())
+        self.assertEqual(302, response.status_code)
+
+        staff = User.objects.create(username='staff', is_staff=True)
+        response = StaffUserExportView.as_view()(self._get_request(user=staff))
+        self.assertIn('staff,,"$1,250.50"', self._content(response))
@@ -0,0 +1,195 @@
+import datetime
+
+import mock
+from django import template
+from django import test
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import EmptyPage, InvalidPage
+from django.db import connection
+from django.db.models import Count, F
+from django.db.models.functions import Lower
+
+from web_utils import pagination
+
+
+class KeysetPaginatorTests(test.TestCase):
+
+    def setUp(self):
+        for last_name, username in (("a", "u1"), ("b", "u2"), ("b", "u3"), ("b", "u4"), ("c", "u5")):
+            User.objects.create(username=username, last_name=last_name)
+        self.paginator = pagination.KeysetPaginator(User.objects.all(), 2, ordering=('last_name', ))
+
+    def _usernames(self, page):
+        return [user.username for user in page]
+
+    def test_adds_primary_key_to_ordering(self):
+        self.assertEqual(('last_name', 'pk'), self.paginator.ordering)
+        paginator = pagination.KeysetPaginator(User.objects.all(), 2, ordering=('-date_joined', 'id'))
+        self.assertEqual(('-date_joined', 'id'), paginator.ordering)
+
+    def test_pages_forward_through_ties(self):
+        first = self.paginator.page()
+        second = self.paginator.page(first.next_cursor())
+        third = self.paginator.page(second.next_cursor())
+
+        self.assertEqual(["u1", "u2"], self._usernames(first))
+        self.assertEqual(["u3", "u4"], self._usernames(second))
+        self.assertEqual(["u5"], self._usernames(third))
+        self.assertFalse(first.has_previous())
+        self.assertTrue(second.has_previous() and second.has_next())
+        self.assertFalse(third.has_next())
+        self.assertIsNone(third.next_cursor())
+
+    def test_pages_backwards(self):
+        second = self.paginator.page(self.paginator.page().next_cursor())
+        third = self.paginator.page(second.next_cursor())
+
+        back = self.paginator.page(third.previous_cursor())
+        self.assertEqual(["u3", "u4"], self._usernames(back))
+        first = self.paginator.page(back.previous_cursor())
+        self.assertEqual(["u1", "u2"], self._usernames(first))
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_pages_descending_ordering(self):
+        paginator = pagination.KeysetPaginator(User.objects.all(), 3, ordering=('-last_name', ))
+        first = paginator.page()
+        self.assertEqual(["u5", "u4", "u3"], self._usernames(first))
+        self.assertEqual(["u2", "u1"], self._usernames(paginator.page(first.next_cursor())))
+
+    def test_orders_by_f_expressions(self):
+        paginator = pagination.KeysetPaginator(User.objects.all(), 3, ordering=(F('last_name').desc(), ))
+        self.assertEqual(('-last_name', '-pk'), paginator.ordering)
+        paginator = pagination.KeysetPaginator(User.objects.all(), 3, ordering=(F('last_name').asc(), F('pk')))
+        self.assertEqual(('last_name', 'pk'), paginator.ordering)
+        paginator = pagination.KeysetPaginator(User.objects.order_by(F('last_name').desc()), 3)
+        self.assertEqual(["u5", "u4", "u3"], self._usernames(paginator.page()))
+
+    def test_raises_improperly_configured_for_other_orderings(self):
+        with self.assertRaises(ImproperlyConfigured):
+            pagination.KeysetPaginator(User.objects.all(), 2, ordering=(Lower('last_name'), ))
+
+    def test_pages_through_datetimes_in_the_same_millisecond(self):
+        joined = datetime.datetime(2024, 1, 1, 0, 0, 0, 123000)
+        for n in range(5):
+            date_joined = joined + datetime.timedelta(microseconds=n * 100)
+            User.objects.create(username="t{0}".format(n), date_joined=date_joined)
+        queryset = User.objects.filter(username__startswith="t")
+
+        for ordering, expected in (('date_joined', ["t0", "t1", "t2", "t3", "t4"]),
+                                   ('-date_joined', ["t4", "t3", "t2", "t1", "t0"])):
+            paginator = pagination.KeysetPaginator(queryset, 2, ordering=(ordering, ))
+            page, usernames = paginator.page(), []
+            for _ in range(len(expected)):
+                usernames.extend(self._usernames(page))
+                if not page.has_next():
+                    break
+                page = paginator.page(page.next_cursor())
+            self.assertEqual(expected, usernames)
+
+    def test_keeps_microseconds_in_cursors(self):
+        value = datetime.datetime(2024, 1, 1, 0, 0, 0, 123456)
+        cursor = pagination.encode_cursor('n', [value, value.date(), value.time()])
+        self.assertEqual(('n', [value, value.date(), value.time()]), pagination.decode_cursor(cursor))
+
+    def test_doesnt_count(self):
+        with mock.patch('django.db.models.query.QuerySet.count') as count:
+            self.paginator.page()
+        self.assertFalse(count.called)
+
+    def test_raises_invalid_page_for_bad_cursors(self):
+        for cursor in ("not a cursor", pagination.encode_cursor('x', [1, 2]), pagination.encode_cursor('n', [1])):
+            with self.assertRaises(InvalidPage):
+                self.paginator.page(cursor)
+
+    def test_raises_invalid_page_for_cursor_values_of_the_wrong_type(self):
+        paginator = pagination.KeysetPaginator(User.objects.all(), 2, ordering=('date_joined', ))
+        for values in (["b", "not a pk"], ["not a date", 1], [["a list"], 1], [{"dt": "not a date"}, 1]):
+            with self.assertRaises(InvalidPage):
+                paginator.page(pagination.encode_cursor('n', values))
+
+
+class EstimateCountTests(test.TestCase):
+
+    def test_returns_none_without_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute("DELETE FROM sqlite_stat1")
+        self.assertIsNone(pagination.estimate_count(User.objects.all()))
+
+    def test_uses_sqlite_statistics(self):
+        for n in range(3):
+            User.objects.create(username="user{0}".format(n))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(3, pagination.estimate_count(User.objects.all()))
+
+    def test_returns_none_for_filtered_querysets_on_sqlite(self):
+        self.assertIsNone(pagination.estimate_count(User.objects.filter(is_staff=True)))
+
+    def test_returns_none_for_grouped_distinct_and_combined_querysets_on_sqlite(self):
+        for n in range(3):
+            User.objects.create(username="user{0}".format(n))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        querysets = (
+            User.objects.values('is_staff').annotate(users=Count('pk')),
+            User.objects.values('is_staff').distinct(),
+            User.objects.all().union(User.objects.all()),
+        )
+        for queryset in querysets:
+            self.assertIsNone(pagination.estimate_count(queryset))
+
+
+class EstimatedCountPaginatorTests(test.TestCase):
+
+    def setUp(self):
+        for n in range(5):
+            User.objects.create(username="user{0}".format(n))
+
+    @mock.patch.object(pagination, 'estimate_count', mock.Mock(return_value=None))
+    def test_counts_without_estimate(self):
+        paginator = pagination.EstimatedCountPaginator(User.objects.order_by('pk'), 2)
+        self.assertEqual(5, paginator.count)
+
+    @mock.patch.object(pagination, 'estimate_count', mock.Mock(return_value=3))
+    def test_counts_small_estimates(self):
+        paginator = pagination.EstimatedCountPaginator(User.objects.order_by('pk'), 2)
+        self.assertEqual(5, paginator.count)
+
+    @mock.patch.object(pagination, 'estimate_count', mock.Mock(return_value=3))
+    def test_uses_large_estimates(self):
+        paginator = pagination.EstimatedCountPaginator(User.objects.order_by('pk'), 2, exact_count_below=2)
+        with mock.patch('django.db.models.query.QuerySet.count') as count:
+            self.assertEqual(2, paginator.num_pages)
+        self.assertFalse(count.called)
+
+        self.assertEqual(["user4"], [user.username for user in paginator.page(3)])
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+    @mock.patch.object(pagination, 'estimate_count', mock.Mock(return_value=None))
+    def test_raises_empty_page_past_exact_count(self):
+        paginator = pagination.EstimatedCountPaginator(User.objects.order_by('pk'), 2)
+        with self.assertRaises(EmptyPage):
+            paginator.page(99)
+        with self.assertRaises(EmptyPage):
+            paginator.validate_number(4)
+
+
+class ShowKeysetPaginatorTests(test.TestCase):
+
+    def test_renders_links_keeping_get_parameters(self):
+        for n in range(3):
+            User.objects.create(username="user{0}".format(n))
+        paginator = pagination.KeysetPaginator(User.objects.all(), 1, ordering=('username', ))
+        page = paginator.page(paginator.page().next_cursor())
+        params = test.RequestFactory().get("/", data={"q": "a b", "cursor": "old"}).GET
+
+        t = template.Template("{% load paginator_tags %}{% show_keyset_paginator page params %}")
+        html = t.render(template.Context({'page': page, 'params': params}))
+
+        self.assertIn('href="?q=a+b&amp;cursor={0}"'.format(page.next_cursor()), html)
+        self.assertIn('href="?q=a+b&amp;cursor={0}"'.format(page.previous_cursor()), html)
@@ -0,0 +1,184 @@
+import asyncio
+from io import StringIO
+
+from django import http
+from django import template
+from django import test
+from django.core.management import call_command
+from django.urls import path
+
+from web_utils import profiling
+from web_utils.middleware import TemplateProfilingMiddleware
+from web_utils.templatetags import formatting_tags
+
+TEMPLATE = "{% load formatting_tags html_tags %}{% format_currency amount %}{% activate '/' %}"
+
+
+def render_view(request):
+    return http.HttpResponse(template.Template(TEMPLATE).render(template.Context({'amount': 5})))
+
+
+urlpatterns = [
+    path('prices/', render_view),
+]
+
+
+class TagTimingTests(test.TestCase):
+
+    def test_counts_and_totals_samples(self):
+        timing = profiling.TagTiming()
+        for seconds in (0.1, 0.2, 0.3):
+            timing.add(seconds)
+        self.assertEqual(3, timing.count)
+        self.assertAlmostEqual(0.6, timing.total)
+
+    def test_returns_95th_percentile(self):
+        timing = profiling.TagTiming()
+        for i in range(1, 101):
+            timing.add(i)
+        self.assertEqual(96, timing.p95)
+
+    def test_returns_zero_percentile_without_samples(self):
+        self.assertEqual(0, profiling.TagTiming().p95)
+
+    def test_keeps_most_recent_samples(self):
+        timing = profiling.TagTiming(max_samples=2)
+        for seconds in (1, 2, 3):
+            timing.add(seconds)
+        self.assertEqual([2, 3], list(timing.samples))
+        self.assertEqual(3, timing.count)
+
+
+class TagStatsTests(test.TestCase):
+
+    def test_groups_timings_by_template(self):
+        stats = profiling.TagStats()
+        stats.add('activate', 'base.html', 1)
+        stats.add('activate', 'base.html', 1)
+        stats.add('activate', 'nav.html', 3)
+        self.assertEqual(
+            [(('activate', 'nav.html'), 1, 3), (('activate', 'base.html'), 2, 2)],
+            [(key, timing.count, timing.total) for key, timing in stats.by_template()]
+        )
+
+    def test_groups_timings_by_tag(self):
+        stats = profiling.TagStats()
+        stats.add('activate', 'base.html', 1)
+        stats.add('activate', 'nav.html', 3)
+        stats.add('format_currency', 'base.html', 5)
+        self.assertEqual(
+            [('format_currency', 1, 5), ('activate', 2, 4)],
+            [(key, timing.count, timing.total) for key, timing in stats.by_tag()]
+        )
+
+    def test_returns_server_timing_in_milliseconds(self):
+        stats = profiling.TagStats()
+        stats.add('activate', 'base.html', 0.002)
+        self.assertEqual('activate;dur=2.000;desc="1 calls, p95 2.000ms"', stats.server_timing())
+
+
+class ProfileTagsTests(test.TestCase):
+
+    def setUp(self):
+        profiling.install()
+        self.addCleanup(profiling.uninstall)
+
+    def test_records_tag_renders_per_template(self):
+        compiled = template.Template(TEMPLATE)
+        with profiling.profile_tags() as stats:
+            compiled.render(template.Context({'amount': 5}))
+            compiled.render(template.Context({'amount': 5}))
+
+        timings = dict(stats.by_template())
+        self.assertEqual(2, timings[('format_currency', profiling.UNKNOWN_TEMPLATE)].count)
+        self.assertEqual(2, timings[('activate', profiling.UNKNOWN_TEMPLATE)].count)
+
+    def test_doesnt_record_outside_of_profile_tags(self):
+        compiled = template.Template(TEMPLATE)
+        with profiling.profile_tags() as stats:
+            pass
+        self.assertEqual("$5.00", compiled.render(template.Context({'amount': 5})))
+        self.assertEqual({}, stats.timings)
+
+    def test_records_template_name(self):
+        engine = template.Engine(
+            loaders=[('django.template.loaders.locmem.Loader', {'prices.html': TEMPLATE})],
+            libraries={
+                'formatting_tags': 'web_utils.templatetags.formatting_tags',
+                'html_tags': 'web_utils.templatetags.html_tags',
+            },
+        )
+        compiled = engine.get_template('prices.html')
+        with profiling.profile_tags() as stats:
+            compiled.render(template.Context({'amount': 5}))
+        self.assertIn(('format_currency', 'prices.html'), stats.timings)
+
+    def test_doesnt_change_output(self):
+        compiled = template.Template(TEMPLATE)
+        with profiling.profile_tags():
+            self.assertEqual("$5.00", compiled.render(template.Context({'amount': 5})))
+
+    def test_installs_once(self):
+        profiling.install()
+        compile_function = formatting_tags.register.tags['format_currency']
+        self.assertIs(formatting_tags.do_format_currency, compile_function.unprofiled)
+
+    def test_uninstall_restores_compile_functions(self):
+        profiling.uninstall()
+        self.assertIs(formatting_tags.do_format_currency, formatting_tags.register.tags['format_currency'])
+
+
+class TemplateProfilingMiddlewareTests(test.TestCase):
+
+    def setUp(self):
+        self.addCleanup(profiling.uninstall)
+
+    def test_adds_server_timing_header(self):
+        middleware = TemplateProfilingMiddleware(render_view)
+        response = middleware(test.RequestFactory().get('/'))
+        self.assertIn('format_currency;dur=', response['Server-Timing'])
+        self.assertIn('activate;dur=', response['Server-Timing'])
+
+    def test_appends_to_server_timing_header(self):
+        def view(request):
+            response = render_view(request)
+            response['Server-Timing'] = 'db;dur=53'
+            return response
+        response = TemplateProfilingMiddleware(view)(test.RequestFactory().get('/'))
+        self.assertTrue(response['Server-Timing'].startswith('db;dur=53, '))
+
+    def test_leaves_out_header_when_no_tags_rendered(self):
+        response = TemplateProfilingMiddleware(lambda request: http.HttpResponse())(test.RequestFactory().get('/'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_adds_server_timing_header_for_async_views(self):
+        async def view(request):
+            return render_view(request)
+        middleware = TemplateProfilingMiddleware(view)
+        response = asyncio.run(middleware(test.AsyncRequestFactory().get('/')))
+        self.assertIn('format_currency;dur=', response['Server-Timing'])
+
+
+@test.override_settings(ROOT_URLCONF='web_utils.tests.test_profiling')
+class ProfileTagsCommandTests(test.TestCase):
+
+    def setUp(self):
+        self.addCleanup(profiling.uninstall)
+
+    def test_prints_timings_per_tag(self):
+        out = StringIO()
+        call_command('profile_tags', '/prices/', repeat=3, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(['tag', 'calls', 'total', 'ms', 'p95', 'ms'], lines[0].split())
+        self.assertEqual({('format_currency', '3'), ('activate', '3')}, {tuple(line.split()[:2]) for line in lines[1:]})
+
+    def test_prints_timings_per_template(self):
+        out = StringIO()
+        call_command('profile_tags', '/prices/', repeat=1, by_template=True, stdout=out)
+        self.assertIn('format_currency (<unknown>)', out.getvalue())
+
+    def test_reports_paths_that_dont_render(self):
+        out, err = StringIO(), StringIO()
+        call_command('profile_tags', '/missing/', repeat=1, stdout=out, stderr=err)
+        self.assertIn('/missing/ returned 404', err.getvalue())
+        self.assertIn('No web_utils tags were rendered.', out.getvalue())
@@ -0,0 +1,291 @@
+import asyncio
+import threading
+
+import mock
+from django import http
+from django import test
+from django.core.cache import cache
+from django.urls import path
+
+from web_utils.middleware import RateLimitMiddleware
+from web_utils.ratelimit import RateLimiter, parse_rate, rate_limit
+from web_utils.urls import decorated_patterns
+
+
+def ok_view(request, *args, **kwargs):
+    return http.HttpResponse("ok")
+
+
+def get_user_agent(request):
+    return request.META.get('HTTP_USER_AGENT', '')
+
+
+@mock.patch('web_utils.ratelimit.time')
+class RateLimiterTests(test.TestCase):
+
+    def test_allows_rate_requests(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('3/m')
+        self.assertEqual([0, 0, 0], [limiter.hit('a') for _ in range(3)])
+
+    def test_returns_seconds_until_next_request_when_limited(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('3/m')
+        for _ in range(3):
+            limiter.hit('a')
+        self.assertAlmostEqual(20, limiter.hit('a'))
+
+    def test_refills_tokens_over_time(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('3/m')
+        for _ in range(3):
+            limiter.hit('a')
+        time.monotonic.return_value = 120
+        self.assertEqual(0, limiter.hit('a'))
+        self.assertGreater(limiter.hit('a'), 0)
+
+    def test_limits_keys_separately(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('1/m')
+        self.assertEqual(0, limiter.hit('a'))
+        self.assertEqual(0, limiter.hit('b'))
+        self.assertGreater(limiter.hit('a'), 0)
+
+    def test_drops_least_recently_used_bucket_when_out_of_room(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('1/m', maxsize=2)
+        limiter.hit('a')
+        limiter.hit('b')
+        limiter.hit('a')
+        limiter.hit('c')
+        self.assertEqual(2, len(limiter))
+        self.assertEqual(0, limiter.hit('b'))
+        self.assertGreater(limiter.hit('c'), 0)
+
+    def test_sweeps_full_buckets_before_dropping_limited_ones(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('10/m', maxsize=3)
+        for _ in range(11):
+            limiter.hit('limited')
+        time.monotonic.return_value = 101
+        limiter.hit('a')
+        limiter.hit('b')
+        # a and b filled up again, limited got 8 seconds worth of tokens
+        time.monotonic.return_value = 108
+        for key in ('c', 'd'):
+            limiter.hit(key)
+        self.assertEqual(3, len(limiter))
+        self.assertEqual(0, limiter.hit('limited'))
+        self.assertGreater(limiter.hit('limited'), 0)
+
+    def test_sweeps_buckets_of_ended_windows(self, time):
+        time.time.return_value = 1000
+        limiter = RateLimiter('1/m', maxsize=2, cache_alias='default')
+        with mock.patch.object(limiter, '_take_tokens', return_value=1):
+            limiter.hit('a')
+            time.time.return_value = 1030
+            limiter.hit('b')
+            time.time.return_value = 1100
+            limiter.hit('c')
+        # a's and b's windows ended, so both were swept
+        self.assertEqual(1, len(limiter))
+
+    def test_drops_a_batch_of_buckets_when_none_are_full(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('1/m', maxsize=20)
+        for key in range(21):
+            limiter.hit(key)
+        self.assertEqual(19, len(limiter))
+        self.assertEqual(0, limiter.hit(0))
+        self.assertGreater(limiter.hit(20), 0)
+
+    def test_keeps_limits_when_hit_from_threads(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('100/m')
+        results = []
+
+        def hit():
+            results.extend(limiter.hit('a') for _ in range(50))
+
+        threads = [threading.Thread(target=hit) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(100, results.count(0))
+
+    def test_adds_keys_from_threads_when_out_of_room(self, time):
+        time.monotonic.return_value = 100
+        limiter = RateLimiter('1/m', maxsize=10)
+        errors = []
+
+        def hit(offset):
+            try:
+                for key in range(offset, offset + 2000):
+                    limiter.hit(key)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=hit, args=(n * 2000,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(10, len(limiter))
+
+
+@mock.patch('web_utils.ratelimit.time')
+class SharedRateLimiterTests(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_shares_limit_between_limiters(self, time):
+        time.time.return_value = 1000
+        first, second = RateLimiter('4/m', cache_alias='default'), RateLimiter('4/m', cache_alias='default')
+        results = [limiter.hit('a') for limiter in (first, second, first, second, first)]
+        self.assertEqual([0, 0, 0, 0], results[:4])
+        self.assertAlmostEqual(20, results[4])
+
+    def test_takes_tokens_from_cache_in_batches(self, time):
+        time.time.return_value = 1000
+        limiter = RateLimiter('100/m', cache_alias='default')
+        with mock.patch.object(limiter, '_take_tokens', wraps=limiter._take_tokens) as take_tokens:
+            for _ in range(25):
+                self.assertEqual(0, limiter.hit('a'))
+        self.assertEqual(3, take_tokens.call_count)
+
+    def test_remembers_limited_keys_until_window_ends(self, time):
+        time.time.return_value = 1000
+        limiter = RateLimiter('1/m', cache_alias='default')
+        limiter.hit('a')
+        limiter.hit('a')
+        with mock.patch.object(limiter, '_take_tokens') as take_tokens:
+            self.assertAlmostEqual(20, limiter.hit('a'))
+        self.assertFalse(take_tokens.called)
+
+    def test_allows_requests_in_next_window(self, time):
+        time.time.return_value = 1000
+        limiter = RateLimiter('1/m', cache_alias='default')
+        limiter.hit('a')
+        self.assertGreater(limiter.hit('a'), 0)
+        time.time.return_value = 1020
+        self.assertEqual(0, limiter.hit('a'))
+
+
+class ParseRateTests(test.TestCase):
+
+    def test_parses_rates(self):
+        self.assertEqual((100, 60), parse_rate('100/m'))
+        self.assertEqual((10, 1), parse_rate('10/s'))
+        self.assertEqual((1000, 300), parse_rate('1000/5m'))
+        self.assertEqual((5, 86400), parse_rate('5/d'))
+
+    def test_raises_value_error_for_invalid_rates(self):
+        with self.assertRaises(ValueError):
+            parse_rate('100 per minute')
+
+
+class RateLimitDecoratorTests(test.TestCase):
+
+    def test_returns_429_with_retry_after_when_limited(self):
+        view = rate_limit('2/m')(ok_view)
+        request = test.RequestFactory().get('/')
+        self.assertEqual([200, 200], [view(request).status_code for _ in range(2)])
+        response = view(request)
+        self.assertEqual(429, response.status_code)
+        self.assertEqual('30', response['Retry-After'])
+
+    def test_limits_per_key(self):
+        view = rate_limit('1/m', key=get_user_agent)(ok_view)
+        self.assertEqual(200, view(test.RequestFactory().get('/', HTTP_USER_AGENT='a')).status_code)
+        self.assertEqual(200, view(test.RequestFactory().get('/', HTTP_USER_AGENT='b')).status_code)
+        self.assertEqual(429, view(test.RequestFactory().get('/', HTTP_USER_AGENT='a')).status_code)
+
+    def test_limits_async_views(self):
+        async def view(request):
+            return http.HttpResponse("ok")
+        view = rate_limit('1/m')(view)
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        request = test.AsyncRequestFactory().get('/')
+        self.assertEqual(200, asyncio.run(view(request)).status_code)
+        self.assertEqual(429, asyncio.run(view(request)).status_code)
+
+    def test_limits_views_in_decorated_patterns_separately(self):
+        patterns = decorated_patterns(rate_limit('1/m'), [path('one/', ok_view), path('two/', lambda r: ok_view(r))])
+        request = test.RequestFactory().get('/')
+        one, two = [pattern.resolve('one/' if n == 0 else 'two/').func for n, pattern in enumerate(patterns)]
+        self.assertEqual(200, one(request).status_code)
+        self.assertEqual(200, two(request).status_code)
+        self.assertEqual(429, one(request).status_code)
+
+
+class RateLimitMiddlewareTests(test.TestCase):
+
+    def _process_view(self, middleware, view_kwargs, path='/', **headers):
+        request = test.RequestFactory().get(path, **headers)
+        return middleware.process_view(request, ok_view, (), view_kwargs)
+
+    def test_limits_routes_with_rate_limit_kwarg(self):
+        middleware = RateLimitMiddleware(ok_view)
+        self.assertEqual(None, self._process_view(middleware, {'RATE_LIMIT': '1/m'}))
+        response = self._process_view(middleware, {'RATE_LIMIT': '1/m'})
+        self.assertEqual(429, response.status_code)
+        self.assertEqual('60', response['Retry-After'])
+
+    def test_removes_rate_limit_from_view_kwargs(self):
+        view_kwargs = {'RATE_LIMIT': '1/m', 'pk': 1}
+        self._process_view(RateLimitMiddleware(ok_view), view_kwargs)
+        self.assertEqual({'pk': 1}, view_kwargs)
+
+    def test_doesnt_limit_routes_without_rate_limit(self):
+        middleware = RateLimitMiddleware(ok_view)
+        self.assertEqual([None] * 3, [self._process_view(middleware, {}) for _ in range(3)])
+
+    def test_limits_routes_separately(self):
+        middleware = RateLimitMiddleware(ok_view)
+        self.assertEqual(None, self._process_view(middleware, {'RATE_LIMIT': '1/m'}, '/one/'))
+        self.assertEqual(None, self._process_view(middleware, {'RATE_LIMIT': '1/m'}, '/two/'))
+        self.assertEqual(429, self._process_view(middleware, {'RATE_LIMIT': '1/m'}, '/one/').status_code)
+
+    @test.override_settings(RATE_LIMIT_DEFAULT='1/m')
+    def test_limits_routes_without_rate_limit_with_default(self):
+        middleware = RateLimitMiddleware(ok_view)
+        self.assertEqual(None, self._process_view(middleware, {}))
+        self.assertEqual(429, self._process_view(middleware, {}).status_code)
+
+    @test.override_settings(RATE_LIMIT_ENABLED=False)
+    def test_doesnt_limit_when_disabled(self):
+        middleware = RateLimitMiddleware(ok_view)
+        self.assertEqual([None] * 3, [self._process_view(middleware, {'RATE_LIMIT': '1/m'}) for _ in range(3)])
+
+    @test.override_settings(RATE_LIMIT_KEY='web_utils.tests.test_ratelimit.get_user_agent')
+    def test_uses_key_function_from_settings(self):
+        middleware = RateLimitMiddleware(ok_view)
+        self.assertEqual(None, self._process_view(middleware, {'RATE_LIMIT': '1/m'}, HTTP_USER_AGENT='a'))
+        self.assertEqual(None, self._process_view(middleware, {'RATE_LIMIT': '1/m'}, HTTP_USER_AGENT='b'))
+
+    @test.override_settings(RATE_LIMIT_CACHE='default')
+    def test_shares_limits_through_cache(self):
+        cache.clear()
+        first, second = RateLimitMiddleware(ok_view), RateLimitMiddleware(ok_view)
+        self.assertEqual(None, self._process_view(first, {'RATE_LIMIT': '1/m'}))
+        self.assertEqual(429, self._process_view(second, {'RATE_LIMIT': '1/m'}).status_code)
+
+    def test_reloads_settings_when_they_change(self):
+        middleware = RateLimitMiddleware(ok_view)
+        with test.override_settings(RATE_LIMIT_ENABLED=False):
+            self.assertEqual(None, self._process_view(middleware, {'RATE_LIMIT': '1/m'}))
+            self.assertEqual(None, self._process_view(middleware, {'RATE_LIMIT': '1/m'}))
+
+    def test_process_view_is_a_coroutine_under_asgi(self):
+        async def get_response(request):
+            return http.HttpResponse()
+
+        middleware = RateLimitMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware.process_view))
+        request = test.AsyncRequestFactory().get('/')
+        results = [asyncio.run(middleware.process_view(request, ok_view, (), {'RATE_LIMIT': '1/m'})) for _ in range(2)]
+        self.assertEqual(None, results[0])
+        self.assertEqual(429, results[1].status_code)
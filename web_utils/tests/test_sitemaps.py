@@ -0,0 +1,294 @@
+import datetime
+import shutil
+import tempfile
+from io import StringIO
+
+import mock
+from django import test
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.contrib.sitemaps import Sitemap
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.utils import timezone
+
+from web_utils import sitemaps
+from web_utils.sitemaps import ShardedSitemapBuilder, mark_sitemap_changed
+
+
+class UserSitemap(Sitemap):
+    changefreq = 'daily'
+
+    def items(self):
+        return User.objects.all()
+
+    def location(self, user):
+        return '/users/{0}/'.format(user.username)
+
+    def lastmod(self, user):
+        return user.date_joined
+
+
+class PageSitemap(Sitemap):
+    priority = 0.5
+
+    def items(self):
+        return ['/about/', '/contact/?a=1&b=2']
+
+    def location(self, page):
+        return page
+
+
+class StaffUser(User):
+
+    class Meta:
+        proxy = True
+        app_label = 'auth'
+
+
+class StaffUserSitemap(UserSitemap):
+
+    def items(self):
+        return StaffUser.objects.all()
+
+
+class SessionSitemap(Sitemap):
+
+    def items(self):
+        return Session.objects.all()
+
+    def location(self, session):
+        return '/sessions/{0}/'.format(session.session_key)
+
+
+SITEMAPS = {'pages': PageSitemap}
+
+
+class ShardedSitemapBuilderTests(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.storage = FileSystemStorage(location=directory, base_url='/media/')
+        self.builder = ShardedSitemapBuilder(
+            {'users': UserSitemap, 'pages': PageSitemap()}, 'https://www.example.com', storage=self.storage,
+            shard_size=2,
+        )
+        joined = datetime.datetime(2020, 1, 2)
+        self.users = [User.objects.create(username='user{0}'.format(n), date_joined=joined) for n in range(5)]
+
+    def _read(self, name=None, shard=None):
+        with self.storage.open(self.builder.get_file_name(name, shard)) as sitemap:
+            return sitemap.read().decode('utf-8')
+
+    def _user_shard(self, user):
+        return self.builder.get_shard(user)
+
+    def _user_shards(self):
+        return self.builder.get_shards(self.builder.sitemaps['users'])
+
+    def test_writes_shards_of_shard_size(self):
+        self.builder.build()
+        counts = [self._read('users', shard).count('<url>') for shard in self._user_shards()]
+        self.assertEqual(5, sum(counts))
+        self.assertLessEqual(max(counts), 2)
+
+    def test_writes_url_elements(self):
+        self.builder.build()
+        self.assertIn(
+            '<url><loc>https://www.example.com/users/user0/</loc><lastmod>2020-01-02</lastmod>'
+            '<changefreq>daily</changefreq></url>\n',
+            self._read('users', self._user_shard(self.users[0]))
+        )
+        self.assertEqual(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            '<url><loc>https://www.example.com/about/</loc><priority>0.5</priority></url>\n'
+            '<url><loc>https://www.example.com/contact/?a=1&amp;b=2</loc><priority>0.5</priority></url>\n'
+            '</urlset>\n',
+            self._read('pages', 0)
+        )
+
+    def test_writes_index_of_every_shard(self):
+        self.builder.build()
+        index = self._read()
+        shards = self._user_shards()
+        self.assertEqual(len(shards) + 1, index.count('<sitemap>'))
+        self.assertIn('<sitemap><loc>https://www.example.com/media/sitemaps/pages-0.xml</loc></sitemap>', index)
+        self.assertIn('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">', index)
+
+    def test_only_writes_changed_shards(self):
+        self.assertEqual(len(self._user_shards()) + 1, self.builder.build())
+        self.assertEqual(0, self.builder.build())
+
+        user = self.users[-1]
+        user.username = 'renamed'
+        user.save()
+        self.builder.mark_changed(user)
+        with mock.patch.object(self.builder, 'write_shard', wraps=self.builder.write_shard) as write_shard:
+            self.assertEqual(1, self.builder.build())
+        # the pages sitemap is rendered again to compare, but not written
+        self.assertEqual(
+            [mock.call('users', self._user_shard(user)), mock.call('pages', 0, only_if_changed=True)],
+            write_shard.call_args_list
+        )
+        self.assertIn('/users/renamed/', self._read('users', self._user_shard(user)))
+
+    def test_writes_every_shard_when_full(self):
+        self.builder.build()
+        self.assertEqual(len(self._user_shards()) + 1, self.builder.build(full=True))
+
+    def test_writes_missing_shards(self):
+        self.builder.build()
+        self.storage.delete(self.builder.get_file_name('pages', 0))
+        self.assertEqual(1, self.builder.build())
+        self.assertIn('/about/', self._read('pages', 0))
+
+    def test_writes_new_shards_for_new_objects(self):
+        self.builder.build()
+        user = User.objects.create(username='new', pk=self.users[-1].pk + 2)
+        self.builder.mark_changed(user)
+        self.builder.build()
+        self.assertIn('/users/new/', self._read('users', self._user_shard(user)))
+        self.assertIn('users-{0}.xml'.format(self._user_shard(user)), self._read())
+
+    def test_removes_deleted_objects(self):
+        self.builder.build()
+        user = self.users[0]
+        self.builder.mark_changed(user)
+        user.delete()
+        self.builder.build()
+        self.assertNotIn('/users/user0/', self._read('users', self.builder.get_shard(self.users[1])))
+
+    def test_only_writes_shards_with_urls(self):
+        User.objects.create(username='far', pk=self.users[-1].pk + 1000)
+        self.builder.build()
+        shards = self._user_shards()
+        self.assertEqual(len(shards) + 1, self._read().count('<sitemap>'))
+        for shard in shards:
+            self.assertIn('<url>', self._read('users', shard))
+        self.assertFalse(self.storage.exists(self.builder.get_file_name('users', shards[-1] - 1)))
+
+    def test_removes_shards_whose_objects_are_gone(self):
+        self.builder.build()
+        user = User.objects.create(username='far', pk=self.users[-1].pk + 1000)
+        self.builder.mark_changed(user)
+        self.builder.build()
+        file_name = self.builder.get_file_name('users', self._user_shard(user))
+        self.assertIn(self.storage.url(file_name), self._read())
+
+        self.builder.mark_changed(user)
+        user.delete()
+        self.builder.build()
+        self.assertNotIn(self.storage.url(file_name), self._read())
+        self.assertFalse(self.storage.exists(file_name))
+
+    def test_doesnt_index_empty_sitemaps(self):
+        builder = ShardedSitemapBuilder({'sessions': SessionSitemap}, 'https://www.example.com', storage=self.storage)
+        builder.build()
+        self.assertNotIn('<sitemap>', self._read())
+
+    def test_replaces_files_without_deleting_them(self):
+        self.builder.build()
+        user = self.users[0]
+        user.username = 'renamed'
+        user.save()
+        self.builder.mark_changed(user)
+        with mock.patch.object(self.storage, 'delete') as delete:
+            self.builder.build()
+        self.assertFalse(delete.called)
+        self.assertIn('/users/renamed/', self._read('users', self._user_shard(user)))
+        self.assertEqual(
+            sorted(['sitemap.xml', 'pages-0.xml'] + ['users-{0}.xml'.format(n) for n in self._user_shards()]),
+            sorted(self.storage.listdir('sitemaps')[1])
+        )
+
+    def test_writes_changed_sitemaps_of_lists_without_marking(self):
+        self.builder.build()
+        with mock.patch.object(PageSitemap, 'items', return_value=['/about/', '/jobs/']):
+            with mock.patch.object(self.builder, 'write_index', wraps=self.builder.write_index) as write_index:
+                self.assertEqual(1, self.builder.build())
+                self.assertEqual(0, self.builder.build())
+        self.assertIn('/jobs/', self._read('pages', 0))
+        self.assertEqual(1, write_index.call_count)
+
+    def test_ignores_objects_not_in_sitemaps(self):
+        self.builder.build()
+        self.builder.mark_changed(mock.Mock(pk=1))
+        self.assertEqual(0, self.builder.build())
+
+    def test_flags_unwritten_shards_again_when_build_fails(self):
+        self.builder.build()
+        self.builder.mark_changed(self.users[0])
+        with mock.patch.object(self.builder, 'write_shard', side_effect=IOError):
+            with self.assertRaises(IOError):
+                self.builder.build()
+        self.assertEqual(1, self.builder.build())
+
+    @test.override_settings(PING_GOOGLE_SITEMAP=True)
+    def test_pings_index_once_per_build(self):
+        pinger = mock.Mock()
+        with mock.patch('web_utils.sitemaps.get_sitemap_pinger', return_value=pinger):
+            self.builder.build()
+            for user in self.users:
+                self.builder.mark_changed(user)
+            self.builder.build()
+            self.builder.build()
+        self.assertEqual(
+            [mock.call('https://www.example.com/media/sitemaps/sitemap.xml')] * 2, pinger.enqueue.call_args_list
+        )
+
+    def test_writes_one_shard_for_non_integer_primary_keys(self):
+        builder = ShardedSitemapBuilder({'sessions': SessionSitemap}, 'https://www.example.com', storage=self.storage)
+        session = Session.objects.create(session_key='abc', session_data='', expire_date=timezone.now())
+        builder.build()
+        builder.mark_changed(session)
+        self.assertEqual(1, builder.build())
+        self.assertIn('/sessions/abc/', self._read('sessions', 0))
+
+    def test_marks_shards_of_proxy_models_changed(self):
+        builder = ShardedSitemapBuilder(
+            {'staff': StaffUserSitemap}, 'https://www.example.com', storage=self.storage, shard_size=2
+        )
+        builder.build()
+        builder.mark_changed(self.users[0])
+        builder.mark_changed(StaffUser.objects.get(pk=self.users[-1].pk))
+        self.assertEqual(2, builder.build())
+
+    def test_rejects_shards_over_protocol_limit(self):
+        with self.assertRaises(ValueError):
+            ShardedSitemapBuilder({}, 'https://www.example.com', shard_size=50001)
+
+
+class SitemapReceiverTests(test.TestCase):
+
+    def test_marks_instance_changed(self):
+        user = User(pk=3)
+        with mock.patch('web_utils.sitemaps.get_sitemap_builder') as get_sitemap_builder:
+            mark_sitemap_changed(User, instance=user, created=False)
+        get_sitemap_builder.return_value.mark_changed.assert_called_once_with(user)
+
+    @mock.patch('web_utils.sitemaps._sitemap_builder', None)
+    @test.override_settings(
+        SITEMAP_BUILDER_SITEMAPS='web_utils.tests.test_sitemaps.SITEMAPS', SITE_DOMAIN='https://www.example.com',
+        SITEMAP_BUILDER_LOCATION='maps', SITEMAP_BUILDER_SHARD_SIZE=10,
+    )
+    def test_builds_builder_from_settings(self):
+        builder = sitemaps.get_sitemap_builder()
+        self.assertEqual(['pages'], list(builder.sitemaps))
+        self.assertEqual('maps/sitemap.xml', builder.get_file_name())
+        self.assertEqual(10, builder.shard_size)
+
+
+class BuildSitemapsCommandTests(test.TestCase):
+
+    def test_builds_sitemaps(self):
+        builder = mock.Mock()
+        builder.build.return_value = 3
+        out = StringIO()
+        with mock.patch('web_utils.management.commands.build_sitemaps.get_sitemap_builder', return_value=builder):
+            call_command('build_sitemaps', full=True, stdout=out)
+        builder.build.assert_called_once_with(full=True)
+        self.assertEqual("Wrote 3 sitemap shards.\n", out.getvalue())
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 import mock
 from django import template
 from django import test
@@ -9,8 +11,8 @@ try:
 except ImportError:
     from urllib.parse import parse_qs
 
-from web_utils.formatting import format_currency
-from web_utils.templatetags import formatting_tags, analytics_tags, html_tags, paginator_tags
+from web_utils.formatting import CurrencyFormatter, format_currency, format_currency_many, get_currency_formatter
+from web_utils.templatetags import formatting_tags, analytics_tags, html_tags, paginator_tags, settings_tags
 
 
 class FormatCurrencyTests(test.TestCase):
@@ -44,6 +46,101 @@ class FormatCurrencyTests(test.TestCase):
         self.assertEqual("$0.00", amount)
 
 
+class FormatCurrencyManyTests(test.TestCase):
+
+    def test_formats_like_format_currency(self):
+        values = [0, None, 123, 123.123456, 1000, -5, Decimal('1234.5')]
+        self.assertEqual([format_currency(v) for v in values], format_currency_many(values))
+        self.assertEqual([format_currency(v, 4) for v in values], format_currency_many(values, 4))
+
+    def test_shows_empty_string_for_zero_when_show_zero_is_false(self):
+        amounts = format_currency_many([0, None, Decimal('0.00'), 12], show_zero=False)
+        self.assertEqual(["", "", "", "$12.00"], amounts)
+
+    def test_formats_integer_cents(self):
+        amounts = format_currency_many([0, 5, 123456, -150], cents=True)
+        self.assertEqual(["$0.00", "$0.05", "$1,234.56", "$-1.50"], amounts)
+
+    def test_formats_integer_cents_without_decimal_places(self):
+        amounts = format_currency_many([1250, 0], places=0, cents=True, show_zero=False)
+        self.assertEqual(["$1,250", ""], amounts)
+
+    def test_formats_integer_cents_with_many_decimal_places(self):
+        amounts = format_currency_many([12345678], places=4, cents=True)
+        self.assertEqual(["$1,234.5678"], amounts)
+
+    def test_streams_formatted_values(self):
+        amounts = format_currency_many(iter([1, 2]), stream=True)
+        self.assertEqual("$1.00", next(amounts))
+        self.assertEqual(["$2.00"], list(amounts))
+
+    def test_formats_objects_with_tolist_like_numpy_arrays(self):
+        values = mock.Mock(tolist=mock.Mock(return_value=[1.5, 2]))
+        self.assertEqual(["$1.50", "$2.00"], format_currency_many(values))
+
+
+class CurrencyFormatterTests(test.TestCase):
+
+    def test_formats_euros_for_germany(self):
+        formatter = CurrencyFormatter('EUR', 'de_DE')
+        self.assertEqual("1.234.567,89\u00a0€", formatter.format(1234567.891))
+
+    def test_formats_decimals_for_germany(self):
+        formatter = CurrencyFormatter('EUR', 'de_DE')
+        self.assertEqual("1.234.567,89\u00a0€", formatter.format(Decimal('1234567.891')))
+
+    def test_caches_default_places_format(self):
+        formatter = CurrencyFormatter('EUR', 'de_DE')
+        self.assertIs(formatter.get_format(), formatter.get_format())
+        self.assertIs(formatter.get_format(2), formatter.get_format())
+
+    def test_formats_euros_for_ireland(self):
+        formatter = CurrencyFormatter('EUR', 'en_IE')
+        self.assertEqual("€1,234.50", formatter.format(1234.5))
+
+    def test_formats_pounds(self):
+        formatter = CurrencyFormatter('GBP', 'en_GB')
+        self.assertEqual("£-12.00", formatter.format(-12))
+
+    def test_formats_yen_without_decimal_places(self):
+        formatter = CurrencyFormatter('JPY', 'ja_JP')
+        self.assertEqual("¥1,235", formatter.format(1234.6))
+
+    def test_formats_euros_for_france(self):
+        formatter = CurrencyFormatter('EUR', 'fr_FR')
+        self.assertEqual("1\u202f234,50\u00a0€", formatter.format(1234.5))
+
+    def test_allows_places_to_be_overridden(self):
+        formatter = CurrencyFormatter('JPY', 'ja_JP')
+        self.assertEqual("¥1,234.50", formatter.format(1234.5, places=2))
+
+    def test_accepts_language_codes(self):
+        self.assertEqual('de_DE', CurrencyFormatter('eur', 'de-de').locale)
+
+    def test_raises_value_error_for_unknown_currency(self):
+        with self.assertRaises(ValueError):
+            CurrencyFormatter('XXX', 'en_US')
+
+    def test_raises_value_error_for_unknown_locale(self):
+        with self.assertRaises(ValueError):
+            CurrencyFormatter('USD', 'xx_XX')
+
+    def test_formats_many_integer_cents_for_locale(self):
+        formatter = CurrencyFormatter('EUR', 'de_DE')
+        self.assertEqual(["1.234,56\u00a0€", "-0,05\u00a0€"], formatter.format_many([123456, -5], cents=True))
+
+    def test_formats_many_like_format(self):
+        formatter = CurrencyFormatter('EUR', 'de_DE')
+        values = [0, 1234567.891, -3]
+        self.assertEqual([formatter.format(v) for v in values], formatter.format_many(values))
+
+    def test_shares_formatters(self):
+        self.assertIs(get_currency_formatter('EUR', 'de_DE'), get_currency_formatter('EUR', 'de_DE'))
+
+    def test_format_currency_uses_currency_and_locale(self):
+        self.assertEqual("1.500,00\u00a0€", format_currency(1500, currency='EUR', locale='de_DE'))
+
+
 class FormatCurrencyTemplateTagTests(test.TestCase):
 
     def test_show_empty_string_when_amount_is_zero_if_show_zero_is_false(self):
@@ -74,6 +171,55 @@ class FormatCurrencyTemplateTagTests(test.TestCase):
         amount = formatting_tags.format_currency(None, show_zero="True")
         self.assertEqual("$0.00", amount)
 
+    def test_formats_currency_for_locale(self):
+        t = template.Template('{% load formatting_tags %}{% format_currency amount currency="GBP" locale="en_GB" %}')
+        self.assertEqual("£1,500.00", t.render(template.Context({'amount': 1500})))
+
+    def test_renders_literal_arguments(self):
+        t = template.Template('{% load formatting_tags %}{% format_currency amount 0 "False" %}')
+        self.assertEqual("$1,500", t.render(template.Context({'amount': 1500})))
+        self.assertEqual("", t.render(template.Context({'amount': 0})))
+
+    def test_renders_variable_arguments(self):
+        t = template.Template('{% load formatting_tags %}{% format_currency amount places show_zero currency=code %}')
+        context = {'amount': 0, 'places': 1, 'show_zero': "True", 'code': "EUR"}
+        self.assertEqual("€0.0", t.render(template.Context(context)))
+
+    def test_stores_amount_as_variable(self):
+        t = template.Template('{% load formatting_tags %}{% format_currency amount as price %}[{{ price }}]')
+        self.assertEqual("[$12.50]", t.render(template.Context({'amount': 12.5})))
+
+
+class CurrencyColumnTemplateTagTests(test.TestCase):
+
+    def test_renders_contents_for_each_formatted_amount(self):
+        t = template.Template(
+            '{% load formatting_tags %}'
+            '{% currency_column amounts 2 "False" as amount %}<td>{{ amount }}</td>{% endcurrency_column %}'
+        )
+        self.assertEqual(
+            "<td>$1,500.00</td><td></td><td>$0.25</td>",
+            t.render(template.Context({'amounts': [1500, 0, Decimal("0.25")]})),
+        )
+
+    def test_renders_variable_arguments(self):
+        t = template.Template(
+            '{% load formatting_tags %}'
+            '{% currency_column amounts currency=code locale="de_DE" as amount %}{{ amount }};{% endcurrency_column %}'
+        )
+        context = template.Context({'amounts': [1234.5], 'code': "EUR"})
+        self.assertEqual("1.234,50\u00a0€;", t.render(context))
+
+    def test_renders_nothing_for_missing_list(self):
+        t = template.Template(
+            '{% load formatting_tags %}{% currency_column amounts as a %}{{ a }}{% endcurrency_column %}'
+        )
+        self.assertEqual("", t.render(template.Context()))
+
+    def test_requires_variable_name(self):
+        with self.assertRaises(template.TemplateSyntaxError):
+            template.Template('{% load formatting_tags %}{% currency_column amounts %}{% endcurrency_column %}')
+
 
 class TrackEventTemplateTagTests(test.TestCase):
 
@@ -138,6 +284,23 @@ class GA4TrackEventTemplateTagTests(test.TestCase):
         expected = "onClick=\"gtag('event', 'action', {'the_thing': 'company\\u0027s bad\\u003B-stuff.'});\""
         self.assertEqual(expected, output)
 
+    def test_renders_like_function_in_template(self):
+        t = template.Template(
+            '{% load analytics_tags %}{% ga4_track_event "add-item" "item_id" sku "list" "grid" name value %}'
+        )
+        context = {'sku': "company's-1", 'name': "price", 'value': 5}
+        expected = analytics_tags.ga4_track_event("add-item", "item_id", "company's-1", "list", "grid", "price", 5)
+        self.assertEqual(expected, t.render(template.Context(context)))
+
+    def test_renders_variable_action_in_template(self):
+        t = template.Template('{% load analytics_tags %}{% ga4_track_event action "k" "v" as event %}<a {{ event }}>')
+        expected = "<a onClick=\"gtag('event', 'it\\u0027s', {'k': 'v'});\">"
+        self.assertEqual(expected, t.render(template.Context({'action': "it's"})))
+
+    def test_raises_template_syntax_error_when_parameters_arent_divisible_by_2(self):
+        with self.assertRaises(template.TemplateSyntaxError):
+            template.Template('{% load analytics_tags %}{% ga4_track_event "action" "company-id" "9999" "other" %}')
+
 
 class AnalyticsSnippetTemplateTagTests(test.TestCase):
 
@@ -246,6 +409,81 @@ class ActivateTemplateTagTests(test.TestCase):
         result = html_tags.activate(context, "/")
         self.assertEqual("", result)
 
+    def test_returns_active_for_variable_path(self):
+        t = template.Template("{% load html_tags %}{% activate '/one-path' nav_path %}")
+        request = test.RequestFactory().get('/my/path/')
+        context = template.RequestContext(request, {'nav_path': '/my/path/'})
+        self.assertEqual("active", t.render(context))
+
+    def test_returns_empty_string_in_template_without_request(self):
+        t = template.Template("{% load html_tags %}{% activate '/' %}")
+        self.assertEqual("", t.render(template.Context({})))
+
+    def test_looks_up_request_path_once_per_render(self):
+        t = template.Template("{% load html_tags %}{% activate '/a/' %}{% activate '/b/' %}{% activate '/c/' %}")
+        request = mock.Mock(path='/b/')
+        context = template.Context({'request': request})
+        with mock.patch.object(template.Context, 'get', wraps=context.get) as get:
+            self.assertEqual("active", t.render(context))
+        self.assertEqual(1, get.call_count)
+
+
+class ActivateSectionTemplateTagTests(test.TestCase):
+
+    def _render(self, source, path, view_name=None, **extra):
+        request = test.RequestFactory().get(path)
+        request.resolver_match = view_name and mock.Mock(view_name=view_name)
+        t = template.Template("{% load html_tags %}" + source)
+        return t.render(template.RequestContext(request, extra))
+
+    def test_returns_active_for_pages_under_prefix(self):
+        self.assertEqual("active", self._render("{% activate_section '/blog/' %}", '/blog/2020/entry/'))
+
+    def test_returns_active_for_prefix_itself(self):
+        self.assertEqual("active", self._render("{% activate_section '/about/' '/blog/' %}", '/blog/'))
+
+    def test_returns_empty_string_outside_of_prefixes(self):
+        source = "{% activate_section '/about/' '/blog/' '/blog/archive/' %}"
+        self.assertEqual("", self._render(source, '/contact/'))
+        self.assertEqual("", self._render(source, '/bloggers/'))
+        self.assertEqual("", self._render(source, '/'))
+
+    def test_matches_nested_prefixes(self):
+        source = "{% activate_section '/blog/archive/' '/blog/' %}"
+        self.assertEqual("active", self._render(source, '/blog/archive/2020/'))
+        self.assertEqual("active", self._render(source, '/blog/feed/'))
+
+    def test_returns_active_for_url_name(self):
+        self.assertEqual("active", self._render("{% activate_section 'blog:detail' %}", '/x/', 'blog:detail'))
+
+    def test_returns_empty_string_for_other_url_name(self):
+        self.assertEqual("", self._render("{% activate_section 'blog:detail' %}", '/x/', 'blog:list'))
+
+    def test_returns_empty_string_for_url_name_without_resolver_match(self):
+        self.assertEqual("", self._render("{% activate_section 'blog:detail' %}", '/x/'))
+
+    def test_returns_active_for_variable_sections(self):
+        source = "{% activate_section section name %}"
+        self.assertEqual("active", self._render(source, '/shop/cart/', section='/shop/', name='x'))
+        self.assertEqual("active", self._render(source, '/x/', 'contact', section='/shop/', name='contact'))
+        self.assertEqual("", self._render(source, '/x/', 'about', section=None, name='contact'))
+
+    def test_stores_result_as_variable(self):
+        source = "{% activate_section '/blog/' as blog_class %}[{{ blog_class }}]"
+        self.assertEqual("[active]", self._render(source, '/blog/1/'))
+
+    def test_returns_empty_string_without_request(self):
+        result = html_tags.activate_section(template.Context({}), "/")
+        self.assertEqual("", result)
+
+    def test_function_matches_prefixes_and_url_names(self):
+        request = test.RequestFactory().get('/blog/1/')
+        request.resolver_match = mock.Mock(view_name='blog:detail')
+        context = template.Context({'request': request})
+        self.assertEqual("active", html_tags.activate_section(context, '/blog/'))
+        self.assertEqual("active", html_tags.activate_section(context, 'blog:detail'))
+        self.assertEqual("", html_tags.activate_section(context, '/about/', 'about'))
+
 
 class PaginatorTests(test.TestCase):
 
@@ -273,6 +511,15 @@ class PaginatorTests(test.TestCase):
         places = paginator_tags.get_pages_to_show(3, 3)
         self.assertEqual([1, 2, 3], list(places))
 
+    def test_returns_pages_up_to_current_when_total_is_unknown(self):
+        places = paginator_tags.get_pages_to_show(7, None)
+        self.assertEqual([5, 6, 7], list(places))
+
+    def test_leaves_out_given_key_from_query(self):
+        request = test.RequestFactory().get("/", data={"this": "thing", "cursor": "abc", "page": 2})
+        query_string = paginator_tags.get_query_without_page(request.GET, 'cursor')
+        self.assertEqual({"this": ["thing"], "page": ["2"]}, parse_qs(query_string))
+
 
 class ShowPaginatorTests(test.TestCase):
 
@@ -310,13 +557,60 @@ class ShowPaginatorTests(test.TestCase):
         result = paginator_tags.show_paginator(page_obj, paginator, request.GET)
         self.assertEqual(data_copy.urlencode(), result["query_string"])
 
+    def test_sends_escaped_page_link_prefix_to_context(self):
+        request = test.RequestFactory().get("/", data={"q": "a<b", "page": 4})
+        paginator = mock.Mock(Paginator, num_pages=5)
+        page_obj = mock.Mock(Page, number=2)
+
+        result = paginator_tags.show_paginator(page_obj, paginator, request.GET)
+        self.assertEqual("?q=a%3Cb&amp;page=", result["page_link_prefix"])
+
+    def test_sends_page_link_prefix_without_query_string_to_context(self):
+        paginator = mock.Mock(Paginator, num_pages=5)
+        page_obj = mock.Mock(Page, number=2)
+
+        result = paginator_tags.show_paginator(page_obj, paginator)
+        self.assertEqual("?page=", result["page_link_prefix"])
+
+
+class ShowCachedPaginatorTests(test.TestCase):
+
+    def setUp(self):
+        paginator_tags._paginator_cache.clear()
+        self.paginator = Paginator(range(100), 10)
+
+    def _render(self, tag, page_number, query=None):
+        t = template.Template("{% load paginator_tags %}{% " + tag + " page paginator params %}")
+        params = test.RequestFactory().get("/", data=query or {}).GET
+        context = {'page': self.paginator.page(page_number), 'paginator': self.paginator, 'params': params}
+        return t.render(template.Context(context))
+
+    def test_renders_like_show_paginator(self):
+        for page_number, query in ((1, None), (5, {"q": "a&b", "page": 5}), (10, {"x": ["1", "2"]})):
+            self.assertEqual(
+                self._render("show_paginator", page_number, query),
+                self._render("show_cached_paginator", page_number, query),
+            )
+
+    def test_reuses_rendered_paginator(self):
+        self._render("show_cached_paginator", 3, {"q": "term", "page": 3})
+        with mock.patch.object(paginator_tags, 'show_paginator') as show_paginator:
+            html = self._render("show_cached_paginator", 3, {"page": 3, "q": "term"})
+        self.assertFalse(show_paginator.called)
+        self.assertIn('href="?q=term&amp;page=4"', html)
+
+    def test_renders_again_for_other_pages(self):
+        self._render("show_cached_paginator", 3)
+        html = self._render("show_cached_paginator", 4)
+        self.assertIn('<li class="active"><a href="?page=4">4</a></li>', html)
+
 
 class GetSettingTagTests(test.TestCase):
 
     def test_puts_setting_value_in_template(self):
         expected = "Some Value"
 
-        with self.settings(TEST_VARIABLE=expected):
+        with self.settings(TEST_VARIABLE=expected, GET_SETTING_ALLOWLIST=['TEST_VARIABLE']):
             t = template.Template(
                 """
                 {% load settings_tags %}
@@ -334,3 +628,24 @@ class GetSettingTagTests(test.TestCase):
         """
         )
         self.assertEqual("", t.render(template.Context({})).strip())
+
+    @test.override_settings(TEST_VARIABLE="Some Value", SECRET_KEY="secret", GET_SETTING_ALLOWLIST=['TEST_VARIABLE'])
+    def test_only_puts_allowed_settings_in_template(self):
+        t = template.Template(
+            "{% load settings_tags %}[{% get_setting 'TEST_VARIABLE' %}][{% get_setting 'SECRET_KEY' %}]"
+        )
+        self.assertEqual("[Some Value][]", t.render(template.Context({})))
+
+    @test.override_settings(TEST_VARIABLE="Some Value", SECRET_KEY="secret", SITE_DOMAIN="https://www.example.com")
+    def test_only_puts_default_allowed_settings_in_template_without_allowlist(self):
+        t = template.Template(
+            "{% load settings_tags %}[{% get_setting 'SITE_DOMAIN' %}][{% get_setting 'TEST_VARIABLE' %}]"
+            "[{% get_setting 'SECRET_KEY' %}][{% get_setting 'DATABASES' %}]"
+        )
+        self.assertEqual("[https://www.example.com][][][]", t.render(template.Context({})))
+
+    @test.override_settings(TEST_VARIABLE="Some Value", GET_SETTING_ALLOWLIST=['TEST_VARIABLE'])
+    def test_uses_changed_allowed_settings(self):
+        with self.settings(TEST_VARIABLE="Other Value"):
+            self.assertEqual("Other Value", settings_tags.get_setting('TEST_VARIABLE'))
+        self.assertEqual("Some Value", settings_tags.get_setting('TEST_VARIABLE'))
@@ -1,10 +1,12 @@
 import django
+import mock
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 
 from django.test import TestCase, Client, override_settings
-from django.urls import reverse
+from django.urls import Resolver404, URLResolver, include, path, resolve, reverse
+from django.urls.resolvers import RegexPattern, RoutePattern
 from django.views.decorators.csrf import csrf_exempt
 
 if django.get_version() < '4.0':
@@ -12,8 +14,9 @@ if django.get_version() < '4.0':
 else:
     from django.middleware.csrf import _get_new_csrf_string
 
-from web_utils.urls import decorated_patterns
+from web_utils.urls import IndexedURLResolver, decorated_patterns, literal_prefix
 from web_utils.tests import url_conf
+from web_utils.tests.url_conf import TestView, url
 
 
 @override_settings(ROOT_URLCONF='web_utils.tests.url_conf')
@@ -99,3 +102,129 @@ class DecoratedPatternsTests(TestCase):
         self.assertEqual(403, response.status_code, response.content)
         response = self.client.post(destination, data={'csrfmiddlewaretoken': self._get_csrf_token()})
         self.assertEqual(200, response.status_code)
+
+    def test_resolves_to_same_decorated_view_every_time(self):
+        first = resolve(reverse("testing:test_two")).func
+        second = resolve(reverse("testing:test_two")).func
+        self.assertIs(first, second)
+
+    def test_decorates_each_view_separately(self):
+        one = resolve(reverse("test_one")).func
+        two = resolve(reverse("testing:test_two")).func
+        self.assertIsNot(one, two)
+
+
+@override_settings(ROOT_URLCONF='web_utils.tests.url_conf')
+class IndexedDecoratedPatternsTests(DecoratedPatternsTests):
+
+    def setUp(self):
+        self.addCleanup(setattr, url_conf, 'urlpatterns', url_conf.urlpatterns)
+        # the other tests replace resolve on url_conf's include, so use a fresh one
+        patterns = [
+            url_conf.urlpatterns[0],
+            url(r'^', include((url_conf.nested_patterns, 'testing'), namespace="testing")),
+        ]
+        test_patterns = decorated_patterns(login_required, patterns, indexed=True)
+        test_patterns += decorated_patterns((login_required, csrf_exempt), url_conf.more_patterns, indexed=True)
+        url_conf.urlpatterns = test_patterns
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_includes_are_indexed(self):
+        self.assertIsInstance(url_conf.urlpatterns[1], IndexedURLResolver)
+
+
+class WrappedViewsTests(TestCase):
+
+    def test_forgets_decorated_views_past_max_wrapped_views(self):
+        resolver = URLResolver(RegexPattern(r'^/'), decorated_patterns(login_required, [
+            url(r'^', include([url(r'^one/$', TestView.as_view()), url(r'^two/$', TestView.as_view())])),
+        ]))
+        with mock.patch('web_utils.urls.MAX_WRAPPED_VIEWS', 1):
+            one = resolver.resolve('/one/').func
+            self.assertIs(one, resolver.resolve('/one/').func)
+            resolver.resolve('/two/')
+            self.assertIsNot(one, resolver.resolve('/one/').func)
+
+
+class LiteralPrefixTests(TestCase):
+
+    def assertPrefix(self, expected, pattern):
+        self.assertEqual(expected, literal_prefix(pattern))
+
+    def test_uses_text_before_first_special_character(self):
+        self.assertPrefix('blog/', RegexPattern(r'^blog/(?P<slug>[-\w]+)/$'))
+
+    def test_unescapes_escaped_characters(self):
+        self.assertPrefix('sitemap.xml', RegexPattern(r'^sitemap\.xml$'))
+
+    def test_stops_at_character_classes(self):
+        self.assertPrefix('page-', RegexPattern(r'^page-\d+/$'))
+
+    def test_drops_character_made_optional(self):
+        self.assertPrefix('test', RegexPattern(r'^tests?/$'))
+        self.assertPrefix('test', RegexPattern(r'^tests*/$'))
+        self.assertPrefix('test', RegexPattern(r'^tests{0,1}/$'))
+
+    def test_keeps_character_repeated_at_least_once(self):
+        self.assertPrefix('tests', RegexPattern(r'^tests+/$'))
+
+    def test_is_empty_for_unanchored_patterns(self):
+        self.assertPrefix('', RegexPattern(r'blog/$'))
+
+    def test_is_empty_for_alternations(self):
+        self.assertPrefix('', RegexPattern(r'^blog/|^news/'))
+
+    def test_uses_text_before_first_converter_in_routes(self):
+        self.assertPrefix('blog/', RoutePattern('blog/<slug:slug>/'))
+        self.assertPrefix('about/', RoutePattern('about/'))
+
+
+class IndexedURLResolverTests(TestCase):
+
+    def _resolver(self, patterns):
+        return URLResolver(RegexPattern(r'^/'), [IndexedURLResolver(RegexPattern(r'^'), patterns)])
+
+    def test_resolves_like_url_resolver(self):
+        view = TestView.as_view()
+        patterns = [
+            url(r'^$', view, name='home'),
+            url(r'^blog/$', view, name='blog'),
+            url(r'^blog/(?P<slug>[-\w]+)/$', view, name='entry'),
+            path('news/<int:pk>/', view, name='news'),
+            url(r'^', include([url(r'^about/$', view, name='about')])),
+        ]
+        plain = URLResolver(RegexPattern(r'^/'), [URLResolver(RegexPattern(r'^'), patterns)])
+        indexed = self._resolver(patterns)
+
+        for test_path in ('/', '/blog/', '/blog/an-entry/', '/news/3/', '/about/'):
+            expected, result = plain.resolve(test_path), indexed.resolve(test_path)
+            self.assertEqual(expected.url_name, result.url_name)
+            self.assertEqual(expected.kwargs, result.kwargs)
+            self.assertEqual(expected.route, result.route)
+
+    def test_tries_patterns_in_order(self):
+        view = TestView.as_view()
+        indexed = self._resolver([
+            url(r'^(?P<page>\w+)/$', view, name='page'),
+            url(r'^about/$', view, name='about'),
+        ])
+        self.assertEqual('page', indexed.resolve('/about/').url_name)
+
+    def test_indexes_nested_includes(self):
+        view = TestView.as_view()
+        indexed = self._resolver([url(r'^blog/', include([
+            url(r'^archive/$', view, name='archive'),
+            url(r'^entries/$', view, name='entries'),
+        ]))])
+        self.assertEqual('archive', indexed.resolve('/blog/archive/').url_name)
+
+        # the nested include only tried the pattern that could match
+        with self.assertRaises(Resolver404) as raised:
+            indexed.resolve('/blog/entries/missing/')
+        tried = raised.exception.args[0]['tried']
+        self.assertEqual([['^', '^blog/', '^entries/$']], [[str(p.pattern) for p in patterns] for patterns in tried])
+
+    def test_raises_resolver_404_when_nothing_matches(self):
+        indexed = self._resolver([url(r'^blog/$', TestView.as_view())])
+        with self.assertRaises(Resolver404):
+            indexed.resolve('/news/')
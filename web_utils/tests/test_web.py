@@ -5,11 +5,14 @@ try:
 except ImportError:
     from urllib.parse import quote_plus
 
+import threading
+
 from django import test
 from django.conf import settings
 from django.urls import reverse
 
-from web_utils.web import ping_google_sitemap
+from web_utils import web
+from web_utils.web import ping_google_sitemap, SitemapPinger
 
 
 class GoogleSitemapPingTests(test.TestCase):
@@ -39,15 +42,106 @@ class GoogleSitemapPingTests(test.TestCase):
 
     @mock.patch('web_utils.web.urlopen')
     def test_pings_google_sitemap_with_sitemap_location(self, urlopen):
-        ping_google_sitemap(mock.Mock())
+        pinger = SitemapPinger(coalesce_window=0)
+        with mock.patch.object(web, '_sitemap_pinger', pinger):
+            ping_google_sitemap(mock.Mock())
+            pinger.join()
 
         expected_call = self.settings_dict[
             'GOOGLE_SITEMAP_URL'] + '?sitemap=' + quote_plus(self.settings_dict['SITE_DOMAIN'] + reverse("sitemap"))
-        urlopen.assert_called_once_with(expected_call)
+        urlopen.assert_called_once_with(expected_call, timeout=pinger.timeout)
 
     @mock.patch('web_utils.web.urlopen')
     def test_doesnt_pings_google_sitemap(self, urlopen):
         settings.PING_GOOGLE_SITEMAP = False
-        ping_google_sitemap(mock.Mock())
+        pinger = SitemapPinger()
+        with mock.patch.object(web, '_sitemap_pinger', pinger):
+            ping_google_sitemap(mock.Mock())
 
+        self.assertTrue(pinger.queue.empty())
         self.assertFalse(urlopen.called)
+
+
+class SitemapPingerTests(test.TestCase):
+
+    sitemap_url = 'http://www.mydomain.com/sitemap.xml'
+
+    @mock.patch('web_utils.web.urlopen')
+    def test_coalesces_pings_already_waiting_in_queue(self, urlopen):
+        started, release = threading.Event(), threading.Event()
+
+        def _urlopen(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return mock.Mock(code=200)
+        urlopen.side_effect = _urlopen
+
+        pinger = SitemapPinger(coalesce_window=0)
+        self.assertTrue(pinger.enqueue(self.sitemap_url))
+        started.wait(5)
+
+        self.assertTrue(pinger.enqueue(self.sitemap_url))
+        self.assertFalse(pinger.enqueue(self.sitemap_url))
+        self.assertFalse(pinger.enqueue(self.sitemap_url))
+        release.set()
+        pinger.join()
+
+        self.assertEqual(2, urlopen.call_count)
+
+    @mock.patch('web_utils.web.urlopen')
+    def test_doesnt_hold_other_urls_back_while_coalescing(self, urlopen):
+        other_url = 'http://www.mydomain.com/other.xml'
+        pinged_other = threading.Event()
+
+        def _urlopen(url, **kwargs):
+            if quote_plus(other_url) in url:
+                pinged_other.set()
+            return mock.Mock(code=200)
+        urlopen.side_effect = _urlopen
+
+        pinger = SitemapPinger(coalesce_window=60)
+        pinger.enqueue(self.sitemap_url)
+        pinger.join()
+        pinger.enqueue(self.sitemap_url)
+        pinger.enqueue(other_url)
+
+        self.assertTrue(pinged_other.wait(5))
+        self.assertEqual(2, urlopen.call_count)
+
+    @mock.patch('web_utils.web.time.sleep')
+    @mock.patch('web_utils.web.urlopen')
+    def test_retries_server_errors_with_backoff(self, urlopen, sleep):
+        error = web.HTTPError(web.GOOGLE_SITEMAP_URL, 503, "Unavailable", {}, None)
+        urlopen.side_effect = [error, error, mock.Mock(code=200)]
+
+        pinger = SitemapPinger(retries=3, backoff=1)
+        self.assertTrue(pinger.ping(self.sitemap_url))
+
+        self.assertEqual(3, urlopen.call_count)
+        self.assertEqual([mock.call(1), mock.call(2)], sleep.call_args_list)
+
+    @mock.patch('web_utils.web.time.sleep')
+    @mock.patch('web_utils.web.urlopen')
+    def test_gives_up_after_retries(self, urlopen, sleep):
+        urlopen.side_effect = web.URLError("timed out")
+
+        pinger = SitemapPinger(retries=2)
+        with self.assertLogs('web_utils.web', 'WARNING'):
+            self.assertFalse(pinger.ping(self.sitemap_url))
+        self.assertEqual(3, urlopen.call_count)
+
+    @mock.patch('web_utils.web.urlopen')
+    def test_doesnt_retry_client_errors(self, urlopen):
+        urlopen.side_effect = web.HTTPError(web.GOOGLE_SITEMAP_URL, 404, "Not Found", {}, None)
+
+        pinger = SitemapPinger()
+        with self.assertLogs('web_utils.web', 'WARNING'):
+            self.assertFalse(pinger.ping(self.sitemap_url))
+        self.assertEqual(1, urlopen.call_count)
+
+    def test_drops_ping_when_queue_is_full(self):
+        pinger = SitemapPinger(maxsize=1)
+        with mock.patch.object(pinger, '_start_worker'):
+            self.assertTrue(pinger.enqueue(self.sitemap_url))
+            with self.assertLogs('web_utils.web', 'WARNING'):
+                self.assertFalse(pinger.enqueue('http://www.mydomain.com/other.xml'))
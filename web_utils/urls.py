@@ -1,20 +1,55 @@
-def decorated_patterns(wrapping_functions, patterns):
+from django.urls import URLResolver
+from django.urls.resolvers import RegexPattern, RoutePattern
+from django.utils.functional import cached_property
+
+REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+# decorated views kept per decorated pattern, see _wrap_resolver
+MAX_WRAPPED_VIEWS = 1024
+
+
+def decorated_patterns(wrapping_functions, patterns, indexed=False):
     """
     Used to wrap entire URL patterns in a decorator
 
     adapted from: https://gist.github.com/1378003
+
+    :param indexed:
+        When true, include() entries are replaced with IndexedURLResolvers
+        (see index_patterns) before they are decorated.
     """
     if not isinstance(wrapping_functions, (list, tuple)):
         wrapping_functions = (wrapping_functions, )
+    if indexed:
+        patterns = index_patterns(patterns)
 
     return [_wrap_resolver(wrapping_functions, url_instance) for url_instance in patterns]
 
 
+def index_patterns(patterns):
+    """
+    Replaces the include() entries in patterns with IndexedURLResolvers.
+    """
+    return [_index_resolver(url_instance) for url_instance in patterns]
+
+
 def _wrap_resolver(wrapping_functions, url_instance):  # noqa
     resolve_func = getattr(url_instance, 'resolve', None)
     if resolve_func is None:
         return url_instance
 
+    # The decorated view is built once per resolved view and reused, so
+    # resolving doesn't rebuild the decorator chain and resolver_match.func
+    # is the same object on every request. Decorated views reference the
+    # view they wrap, so weak keys would never be collected; the dict is
+    # cleared instead when it has MAX_WRAPPED_VIEWS views.
+    wrapped_views = {}
+
+    def _wrap_view(view_func):
+        for _f in reversed(wrapping_functions):
+            view_func = _f(view_func)
+        return view_func
+
     def _wrap_resolved_func(*args, **kwargs):
         result = resolve_func(*args, **kwargs)
 
@@ -22,11 +57,145 @@ def _wrap_resolver(wrapping_functions, url_instance):  # noqa
         if view_func is None:
             return result
 
-        for _f in reversed(wrapping_functions):
-            view_func = _f(view_func)
+        try:
+            wrapped_view = wrapped_views.get(view_func)
+            if wrapped_view is None:
+                if len(wrapped_views) >= MAX_WRAPPED_VIEWS:
+                    wrapped_views.clear()
+                wrapped_view = wrapped_views[view_func] = _wrap_view(view_func)
+        except TypeError:
+            # not hashable
+            wrapped_view = _wrap_view(view_func)
 
-        setattr(result, 'func', view_func)
+        setattr(result, 'func', wrapped_view)
         return result
 
     setattr(url_instance, 'resolve', _wrap_resolved_func)
     return url_instance
+
+
+def _index_resolver(url_instance):
+    # Entries that are already indexed, aren't includes, or had their resolve
+    # replaced (by decorated_patterns) are left as they are.
+    if type(url_instance) is not URLResolver or 'resolve' in url_instance.__dict__:
+        return url_instance
+    return IndexedURLResolver(
+        url_instance.pattern,
+        url_instance.urlconf_name,
+        url_instance.default_kwargs,
+        url_instance.app_name,
+        url_instance.namespace,
+    )
+
+
+def literal_prefix(pattern):
+    """
+    Returns the literal text every path matched by pattern has to start
+    with, or '' when that can't be worked out.
+    """
+    if isinstance(pattern, RoutePattern):
+        route = pattern._route
+        return route.split('<', 1)[0] if isinstance(route, str) else ''
+
+    if not isinstance(pattern, RegexPattern):
+        return ''
+    regex = pattern._regex
+    # unanchored patterns are searched for anywhere in the path, and an
+    # alternation could apply to the start of the pattern
+    if not isinstance(regex, str) or not regex.startswith('^') or '|' in regex:
+        return ''
+
+    prefix = []
+    i = 1
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            escaped = regex[i + 1:i + 2]
+            if not escaped or escaped.isalnum():
+                break
+            char = escaped
+            i += 1
+        elif char in '*?{':
+            # makes the previous character optional
+            if prefix:
+                prefix.pop()
+            break
+        elif char in REGEX_SPECIAL_CHARS:
+            break
+        prefix.append(char)
+        i += 1
+    return ''.join(prefix)
+
+
+class _PrefixNode(object):
+    __slots__ = ('children', 'patterns', 'resolver')
+
+    def __init__(self, patterns=()):
+        self.children = {}
+        self.patterns = patterns
+        self.resolver = None
+
+
+class IndexedURLResolver(URLResolver):
+    """
+    A URLResolver that only tries the child patterns that can match the path.
+
+    The literal prefixes of the child patterns (everything before the first
+    regex special character or path converter) are kept in a trie. Resolving
+    walks the trie along the path and only tries the patterns whose prefix
+    matched, in their original order, so large includes aren't scanned
+    linearly. Child includes are indexed too.
+
+    The `tried` list of a Resolver404 only includes the patterns that could
+    have matched.
+    """
+
+    def resolve(self, path):
+        path = str(path)
+        match = self.pattern.match(path)
+        if not match:
+            return super(IndexedURLResolver, self).resolve(path)
+
+        node = self._prefix_index
+        for char in match[0]:
+            child = node.children.get(char)
+            if child is None:
+                break
+            node = child
+
+        resolver = node.resolver
+        if resolver is None:
+            resolver = node.resolver = self._candidate_resolver(node.patterns)
+        return URLResolver.resolve(resolver, path)
+
+    @cached_property
+    def _prefix_index(self):
+        patterns = index_patterns(self.url_patterns)
+        root = _PrefixNode()
+        for position, url_instance in enumerate(patterns):
+            node = root
+            for char in literal_prefix(url_instance.pattern):
+                node = node.children.setdefault(char, _PrefixNode())
+            node.patterns += ((position, url_instance), )
+
+        # every node tries the patterns ending on it or on any of its parents
+        nodes = [(root, ())]
+        while nodes:
+            node, inherited = nodes.pop()
+            if node.patterns:
+                node.patterns = tuple(sorted(inherited + node.patterns, key=lambda item: item[0]))
+            else:
+                node.patterns = inherited
+            nodes.extend((child, node.patterns) for child in node.children.values())
+        return root
+
+    def _candidate_resolver(self, patterns):
+        """
+        A plain URLResolver like this one that only has the given patterns.
+        """
+        resolver = URLResolver.__new__(URLResolver)
+        resolver.__dict__.update(
+            (key, value) for key, value in self.__dict__.items() if key not in ('resolve', '_prefix_index')
+        )
+        resolver.url_patterns = [url_instance for _, url_instance in patterns]
+        return resolver
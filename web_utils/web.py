@@ -1,33 +1,172 @@
+import logging
+import threading
+import time
+
 try:
-    from urllib2 import urlopen, HTTPError
+    from urllib2 import urlopen, HTTPError, URLError
     from urllib import urlencode
 except ImportError:
-    from urllib.request import urlopen, HTTPError
+    from urllib.request import urlopen
+    from urllib.error import HTTPError, URLError
     from urllib.parse import urlencode
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 from django.conf import settings
 from django.urls import reverse
 
 GOOGLE_SITEMAP_URL = 'http://www.google.com/webmasters/tools/ping'
 
+logger = logging.getLogger(__name__)
 
-def ping_google_sitemap(sender, **kwargs):
+
+class SitemapPinger(object):
     """
-    Ping Google to let them know of updated content.
+    Pings Google from a background thread so the signal that triggered the
+    ping doesn't wait on the network.
+
+    Pings are put on a bounded queue and sent by a single daemon worker.
+    Repeated pings for a sitemap url that is already waiting in the queue
+    are dropped, and a sitemap url is pinged at most once per
+    ``coalesce_window`` seconds, so saving many objects in a row results in
+    a ping for the first save and one more for everything after it. A url
+    waiting out its window doesn't hold back pings for other urls.
     """
-    # SITEMAP_FAIL = "Couldn't automatically update Google Sitemap. Please do it manually in webmaster tools."
 
-    if getattr(settings, 'PING_GOOGLE_SITEMAP', False):
-        data = urlencode({
-            'sitemap': settings.SITE_DOMAIN + reverse("sitemap"),
-        })
-        url = GOOGLE_SITEMAP_URL + '?' + data
+    def __init__(self, timeout=5, coalesce_window=60, retries=3, backoff=1, maxsize=100):
+        self.timeout = timeout
+        self.coalesce_window = coalesce_window
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = queue.Queue(maxsize)
+        self._pending = set()
+        self._last_pinged = {}
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def enqueue(self, sitemap_url):
+        """
+        Schedules a ping for sitemap_url. Returns False when the ping was
+        coalesced with one already waiting or the queue is full.
+        """
+        with self._lock:
+            if sitemap_url in self._pending:
+                return False
+            self._pending.add(sitemap_url)
+            self._start_worker()
+
         try:
-            response = urlopen(url)
-            if response.code / 100 == 2:
-                # todo: should we log it or message the user somehow?
+            self.queue.put_nowait(sitemap_url)
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(sitemap_url)
+            logger.warning("Sitemap ping queue is full, dropping ping for %s", sitemap_url)
+            return False
+        return True
+
+    def join(self):
+        """
+        Blocks until every queued ping has been sent (or given up on).
+        """
+        self.queue.join()
+
+    def ping(self, sitemap_url):
+        """
+        Sends a single ping, retrying with exponential backoff on failure.
+        Returns True when Google accepted the ping.
+        """
+        url = GOOGLE_SITEMAP_URL + '?' + urlencode({'sitemap': sitemap_url})
+        for attempt in range(self.retries + 1):
+            try:
+                response = urlopen(url, timeout=self.timeout)
+                return response.code // 100 == 2
+            except HTTPError as e:
+                if e.code < 500:
+                    logger.warning("Google rejected sitemap ping for %s: %s", sitemap_url, e)
+                    return False
+                error = e
+            except (URLError, OSError) as e:
+                error = e
+
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+
+        logger.warning("Couldn't ping Google sitemap for %s: %s", sitemap_url, error)
+        return False
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="sitemap-pinger")
+            self._worker.daemon = True
+            self._worker.start()
+
+    def _run(self):
+        # sitemap url: when it may be pinged, so a url held back by the
+        # coalesce window doesn't keep the other urls waiting
+        deadlines = {}
+        while True:
+            timeout = None
+            if deadlines:
+                timeout = max(min(deadlines.values()) - time.monotonic(), 0)
+            try:
+                sitemap_url = self.queue.get(timeout=timeout)
+            except queue.Empty:
                 pass
+            else:
+                last_pinged = self._last_pinged.get(sitemap_url)
+                deadlines[sitemap_url] = 0 if last_pinged is None else last_pinged + self.coalesce_window
 
-        except HTTPError:
-            # todo: should we log it or message the user somehow?
-            pass
+            now = time.monotonic()
+            for sitemap_url, deadline in list(deadlines.items()):
+                if deadline <= now:
+                    del deadlines[sitemap_url]
+                    self._send(sitemap_url)
+
+    def _send(self, sitemap_url):
+        try:
+            # anything saved from here on needs another ping
+            with self._lock:
+                self._pending.discard(sitemap_url)
+            self.ping(sitemap_url)
+            self._last_pinged[sitemap_url] = time.monotonic()
+        except Exception:
+            logger.exception("Unexpected error pinging Google sitemap for %s", sitemap_url)
+        finally:
+            self.queue.task_done()
+
+
+_sitemap_pinger = None
+_sitemap_pinger_lock = threading.Lock()
+
+
+def get_sitemap_pinger():
+    """
+    Returns the process wide SitemapPinger, configured from settings:
+
+    PING_GOOGLE_SITEMAP_TIMEOUT - seconds to wait on Google (Defaults to 5)
+    PING_GOOGLE_SITEMAP_COALESCE - seconds between pings of the same sitemap (Defaults to 60)
+    PING_GOOGLE_SITEMAP_RETRIES - retries for a failed ping (Defaults to 3)
+    """
+    global _sitemap_pinger
+    if _sitemap_pinger is None:
+        with _sitemap_pinger_lock:
+            if _sitemap_pinger is None:
+                _sitemap_pinger = SitemapPinger(
+                    timeout=getattr(settings, 'PING_GOOGLE_SITEMAP_TIMEOUT', 5),
+                    coalesce_window=getattr(settings, 'PING_GOOGLE_SITEMAP_COALESCE', 60),
+                    retries=getattr(settings, 'PING_GOOGLE_SITEMAP_RETRIES', 3),
+                )
+    return _sitemap_pinger
+
+
+def ping_google_sitemap(sender, **kwargs):
+    """
+    Ping Google to let them know of updated content.
+
+    The ping itself happens in the background; see SitemapPinger.
+    """
+    if getattr(settings, 'PING_GOOGLE_SITEMAP', False):
+        get_sitemap_pinger().enqueue(settings.SITE_DOMAIN + reverse("sitemap"))